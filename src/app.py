@@ -1,9 +1,13 @@
 """Main module for running the application"""
 
+import os
 from start_app import StartApp
 
 _START_COMANDS = ["start", "s", "info", "i"]
 
 if __name__ == '__main__':
-    app = StartApp(_START_COMANDS)
-    app.start_polling()
+    app = StartApp(_START_COMANDS, int(os.environ.get("SHARDS", "1")))
+    if os.environ.get("BOT_MODE") == "webhook":
+        app.start_webhook()
+    else:
+        app.start_polling()
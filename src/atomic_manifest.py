@@ -0,0 +1,21 @@
+"""Writes the manifest of the atomic functions for lazy loading (ATOMIC_MANIFEST)
+and prints the import and constructor time of every module:
+    python src/atomic_manifest.py [atomic_manifest.json]
+Run it from the repository root after changing the atomic functions"""
+
+import argparse
+from load_atomic import load_report, write_manifest
+
+def main():
+    """Write the manifest and print the load report"""
+    parser = argparse.ArgumentParser(description="Write the atomic functions manifest")
+    parser.add_argument("path", nargs="?", default="atomic_manifest.json")
+    args = parser.parse_args()
+
+    write_manifest(args.path)
+    print(f"{'module':<32}{'import, s':>12}{'init, s':>12}")
+    for row in load_report():
+        print(f"{row['module']:<32}{row['import']:>12.3f}{row['init']:>12.3f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+"""The module contains an abstract class for atomic functions with asyncio handlers."""
+
+import asyncio
+from abc import abstractmethod
+from typing import Any, Coroutine
+from telebot.async_telebot import AsyncTeleBot
+from bot_func_abc import AtomicBotFunctionABC
+from bot_async_http_client import AsyncHttpClient
+
+class AsyncAtomicBotFunctionABC(AtomicBotFunctionABC):
+    """Atomic function whose handlers are coroutines of an AsyncTeleBot.
+    The fields are the same as in AtomicBotFunctionABC. Callback data
+    must start with one of the commands, e.g. CallbackData(..., prefix=self.commands[0])"""
+
+    loop: asyncio.AbstractEventLoop | None = None
+
+    @abstractmethod
+    def set_handlers(self, bot: AsyncTeleBot):
+        """Message handlers need to be set! """
+
+    @property
+    def http(self) -> AsyncHttpClient:
+        """Shared aiohttp client, use it with await instead of requests.get"""
+        return AsyncHttpClient.default()
+
+    def run_in_loop(self, coroutine: Coroutine, timeout: float | None = 30) -> Any:
+        """Run the coroutine in the event loop of the handlers from another thread and wait
+        for the result, e.g. self.prefetcher.pool(name, lambda: self.run_in_loop(fetch()))"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
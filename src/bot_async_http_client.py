@@ -0,0 +1,230 @@
+"""The module contains the aiohttp client shared by the async atomic functions.
+A waiting request costs a coroutine instead of a thread. Like HttpClient it keeps
+connections alive, applies adaptive per-host timeouts, cuts off failing hosts with a circuit
+breaker, caches responses of registered URL prefixes in a ResponseCache and coalesces
+identical concurrent GET requests"""
+
+import asyncio
+import dataclasses
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Mapping, Set, Tuple
+from urllib.parse import urlsplit
+import aiohttp
+from yarl import URL
+from bot_circuit_breaker import CircuitBreaker
+from bot_http_client import HostStats, HttpClient
+from bot_response_cache import CacheLookup, ResponseCache
+
+class UpstreamUnavailable(aiohttp.ClientConnectionError):
+    """The circuit breaker of the host is open, the request was not sent"""
+
+class HttpStatusError(aiohttp.ClientError):
+    """The response has a 4xx or 5xx status"""
+
+@dataclasses.dataclass
+class AsyncResponse:
+    """Response with the body already read, so it can be cached and shared"""
+    url: str
+    status: int
+    headers: Mapping[str, str]
+    content: bytes
+
+    @property
+    def text(self) -> str:
+        """Body decoded as UTF-8"""
+        return self.content.decode("utf-8", errors="replace")
+
+    @property
+    def status_code(self) -> int:
+        """Same as status, like requests.Response"""
+        return self.status
+
+    def json(self) -> Any:
+        """Body parsed as JSON. Raises ValueError"""
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        """Raise HttpStatusError for 4xx and 5xx responses"""
+        if self.status >= 400:
+            raise HttpStatusError(f"{self.status} for {self.url}")
+
+class AsyncHttpClient: # pylint: disable=too-many-instance-attributes
+    """aiohttp.ClientSession wrapper for the async atomic functions.
+    The session is created on the first request and belongs to the event loop of that request.
+    Responses with status 5xx and raised exceptions are counted as errors.
+    Without an explicit timeout the read timeout adapts to the p99 latency like in HttpClient.
+    GET requests to URLs with a registered cache policy go through the response cache,
+    stale responses are refreshed in a background task.
+    Call the coroutines from one event loop, the client is not thread-safe"""
+
+    __default: "AsyncHttpClient | None" = None
+    __default_lock = threading.Lock()
+
+    def __init__(self, limit: int = 1000, limit_per_host: int = 64, # pylint: disable=too-many-arguments,too-many-positional-arguments
+    host_timeouts: Dict[str, Tuple[float, float]] | None = None,
+    breaker_failures: int = 5, breaker_reset: float = 30.0):
+        """limit - connections in total, limit_per_host - connections to one host"""
+        self.logger = logging.getLogger(__name__)
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.host_timeouts = {**HttpClient.HOST_TIMEOUTS, **(host_timeouts or {})}
+        self.breaker_failures = breaker_failures
+        self.breaker_reset = breaker_reset
+        self.cache = ResponseCache()
+        self.__session: aiohttp.ClientSession | None = None
+        self.__in_flight: Dict[Tuple[str, Tuple], asyncio.Task] = {}
+        self.__refreshes: Set[asyncio.Task] = set()
+        self.__stats: Dict[str, HostStats] = {}
+
+    @classmethod
+    def default(cls) -> "AsyncHttpClient":
+        """The client shared by all async atomic functions.
+        Breaker settings are taken from HTTP_BREAKER_FAILURES and HTTP_BREAKER_RESET_TIMEOUT,
+        the connection limit from ASYNC_HTTP_LIMIT"""
+        with cls.__default_lock:
+            if cls.__default is None:
+                cls.__default = cls(
+                    limit=int(os.environ.get("ASYNC_HTTP_LIMIT", "1000")),
+                    breaker_failures=int(os.environ.get("HTTP_BREAKER_FAILURES", "5")),
+                    breaker_reset=float(os.environ.get("HTTP_BREAKER_RESET_TIMEOUT", "30")),
+                )
+            return cls.__default
+
+    @property
+    def in_flight(self) -> int:
+        """Number of running coalesced GET requests"""
+        return len(self.__in_flight)
+
+    def timeout_for(self, host: str) -> Tuple[float, float]:
+        """Configured timeout of the host"""
+        return self.host_timeouts.get(host, HttpClient.DEFAULT_TIMEOUT)
+
+    def adaptive_timeout(self, host: str) -> aiohttp.ClientTimeout:
+        """Timeout of the next request to the host: the read timeout follows the p99 latency"""
+        connect, read = self.__host_stats(host).adaptive_timeout(self.timeout_for(host))
+        return aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+
+    async def request(self, method: str, url: str, **kwargs) -> AsyncResponse:
+        """Send the request and read the body. Accepts aiohttp request arguments,
+        timeout defaults to the adaptive host timeout"""
+        host = urlsplit(url).hostname or ""
+        kwargs.setdefault("timeout", self.adaptive_timeout(host))
+        stats = self.__host_stats(host)
+        if not stats.breaker.allow():
+            raise UpstreamUnavailable(f"{host} is unavailable, try again later")
+        session = await self.__get_session()
+        started_at = time.perf_counter()
+        try:
+            async with session.request(method, url, **kwargs) as response:
+                result = AsyncResponse(str(response.url), response.status,
+                    response.headers, await response.read())
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.__record(host, stats, started_at, error=True)
+            raise
+        self.__record(host, stats, started_at, error=result.status >= 500)
+        return result
+
+    async def get(self, url: str, coalesce: bool = True, **kwargs) -> AsyncResponse:
+        """Send a GET request or return a cached response.
+        Callers that send the same URL and headers while the request is running share it,
+        pass coalesce=False for endpoints that answer differently every time (random items)"""
+        full_url = str(URL(url).update_query(kwargs.get("params") or {}))
+
+        async def fetch() -> AsyncResponse:
+            if not coalesce:
+                return await self.request("GET", url, **kwargs)
+            return await self.__coalesced_get(full_url, url, kwargs)
+
+        lookup = self.cache.lookup(full_url)
+        if lookup is not None and lookup.refresh:
+            task = asyncio.ensure_future(self.__refresh(full_url, lookup, fetch))
+            self.__refreshes.add(task)
+            task.add_done_callback(self.__refreshes.discard)
+        if lookup is not None and lookup.response is not None:
+            return lookup.response
+        error = None
+        try:
+            response = await fetch()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+            response, error = None, ex
+        if response is not None and response.status < 500:
+            if lookup is not None:
+                self.cache.store(full_url, lookup.policy, response)
+            return response
+        fallback = self.cache.get_any(full_url)
+        if fallback is not None:
+            self.__host_stats(urlsplit(full_url).hostname or "").fallbacks += 1
+            return fallback
+        if error is not None:
+            raise error
+        return response
+
+    async def post(self, url: str, **kwargs) -> AsyncResponse:
+        """Send a POST request"""
+        return await self.request("POST", url, **kwargs)
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        """Get request statistics, breaker state and current timeout by host"""
+        return {host: {**stats.snapshot(),
+            "timeout": stats.adaptive_timeout(self.timeout_for(host))}
+            for host, stats in sorted(dict(self.__stats).items())}
+
+    async def close(self):
+        """Wait for background refreshes and close pooled connections"""
+        await asyncio.gather(*self.__refreshes, return_exceptions=True)
+        if self.__session is not None:
+            await self.__session.close()
+            self.__session = None
+
+    async def __get_session(self) -> aiohttp.ClientSession:
+        if self.__session is None or self.__session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host)
+            # The session is shared between users, nothing is remembered between requests
+            self.__session = aiohttp.ClientSession(connector=connector,
+                cookie_jar=aiohttp.DummyCookieJar())
+        return self.__session
+
+    async def __coalesced_get(self, full_url: str, url: str, kwargs: dict) -> AsyncResponse:
+        key = (full_url, tuple(sorted((kwargs.get("headers") or {}).items())))
+        task = self.__in_flight.get(key)
+        if task is not None:
+            self.__host_stats(urlsplit(full_url).hostname or "").coalesced += 1
+            return await asyncio.shield(task)
+        task = asyncio.ensure_future(self.request("GET", url, **kwargs))
+        self.__in_flight[key] = task
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if task.done():
+                self.__in_flight.pop(key, None)
+            else:
+                task.add_done_callback(lambda _: self.__in_flight.pop(key, None))
+
+    async def __refresh(self, url: str, lookup: CacheLookup,
+    fetch: Callable[[], Awaitable[AsyncResponse]]):
+        response = None
+        try:
+            response = await fetch()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+            self.logger.warning("Cache refresh of %s failed: %s", url, ex)
+        except Exception as ex: # pylint: disable=broad-exception-caught
+            self.logger.exception("Cache refresh of %s failed: %s", url, ex)
+        finally:
+            self.cache.refreshed(url, lookup, response)
+
+    def __host_stats(self, host: str) -> HostStats:
+        if host not in self.__stats:
+            self.__stats[host] = HostStats(CircuitBreaker(self.breaker_failures,
+                self.breaker_reset))
+        return self.__stats[host]
+
+    def __record(self, host: str, stats: HostStats, started_at: float, error: bool):
+        stats.latency.observe(time.perf_counter() - started_at)
+        stats.requests += 1
+        if error:
+            stats.errors += 1
+        stats.record_result(host, error, self.logger)
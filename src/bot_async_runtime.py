@@ -0,0 +1,166 @@
+"""The module runs the async atomic functions in one event loop next to the sync bot.
+The sync bot passes the updates of their commands and callback data to the loop
+and returns at once, so the dispatcher threads do not wait for their I/O"""
+
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Coroutine, Dict, List, Tuple
+import telebot
+from telebot import asyncio_helper, types
+from telebot.async_telebot import AsyncTeleBot
+from bot_async_func_abc import AsyncAtomicBotFunctionABC
+from bot_async_http_client import AsyncHttpClient
+from bot_callback_filter import AsyncBotCallbackCustomFilter
+from bot_dispatcher import UpdateDispatcher
+from bot_metrics import LatencyStats
+from bot_sender import TelegramSender
+
+def set_request_sender(request: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """Set the coroutine function that makes the Bot API calls of every AsyncTeleBot,
+    with the arguments of asyncio_helper._process_request. Returns the replaced one.
+    AsyncTeleBot has no hook like apihelper.CUSTOM_REQUEST_SENDER, so this is the only
+    place that replaces the private function"""
+    replaced = asyncio_helper._process_request # pylint: disable=protected-access
+    asyncio_helper._process_request = request # pylint: disable=protected-access
+    return replaced
+
+class AsyncRuntime: # pylint: disable=too-many-instance-attributes
+    """Event loop thread with an AsyncTeleBot for the async atomic functions.
+    Updates of one chat are handled one after another in the order they were passed.
+    With a sender, sending methods of the AsyncTeleBot wait for the same rate limits
+    as the sync bot"""
+
+    def __init__(self, token: str, logger: logging.Logger, sender: TelegramSender | None = None):
+        self.logger = logger
+        self.loop = asyncio.new_event_loop()
+        self.bot = AsyncTeleBot(token)
+        self.bot.add_custom_filter(AsyncBotCallbackCustomFilter())
+        self.functions: List[AsyncAtomicBotFunctionABC] = []
+        self.handler_time = LatencyStats()
+        self.handled = 0
+        self.errors = 0
+        self.__sender = sender
+        self.__request: Callable[..., Awaitable[Any]] | None = None
+        self.__lock = threading.Lock()
+        self.__in_flight = 0
+        # Chat key -> lock and the number of updates holding or waiting for it, loop only
+        self.__chats: Dict[object, Tuple[asyncio.Lock, int]] = {}
+        self.__thread = threading.Thread(target=self.loop.run_forever, name="async-bot",
+            daemon=True)
+
+    def start(self):
+        """Start the event loop thread"""
+        if self.__sender is not None:
+            self.__request = set_request_sender(self.__limited_request)
+        self.__thread.start()
+
+    def stop(self, timeout: float | None = None):
+        """Wait for the running handlers, close the HTTP sessions and stop the loop"""
+        if not self.__thread.is_alive():
+            return
+        try:
+            self.run(self.__shutdown(), timeout)
+        except concurrent.futures.TimeoutError:
+            self.logger.warning("Async handlers did not finish in %s s", timeout)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.__thread.join()
+        self.loop.close()
+        if self.__request is not None:
+            set_request_sender(self.__request)
+
+    def add_function(self, funct: AsyncAtomicBotFunctionABC, bot: telebot.TeleBot):
+        """Set the handlers of the function on the AsyncTeleBot and handlers on the sync bot
+        that pass its commands and callback queries prefixed by a command to the loop"""
+        funct.loop = self.loop
+        funct.set_handlers(self.bot)
+        AsyncHttpClient.default().cache.add_policies(funct.cache_policies)
+        prefixes = tuple(f"{command}:" for command in funct.commands)
+
+        @bot.message_handler(commands=funct.commands)
+        def pass_message(message: types.Message):
+            self.submit(self.bot.process_new_messages([message]),
+                UpdateDispatcher.chat_key(SimpleNamespace(message=message)))
+
+        @bot.callback_query_handler(func=lambda call: (call.data or "").startswith(prefixes))
+        def pass_callback(call: types.CallbackQuery):
+            self.submit(self.bot.process_new_callback_query([call]),
+                UpdateDispatcher.chat_key(SimpleNamespace(callback_query=call)))
+
+        self.functions.append(funct)
+
+    def submit(self, coroutine: Coroutine, chat_key: object = None) -> concurrent.futures.Future:
+        """Run the coroutine in the loop without waiting for it.
+        Coroutines with the same chat key run one after another in the order of the calls"""
+        with self.__lock:
+            self.__in_flight += 1
+        started_at = time.perf_counter()
+        if chat_key is not None:
+            coroutine = self.__in_order(chat_key, coroutine)
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        future.add_done_callback(
+            lambda done: self.__finished(done, time.perf_counter() - started_at))
+        return future
+
+    def run(self, coroutine: Coroutine, timeout: float | None = None) -> Any:
+        """Run the coroutine in the loop and wait for the result"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def stats(self) -> Dict[str, object]:
+        """Get the number of running and handled updates and the HTTP statistics"""
+        return {
+            "functions": [str(funct) for funct in self.functions],
+            "in_flight": self.__in_flight,
+            "chats": len(self.__chats),
+            "handled": self.handled,
+            "errors": self.errors,
+            "handler_time": self.handler_time.snapshot(),
+            "http": AsyncHttpClient.default().stats(),
+            "http_cache": {**AsyncHttpClient.default().cache.stats(),
+                "in_flight": AsyncHttpClient.default().in_flight},
+        }
+
+    def __finished(self, future: concurrent.futures.Future, seconds: float):
+        self.handler_time.observe(seconds)
+        error = None if future.cancelled() else future.exception()
+        with self.__lock:
+            self.__in_flight -= 1
+            self.handled += 1
+            if error is not None:
+                self.errors += 1
+        if error is not None:
+            self.logger.error("Async handler exception: %s", error)
+
+    async def __in_order(self, chat_key: object, coroutine: Coroutine) -> Any:
+        lock, users = self.__chats.get(chat_key) or (asyncio.Lock(), 0)
+        self.__chats[chat_key] = (lock, users + 1)
+        try:
+            # The tasks start in the order of the calls and the lock wakes waiters in FIFO order
+            async with lock:
+                return await coroutine
+        finally:
+            lock, users = self.__chats[chat_key]
+            if users == 1:
+                del self.__chats[chat_key]
+            else:
+                self.__chats[chat_key] = (lock, users - 1)
+
+    async def __shutdown(self):
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await AsyncHttpClient.default().close()
+        if asyncio_helper.session_manager.session is not None:
+            await self.bot.close_session()
+        await self.loop.shutdown_default_executor()
+
+    async def __limited_request(self, token, url, method="get", params=None, files=None,
+    **kwargs):
+        def request():
+            # _process_request takes the timeout out of the params
+            return self.__request(token, url, method, None if params is None else dict(params),
+                files, **kwargs)
+
+        return await self.__sender.send_request_async(url, params, files, request)
@@ -3,9 +3,16 @@
 from telebot import types
 from telebot.callback_data import CallbackDataFilter
 from telebot.custom_filters import AdvancedCustomFilter
+from telebot import asyncio_filters
 
 class BotCallbackCustomFilter(AdvancedCustomFilter): # pylint: disable=too-few-public-methods
     """Callback query custom filter"""
     key = 'config'
     def check(self, message: types.CallbackQuery, text: CallbackDataFilter):
         return text.check(query=message)
+
+class AsyncBotCallbackCustomFilter(asyncio_filters.AdvancedCustomFilter): # pylint: disable=too-few-public-methods
+    """Callback query custom filter of AsyncTeleBot"""
+    key = 'config'
+    async def check(self, message: types.CallbackQuery, text: CallbackDataFilter):
+        return text.check(query=message)
@@ -0,0 +1,68 @@
+"""The module contains a circuit breaker that stops calls to a failing dependency
+for a while and then lets a single trial call through"""
+
+import threading
+import time
+from typing import Dict
+
+class CircuitBreaker: # pylint: disable=too-many-instance-attributes
+    """Closed - calls pass; open - calls fail fast until reset_timeout expires;
+    half-open - one trial call decides whether to close or open again"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.__lock = threading.Lock()
+        self.__state = self.CLOSED
+        self.__failures = 0
+        self.__opened_at = 0.0
+        self.__trial_running = False
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        """Current state"""
+        with self.__lock:
+            if self.__state == self.OPEN and self.__reset_expired():
+                return self.HALF_OPEN
+            return self.__state
+
+    def allow(self) -> bool:
+        """Check whether the call may be made now"""
+        with self.__lock:
+            if self.__state == self.CLOSED:
+                return True
+            if self.__state == self.OPEN and self.__reset_expired():
+                self.__state = self.HALF_OPEN
+            if self.__state == self.HALF_OPEN and not self.__trial_running:
+                self.__trial_running = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        """Report a successful call"""
+        with self.__lock:
+            self.__state = self.CLOSED
+            self.__failures = 0
+            self.__trial_running = False
+
+    def record_failure(self):
+        """Report a failed call"""
+        with self.__lock:
+            self.__failures += 1
+            self.__trial_running = False
+            if self.__state == self.HALF_OPEN or self.__failures >= self.failure_threshold:
+                self.__state = self.OPEN
+                self.__opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, object]:
+        """Get breaker state and counters"""
+        return {"state": self.state, "failures": self.__failures, "rejected": self.rejected}
+
+    def __reset_expired(self) -> bool:
+        return time.monotonic() - self.__opened_at >= self.reset_timeout
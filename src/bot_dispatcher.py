@@ -0,0 +1,149 @@
+"""The module implements concurrent dispatching of incoming updates
+with a bounded worker pool and strict ordering of updates within one chat"""
+
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Tuple
+from telebot import types
+from bot_metrics import LatencyStats
+
+_STOP = object()
+
+class UpdateDispatcher: # pylint: disable=too-many-instance-attributes
+    """Runs update handlers on a pool of worker threads.
+    Updates of the same chat are processed one after another in arrival order,
+    updates of different chats are processed in parallel."""
+
+    _MESSAGE_FIELDS = (
+        "message", "edited_message", "channel_post", "edited_channel_post",
+        "business_message", "edited_business_message",
+    )
+    _USER_FIELDS = (
+        "inline_query", "chosen_inline_result", "shipping_query",
+        "pre_checkout_query", "poll_answer", "my_chat_member", "chat_member",
+        "chat_join_request",
+    )
+
+    def __init__(self, handler: Callable[[types.Update], None], logger: logging.Logger,
+    workers: int = 8, queue_size: int = 1000):
+        if workers < 1 or queue_size < 1:
+            raise ValueError("workers and queue_size must be positive")
+        self.logger = logger
+        self.workers = workers
+        self.queue_size = queue_size
+        self.queue_wait = LatencyStats()
+        self.handler_time = LatencyStats()
+        self.__handler = handler
+        self.__lock = threading.Lock()
+        self.__idle = threading.Condition(self.__lock)
+        self.__slots = threading.BoundedSemaphore(queue_size)
+        self.__chats: Dict[object, Deque[Tuple[types.Update, float]]] = {}
+        self.__ready: queue.SimpleQueue = queue.SimpleQueue()
+        self.__threads: List[threading.Thread] = []
+        self.__pending = 0
+
+    def start(self):
+        """Start worker threads"""
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.__work, name=f"dispatch-{i}", daemon=True)
+            thread.start()
+            self.__threads.append(thread)
+
+    def stop(self, timeout: float | None = None):
+        """Stop worker threads after the already queued updates are processed"""
+        with self.__idle:
+            self.__idle.wait_for(lambda: self.__pending == 0, timeout)
+        for _ in self.__threads:
+            self.__ready.put(_STOP)
+        for thread in self.__threads:
+            thread.join(timeout)
+        self.__threads.clear()
+
+    def submit(self, update: types.Update, block: bool = True,
+    timeout: float | None = None) -> bool:
+        """Queue the update. Returns False if the queue is full"""
+        if not self.__slots.acquire(blocking=block, timeout=timeout): # pylint: disable=consider-using-with
+            return False
+        key = self.chat_key(update)
+        with self.__lock:
+            self.__pending += 1
+            chat_queue = self.__chats.get(key)
+            if chat_queue is None:
+                self.__chats[key] = deque([(update, time.monotonic())])
+                self.__ready.put(key)
+            else:
+                chat_queue.append((update, time.monotonic()))
+        return True
+
+    @property
+    def pending(self) -> int:
+        """Number of queued and running updates"""
+        return self.__pending
+
+    def stats(self) -> Dict[str, object]:
+        """Get dispatcher metrics"""
+        with self.__lock:
+            chats = len(self.__chats)
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "pending": self.__pending,
+            "active_chats": chats,
+            "queue_wait": self.queue_wait.snapshot(),
+            "handler_time": self.handler_time.snapshot(),
+        }
+
+    @classmethod
+    def chat_key(cls, update: types.Update) -> object:
+        """Get the key that defines the processing order of the update"""
+        for field in cls._MESSAGE_FIELDS:
+            message = getattr(update, field, None)
+            if message is not None:
+                return message.chat.id
+        call = getattr(update, "callback_query", None)
+        if call is not None:
+            if call.message is not None:
+                return call.message.chat.id
+            return call.from_user.id
+        for field in cls._USER_FIELDS:
+            obj = getattr(update, field, None)
+            if obj is not None:
+                chat = getattr(obj, "chat", None)
+                if chat is not None:
+                    return chat.id
+                user = getattr(obj, "from_user", None) or getattr(obj, "user", None)
+                if user is not None:
+                    return user.id
+        return ("update", update.update_id)
+
+    def __work(self):
+        while True:
+            key = self.__ready.get()
+            if key is _STOP:
+                break
+            with self.__lock:
+                update, queued_at = self.__chats[key][0]
+            started_at = time.monotonic()
+            try:
+                self.__handler(update)
+            except Exception as ex: # pylint: disable=broad-except
+                self.logger.exception(ex)
+            finished_at = time.monotonic()
+            self.queue_wait.observe(started_at - queued_at)
+            self.handler_time.observe(finished_at - started_at)
+            self.logger.debug("update %s chat %s: queue wait %.3fs, handler %.3fs",
+                update.update_id, key, started_at - queued_at, finished_at - started_at)
+            with self.__lock:
+                chat_queue = self.__chats[key]
+                chat_queue.popleft()
+                if chat_queue:
+                    self.__ready.put(key)
+                else:
+                    del self.__chats[key]
+                self.__pending -= 1
+                if self.__pending == 0:
+                    self.__idle.notify_all()
+            self.__slots.release()
@@ -0,0 +1,94 @@
+"""The module contains bounded concurrent execution of independent calls,
+e.g. several requests to an external API made for one command"""
+
+import dataclasses
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+@dataclasses.dataclass
+class FanOutResult:
+    """Results of the calls that succeeded in the order of the items,
+    exceptions of the failed calls and the number of calls that timed out"""
+    values: List[Any] = dataclasses.field(default_factory=list)
+    errors: List[BaseException] = dataclasses.field(default_factory=list)
+    timed_out: int = 0
+
+class FanOut:
+    """Runs calls on a shared thread pool. One map runs at most limit calls at a time,
+    the pool bounds the number of calls of all maps"""
+
+    __default: "FanOut | None" = None
+    __default_lock = threading.Lock()
+
+    def __init__(self, max_workers: int = 32, logger: logging.Logger | None = None):
+        self.logger = logger or logging.getLogger(__name__)
+        self.calls = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.__lock = threading.Lock()
+        self.__pool = ThreadPoolExecutor(max_workers, "fan-out")
+
+    @classmethod
+    def default(cls) -> "FanOut":
+        """The pool shared by all atomic functions, its size is taken from FAN_OUT_WORKERS"""
+        with cls.__default_lock:
+            if cls.__default is None:
+                cls.__default = cls(int(os.environ.get("FAN_OUT_WORKERS", "32")))
+            return cls.__default
+
+    def map(self, function: Callable[[Any], Any], items: Iterable[Any], limit: int = 8,
+    timeout: float = 15.0) -> FanOutResult:
+        """Call function for every item, at most limit calls at a time.
+        A call that takes longer than timeout seconds is abandoned and its result is ignored,
+        so the whole map takes about as long as its slowest call"""
+        pending = list(enumerate(items))
+        pending.reverse()
+        running: Dict[Future, Tuple[int, float]] = {}
+        values: Dict[int, Any] = {}
+        result = FanOutResult()
+        while pending or running:
+            while pending and len(running) < limit:
+                index, item = pending.pop()
+                running[self.__pool.submit(function, item)] = (index, time.monotonic() + timeout)
+            wait_time = min(deadline for _, deadline in running.values()) - time.monotonic()
+            for future in wait(running, max(0.0, wait_time), FIRST_COMPLETED).done:
+                index = running.pop(future)[0]
+                try:
+                    values[index] = future.result()
+                except Exception as ex: # pylint: disable=broad-exception-caught
+                    result.errors.append(ex)
+            result.timed_out += self.__abandon_expired(running)
+        result.values = [values[index] for index in sorted(values)]
+        with self.__lock:
+            self.calls += len(values) + len(result.errors) + result.timed_out
+            self.failed += len(result.errors)
+            self.timed_out += result.timed_out
+        for error in result.errors:
+            self.logger.warning("Fan-out call failed: %s", error)
+        return result
+
+    @staticmethod
+    def __abandon_expired(running: Dict[Future, Tuple[int, float]]) -> int:
+        now = time.monotonic()
+        expired = [future for future, (_, deadline) in running.items() if deadline <= now]
+        for future in expired:
+            del running[future]
+            future.cancel()
+        return len(expired)
+
+    def stats(self) -> Dict[str, int]:
+        """Get call counters"""
+        return {"calls": self.calls, "failed": self.failed, "timed_out": self.timed_out}
+
+    def close(self):
+        """Stop the pool without waiting for abandoned calls"""
+        self.__pool.shutdown(wait=False, cancel_futures=True)
+
+def fan_out(function: Callable[[Any], Any], items: Iterable[Any], limit: int = 8,
+timeout: float = 15.0) -> FanOutResult:
+    """FanOut.map on the shared pool"""
+    return FanOut.default().map(function, items, limit, timeout)
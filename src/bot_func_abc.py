@@ -1,14 +1,20 @@
 """The module contains an abstract class from which
 the bot's atomic functions must be inherited."""
 
-from typing import List
+from typing import Dict, List
 from abc import ABC, abstractmethod
 import telebot
+from bot_http_client import HttpClient
+from bot_prefetch import Prefetcher
+from bot_response_cache import CachePolicy
 
 class AtomicBotFunctionABC(ABC):
     """A class for describing the required fields and methods 
     that students must implement in their atomic functions."""
 
+    # URL prefix -> cache policy of the responses of self.http.get
+    cache_policies: Dict[str, CachePolicy] = {}
+
     @property
     @abstractmethod
     def commands(self) -> List[str]:
@@ -38,6 +44,16 @@ class AtomicBotFunctionABC(ABC):
     def set_handlers(self, bot: telebot.TeleBot):
         """Message handlers need to be set! """
 
+    @property
+    def http(self) -> HttpClient:
+        """Shared HTTP client with keep-alive connections, use it instead of requests.get"""
+        return HttpClient.default()
+
+    @property
+    def prefetcher(self) -> Prefetcher:
+        """Shared prefetcher, self.prefetcher.pool(name, fetch) keeps ready random items"""
+        return Prefetcher.default()
+
     def detailed_function_description(self) -> str:
         """Detailed information description of the bot function"""
         txt = self.about + " - " +self.description
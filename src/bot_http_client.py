@@ -0,0 +1,222 @@
+"""The module contains the HTTP client shared by the atomic functions.
+Connections are kept alive in per-host pools, requests get per-host default timeouts
+adapted to the observed latency, failing hosts are cut off by a circuit breaker
+and latency and errors are counted per host"""
+
+import copy
+import dataclasses
+import logging
+import os
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+from typing import Dict, Tuple
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from bot_circuit_breaker import CircuitBreaker
+from bot_metrics import LatencyStats
+from bot_response_cache import ResponseCache
+from bot_single_flight import SingleFlight
+
+class UpstreamUnavailable(requests.ConnectionError):
+    """The circuit breaker of the host is open, the request was not sent"""
+
+@dataclasses.dataclass
+class HostStats:
+    """Request statistics and circuit breaker of one host"""
+    breaker: CircuitBreaker
+    latency: LatencyStats = dataclasses.field(default_factory=LatencyStats)
+    requests: int = 0
+    errors: int = 0
+    coalesced: int = 0
+    fallbacks: int = 0
+
+    def snapshot(self) -> Dict[str, object]:
+        """Get the counters, latency and breaker state"""
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "coalesced": self.coalesced,
+            "fallbacks": self.fallbacks,
+            "latency": self.latency.snapshot(),
+            "breaker": self.breaker.stats(),
+        }
+
+    def adaptive_timeout(self, timeout: Tuple[float, float]) -> Tuple[float, float]:
+        """The configured (connect, read) timeout of the host with the read timeout
+        following the observed p99 latency, see HttpClient.ADAPTIVE_FACTOR"""
+        connect, read = timeout
+        if self.latency.count < HttpClient.ADAPTIVE_MIN_SAMPLES:
+            return connect, read
+        p99 = self.latency.quantile(0.99)
+        return connect, min(read,
+            max(HttpClient.ADAPTIVE_MIN_TIMEOUT, p99 * HttpClient.ADAPTIVE_FACTOR))
+
+    def record_result(self, host: str, error: bool, logger: logging.Logger):
+        """Pass the result of a request to the breaker, log when the breaker opens"""
+        if not error:
+            self.breaker.record_success()
+            return
+        was_closed = self.breaker.state == CircuitBreaker.CLOSED
+        self.breaker.record_failure()
+        if was_closed and self.breaker.state != CircuitBreaker.CLOSED:
+            logger.warning("Circuit breaker of %s opened for %.0f s",
+                host, self.breaker.reset_timeout)
+
+class HttpClient: # pylint: disable=too-many-instance-attributes
+    """requests.Session wrapper: keep-alive pools, per-host timeouts and statistics.
+    Responses with status 5xx and raised exceptions are counted as errors.
+    After breaker_failures errors in a row requests to the host fail fast with
+    UpstreamUnavailable for breaker_reset seconds; cached GET responses are returned
+    instead when there are any. Without an explicit timeout the read timeout is
+    ADAPTIVE_FACTOR times the observed p99 latency, limited by the host timeout.
+    GET requests to URLs with a registered cache policy go through the response cache.
+    Identical concurrent GET requests are coalesced into one upstream call"""
+
+    # (connect, read) seconds
+    DEFAULT_TIMEOUT: Tuple[float, float] = (3.05, 10.0)
+    HOST_TIMEOUTS: Dict[str, Tuple[float, float]] = {
+        "api.github.com": (3.05, 30.0),
+        "anapioficeandfire.com": (3.05, 15.0),
+        "qrtag.net": (3.05, 20.0),
+    }
+
+    ADAPTIVE_FACTOR = 3.0
+    ADAPTIVE_MIN_SAMPLES = 20
+    ADAPTIVE_MIN_TIMEOUT = 1.0
+
+    __default: "HttpClient | None" = None
+    __default_lock = threading.Lock()
+
+    def __init__(self, pool_connections: int = 32, pool_maxsize: int = 16, # pylint: disable=too-many-arguments,too-many-positional-arguments
+    host_timeouts: Dict[str, Tuple[float, float]] | None = None,
+    breaker_failures: int = 5, breaker_reset: float = 30.0):
+        """pool_connections - number of hosts with kept pools,
+        pool_maxsize - connections kept alive per host"""
+        self.logger = logging.getLogger(__name__)
+        self.breaker_failures = breaker_failures
+        self.breaker_reset = breaker_reset
+        self.host_timeouts = {**self.HOST_TIMEOUTS, **(host_timeouts or {})}
+        self.session = requests.Session()
+        # The session is shared between users, nothing is remembered between requests
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.cache = ResponseCache()
+        self.single_flight = SingleFlight()
+        self.__stats: Dict[str, HostStats] = {}
+        self.__stats_lock = threading.Lock()
+
+    @classmethod
+    def default(cls) -> "HttpClient":
+        """The client shared by all atomic functions.
+        Breaker settings are taken from HTTP_BREAKER_FAILURES and HTTP_BREAKER_RESET_TIMEOUT"""
+        with cls.__default_lock:
+            if cls.__default is None:
+                cls.__default = cls(
+                    breaker_failures=int(os.environ.get("HTTP_BREAKER_FAILURES", "5")),
+                    breaker_reset=float(os.environ.get("HTTP_BREAKER_RESET_TIMEOUT", "30")),
+                )
+            return cls.__default
+
+    def timeout_for(self, host: str) -> Tuple[float, float]:
+        """Configured timeout of the host"""
+        return self.host_timeouts.get(host, self.DEFAULT_TIMEOUT)
+
+    def adaptive_timeout(self, host: str) -> Tuple[float, float]:
+        """Timeout of the next request to the host: the read timeout follows the p99 latency"""
+        return self.__host_stats(host).adaptive_timeout(self.timeout_for(host))
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send the request. Accepts requests.Session.request arguments,
+        timeout defaults to the adaptive host timeout"""
+        host = urlsplit(url).hostname or ""
+        stats = self.__host_stats(host)
+        if not stats.breaker.allow():
+            raise UpstreamUnavailable(f"{host} is unavailable, try again later")
+        kwargs.setdefault("timeout", self.adaptive_timeout(host))
+        started_at = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            self.__record(host, stats, started_at, error=True)
+            raise
+        self.__record(host, stats, started_at, error=response.status_code >= 500)
+        return response
+
+    def get(self, url: str, coalesce: bool = True, **kwargs) -> requests.Response:
+        """Send a GET request or return a cached response.
+        The cache key is the URL with the query parameters, headers are not part of it.
+        Callers that send the same URL and headers while the request is running share it,
+        pass coalesce=False for endpoints that answer differently every time (random items)"""
+        full_url = requests.Request("GET", url, params=kwargs.get("params")).prepare().url
+
+        def fetch() -> requests.Response:
+            if not coalesce:
+                return self.request("GET", url, **kwargs)
+            return self.__coalesced_get(full_url, url, kwargs)
+
+        error = None
+        try:
+            if self.cache.policy_for(full_url) is None:
+                response = fetch()
+            else:
+                response = self.cache.get(full_url, fetch)
+        except requests.RequestException as ex:
+            response, error = None, ex
+        if response is not None and response.status_code < 500:
+            return response
+        fallback = self.cache.get_any(full_url)
+        if fallback is None:
+            if error is not None:
+                raise error
+            return response
+        stats = self.__host_stats(urlsplit(full_url).hostname or "")
+        with self.__stats_lock:
+            stats.fallbacks += 1
+        return fallback
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """Send a POST request"""
+        return self.request("POST", url, **kwargs)
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        """Get request statistics, breaker state and current timeout by host"""
+        with self.__stats_lock:
+            hosts = dict(self.__stats)
+        return {host: {**stats.snapshot(), "timeout": self.adaptive_timeout(host)}
+            for host, stats in sorted(hosts.items())}
+
+    def close(self):
+        """Close pooled connections"""
+        self.cache.close()
+        self.session.close()
+
+    def __coalesced_get(self, full_url: str, url: str, kwargs: dict) -> requests.Response:
+        headers = tuple(sorted((kwargs.get("headers") or {}).items()))
+        response, shared = self.single_flight.do((full_url, headers),
+            lambda: self.request("GET", url, **kwargs))
+        if not shared:
+            return response
+        stats = self.__host_stats(urlsplit(full_url).hostname or "")
+        with self.__stats_lock:
+            stats.coalesced += 1
+        return copy.copy(response)
+
+    def __host_stats(self, host: str) -> HostStats:
+        with self.__stats_lock:
+            stats = self.__stats.get(host)
+            if stats is None:
+                breaker = CircuitBreaker(self.breaker_failures, self.breaker_reset)
+                stats = self.__stats[host] = HostStats(breaker)
+            return stats
+
+    def __record(self, host: str, stats: HostStats, started_at: float, error: bool):
+        stats.latency.observe(time.perf_counter() - started_at)
+        with self.__stats_lock:
+            stats.requests += 1
+            if error:
+                stats.errors += 1
+        stats.record_result(host, error, self.logger)
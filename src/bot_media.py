@@ -0,0 +1,243 @@
+"""The module contains helpers for sending media files: albums of several photos
+and a persistent cache of the file_id Telegram assigns to a sent photo"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List
+import telebot
+from telebot import types
+from telebot import asyncio_helper
+from telebot.apihelper import ApiTelegramException
+from telebot.async_telebot import AsyncTeleBot
+
+MEDIA_GROUP_SIZE = 10
+
+class FileIdCache: # pylint: disable=too-many-instance-attributes
+    """Thread-safe LRU map of a photo source (URL or content hash) to its Telegram file_id.
+    With a path the entries are kept in a JSON file and survive restarts. Changes are written
+    by a background thread every flush_interval seconds and on close, not on the send path"""
+
+    __default: "FileIdCache | None" = None
+    __default_lock = threading.Lock()
+
+    def __init__(self, path: str | None = None, max_size: int = 5000,
+    logger: logging.Logger | None = None, flush_interval: float = 5.0):
+        self.path = path
+        self.max_size = max_size
+        self.logger = logger or logging.getLogger(__name__)
+        self.flush_interval = flush_interval
+        self.hits = 0
+        self.misses = 0
+        self.__lock = threading.Lock()
+        self.__save_lock = threading.Lock()
+        self.__entries: OrderedDict[str, str] = OrderedDict()
+        self.__dirty = False
+        self.__stopped = threading.Event()
+        self.__flusher: threading.Thread | None = None
+        if path:
+            self.__load()
+            self.__flusher = threading.Thread(target=self.__flush_loop,
+                name="file-id-cache", daemon=True)
+            self.__flusher.start()
+
+    @classmethod
+    def default(cls) -> "FileIdCache":
+        """The cache shared by all atomic functions.
+        Settings are taken from FILE_ID_CACHE_PATH and FILE_ID_CACHE_SIZE"""
+        with cls.__default_lock:
+            if cls.__default is None:
+                cls.__default = cls(os.environ.get("FILE_ID_CACHE_PATH") or None,
+                    int(os.environ.get("FILE_ID_CACHE_SIZE", "5000")))
+            return cls.__default
+
+    @staticmethod
+    def key(photo: Any) -> str | None:
+        """Cache key of the photo: the URL or the hash of the content, None for other inputs"""
+        if isinstance(photo, str):
+            return photo if photo.startswith(("http://", "https://")) else None
+        if isinstance(photo, (bytes, bytearray)):
+            return "sha256:" + hashlib.sha256(photo).hexdigest()
+        return None
+
+    def get(self, key: str | None) -> str | None:
+        """Get the file_id of the source or None"""
+        if key is None:
+            return None
+        with self.__lock:
+            file_id = self.__entries.get(key)
+            if file_id is None:
+                self.misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return file_id
+
+    def put(self, key: str | None, file_id: str | None):
+        """Remember the file_id of the source, evicting the least recently used entries"""
+        if key is None or not file_id:
+            return
+        with self.__lock:
+            if self.__entries.get(key) == file_id:
+                self.__entries.move_to_end(key)
+                return
+            self.__entries[key] = file_id
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+            self.__dirty = True
+
+    def invalidate(self, key: str | None):
+        """Forget the source, e.g. when Telegram no longer accepts its file_id"""
+        with self.__lock:
+            if self.__entries.pop(key, None) is not None:
+                self.__dirty = True
+
+    def flush(self):
+        """Write the entries to the file if they changed"""
+        if not self.path:
+            return
+        with self.__save_lock:
+            with self.__lock:
+                if not self.__dirty:
+                    return
+                entries = dict(self.__entries)
+                self.__dirty = False
+            if not self.__save(entries):
+                with self.__lock:
+                    self.__dirty = True
+
+    def close(self):
+        """Stop the background flush and write the changed entries"""
+        self.__stopped.set()
+        if self.__flusher is not None:
+            self.__flusher.join()
+        self.flush()
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def stats(self) -> Dict[str, int]:
+        """Get cache counters"""
+        return {"size": len(self), "hits": self.hits, "misses": self.misses}
+
+    def __load(self):
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                entries = json.load(file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as ex:
+            self.logger.warning("File id cache %s is not loaded: %s", self.path, ex)
+            return
+        self.__entries.update(list(entries.items())[-self.max_size:])
+
+    def __flush_loop(self):
+        while not self.__stopped.wait(self.flush_interval): # pylint: disable=too-many-function-args
+            self.flush()
+
+    def __save(self, entries: Dict[str, str]) -> bool:
+        """Write the entries in LRU order. Call with the save lock held"""
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as file:
+                json.dump(entries, file)
+            os.replace(temp_path, self.path)
+            return True
+        except OSError as ex:
+            self.logger.warning("File id cache %s is not saved: %s", self.path, ex)
+            return False
+
+def _file_id(message: types.Message) -> str | None:
+    photos = getattr(message, "photo", None)
+    return photos[-1].file_id if photos else None
+
+def send_photo(bot: telebot.TeleBot, chat_id: int | str, photo: Any,
+cache: FileIdCache | None = None, **kwargs) -> types.Message:
+    """bot.send_photo that sends the cached file_id of a URL or content sent before.
+    If Telegram rejects the file_id the photo itself is sent"""
+    cache = FileIdCache.default() if cache is None else cache
+    key = cache.key(photo)
+    file_id = cache.get(key)
+    if file_id is not None:
+        try:
+            return bot.send_photo(chat_id, file_id, **kwargs)
+        except ApiTelegramException:
+            cache.invalidate(key)
+    message = bot.send_photo(chat_id, photo, **kwargs)
+    cache.put(key, _file_id(message))
+    return message
+
+def send_photos(bot: telebot.TeleBot, chat_id: int | str, photos: List[Any],
+logger: logging.Logger | None = None, cache: FileIdCache | None = None) -> List[types.Message]:
+    """Send photos (URLs or file_ids) as albums of up to MEDIA_GROUP_SIZE items.
+    If Telegram rejects an album, its photos are sent one by one and the rejected
+    ones are skipped. Returns the sent messages"""
+    logger = logger or logging.getLogger(__name__)
+    cache = FileIdCache.default() if cache is None else cache
+    messages: List[types.Message] = []
+    for start in range(0, len(photos), MEDIA_GROUP_SIZE):
+        chunk = photos[start:start + MEDIA_GROUP_SIZE]
+        if len(chunk) > 1:
+            keys = [cache.key(photo) for photo in chunk]
+            media = [types.InputMediaPhoto(cache.get(key) or photo)
+                for key, photo in zip(keys, chunk)]
+            try:
+                sent = bot.send_media_group(chat_id, media)
+                for key, message in zip(keys, sent):
+                    cache.put(key, _file_id(message))
+                messages.extend(sent)
+                continue
+            except ApiTelegramException as ex:
+                logger.warning("Album rejected, sending photos one by one: %s", ex)
+        for photo in chunk:
+            try:
+                messages.append(send_photo(bot, chat_id, photo, cache))
+            except ApiTelegramException as ex:
+                logger.warning("Photo %s rejected: %s", photo, ex)
+    return messages
+
+async def send_photo_async(bot: AsyncTeleBot, chat_id: int | str, photo: Any,
+cache: FileIdCache | None = None, **kwargs) -> types.Message:
+    """send_photo for AsyncTeleBot"""
+    cache = FileIdCache.default() if cache is None else cache
+    key = cache.key(photo)
+    file_id = cache.get(key)
+    if file_id is not None:
+        try:
+            return await bot.send_photo(chat_id, file_id, **kwargs)
+        except asyncio_helper.ApiTelegramException:
+            cache.invalidate(key)
+    message = await bot.send_photo(chat_id, photo, **kwargs)
+    cache.put(key, _file_id(message))
+    return message
+
+async def send_photos_async(bot: AsyncTeleBot, chat_id: int | str, photos: List[Any],
+logger: logging.Logger | None = None, cache: FileIdCache | None = None) -> List[types.Message]:
+    """send_photos for AsyncTeleBot"""
+    logger = logger or logging.getLogger(__name__)
+    cache = FileIdCache.default() if cache is None else cache
+    messages: List[types.Message] = []
+    for start in range(0, len(photos), MEDIA_GROUP_SIZE):
+        chunk = photos[start:start + MEDIA_GROUP_SIZE]
+        if len(chunk) > 1:
+            keys = [cache.key(photo) for photo in chunk]
+            media = [types.InputMediaPhoto(cache.get(key) or photo)
+                for key, photo in zip(keys, chunk)]
+            try:
+                sent = await bot.send_media_group(chat_id, media)
+                for key, message in zip(keys, sent):
+                    cache.put(key, _file_id(message))
+                messages.extend(sent)
+                continue
+            except asyncio_helper.ApiTelegramException as ex:
+                logger.warning("Album rejected, sending photos one by one: %s", ex)
+        for photo in chunk:
+            try:
+                messages.append(await send_photo_async(bot, chat_id, photo, cache))
+            except asyncio_helper.ApiTelegramException as ex:
+                logger.warning("Photo %s rejected: %s", photo, ex)
+    return messages
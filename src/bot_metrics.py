@@ -0,0 +1,66 @@
+"""The module contains simple thread-safe accumulators for runtime metrics"""
+
+import threading
+from typing import Dict, Tuple
+
+class LatencyStats:
+    """Accumulates durations (in seconds) into a fixed-bucket histogram"""
+
+    BUCKETS: Tuple[float, ...] = (
+        0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+    )
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__count = 0
+        self.__total = 0.0
+        self.__max = 0.0
+        self.__buckets = [0] * (len(self.BUCKETS) + 1)
+
+    def observe(self, seconds: float):
+        """Add one measurement"""
+        index = len(self.BUCKETS)
+        for i, bound in enumerate(self.BUCKETS):
+            if seconds <= bound:
+                index = i
+                break
+        with self.__lock:
+            self.__count += 1
+            self.__total += seconds
+            self.__max = max(self.__max, seconds)
+            self.__buckets[index] += 1
+
+    @property
+    def count(self) -> int:
+        """Number of measurements"""
+        return self.__count
+
+    def quantile(self, q: float) -> float | None:
+        """Upper bound estimate of the q-quantile: the bucket bound that covers
+        q of the measurements, or the maximum for the last bucket. None without data"""
+        with self.__lock:
+            if not self.__count:
+                return None
+            rank = q * self.__count
+            cumulative = 0
+            for bound, cnt in zip(self.BUCKETS, self.__buckets):
+                cumulative += cnt
+                if cumulative >= rank:
+                    return min(bound, self.__max)
+            return self.__max
+
+    def snapshot(self) -> Dict[str, object]:
+        """Get a copy of the accumulated values"""
+        with self.__lock:
+            buckets = {}
+            cumulative = 0
+            for bound, cnt in zip(self.BUCKETS + (float("inf"),), self.__buckets):
+                cumulative += cnt
+                buckets[f"le_{bound}"] = cumulative
+            return {
+                "count": self.__count,
+                "total": round(self.__total, 6),
+                "avg": round(self.__total / self.__count, 6) if self.__count else 0.0,
+                "max": round(self.__max, 6),
+                "buckets": buckets,
+            }
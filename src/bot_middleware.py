@@ -4,8 +4,12 @@ import os
 import logging
 import telebot
 from telebot.handler_backends import BaseMiddleware
+from sqlalchemy.exc import SQLAlchemyError
+from bot_circuit_breaker import CircuitBreaker
 from db.storage_worker import StorageWorker
-from db.models_msg_log import User, Chat, Message
+from db.message_spool import MessageSpool
+from db.message_record import MessageRecord
+from db.message_writer import MessageLogWriter
 
 class Middleware(BaseMiddleware):
     """Pre-process and post-process processing of incoming messages"""
@@ -22,6 +26,7 @@ class Middleware(BaseMiddleware):
         self.update_sensitive = True
         self.bot = bot
         self.storage_worker = self.__get_storage_worker()
+        self.message_writer = self.__get_message_writer()
 
     def pre_process_message(self, message: telebot.types.Message, _unused):
         """Logging incoming messages"""
@@ -62,57 +67,111 @@ class Middleware(BaseMiddleware):
     def __get_storage_worker(self)-> StorageWorker | None:
         conection_string = os.environ.get("CONECTION_PGDB")
         if conection_string:
-            storage_worker = StorageWorker(conection_string)
+            options = {
+                "cache_size": int(os.environ.get("DB_CACHE_SIZE", "10000")),
+                "cache_ttl": float(os.environ.get("DB_CACHE_TTL", "3600")),
+                "pool_options": self.__get_pool_options(),
+                "statement_timeout": int(os.environ.get("DB_STATEMENT_TIMEOUT", "0")),
+                "partitioning": os.environ.get("DB_PARTITIONING") == "monthly",
+            }
+            bootstrap_schema = not self.__env_flag("DB_SKIP_SCHEMA_BOOTSTRAP")
+            try:
+                storage_worker = StorageWorker(conection_string,
+                    bootstrap_schema=bootstrap_schema, **options)
+            except SQLAlchemyError as ex:
+                if not (bootstrap_schema and os.environ.get("DB_SPOOL_PATH")):
+                    raise
+                # Start anyway, the message log is spooled until the database is back
+                self.logger.error("Database is unavailable, message log goes to the spool")
+                self.logger.exception(ex)
+                storage_worker = StorageWorker(conection_string, bootstrap_schema=False, **options)
             self.logger.info(f"Added storage_worker with CONECTION_PGDB = {conection_string}")
             return storage_worker
 
         self.logger.info("Not added storage_worker")
         return None
 
+    def __get_pool_options(self)-> dict:
+        return {
+            "pool_size": int(os.environ.get("DB_POOL_SIZE", "5")),
+            "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", "10")),
+            "pool_timeout": float(os.environ.get("DB_POOL_TIMEOUT", "30")),
+            "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", "1800")),
+            "pool_pre_ping": self.__env_flag("DB_POOL_PRE_PING", "true"),
+        }
+
+    @staticmethod
+    def __env_flag(env_key: str, default: str = "false")-> bool:
+        return os.environ.get(env_key, default).lower() in ("1", "true", "yes")
+
+    def __get_message_writer(self)-> MessageLogWriter | None:
+        if self.storage_worker is None:
+            return None
+        spool_path = os.environ.get("DB_SPOOL_PATH")
+        return MessageLogWriter(
+            self.storage_worker,
+            self.logger,
+            batch_size=int(os.environ.get("DB_BATCH_SIZE", "100")),
+            flush_interval=float(os.environ.get("DB_FLUSH_INTERVAL", "1.0")),
+            queue_size=int(os.environ.get("DB_QUEUE_SIZE", "10000")),
+            spool=MessageSpool(spool_path) if spool_path else None,
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.environ.get("DB_BREAKER_FAILURES", "3")),
+                reset_timeout=float(os.environ.get("DB_BREAKER_RESET_TIMEOUT", "30")),
+            ),
+        )
+
+    def close(self):
+        """Flush the message log, waiting at most DB_SHUTDOWN_TIMEOUT seconds"""
+        if self.message_writer:
+            self.message_writer.close(float(os.environ.get("DB_SHUTDOWN_TIMEOUT", "5")))
+
+    def stats(self) -> dict:
+        """Get message log metrics"""
+        if self.message_writer is None:
+            return {}
+        return {
+            "saved": self.message_writer.saved,
+            "dropped": self.message_writer.dropped,
+            "pending": self.message_writer.pending,
+            "spooled": self.message_writer.spooled,
+            "replayed": self.message_writer.replayed,
+            "spool_rejected": self.message_writer.spool.rejected
+                if self.message_writer.spool else 0,
+            "breaker": self.message_writer.breaker.stats(),
+            "cache": self.storage_worker.cache_stats(),
+            "pool": self.storage_worker.pool_stats(),
+        }
+
     def __save_message(self, message: telebot.types.Message, data: str | None):
-        try:
-            if self.storage_worker:
-                user = self.storage_worker.get_user(message.from_user.id)
-                if user is None:
-                    user = self.__new_user_from_tgmessage(message)
-                    user = self.storage_worker.save_user(user)
-                chat = self.storage_worker.get_chat(message.chat.id)
-                if chat is None:
-                    chat = self.__new_chat_from_tgmessage(message)
-                    chat = self.storage_worker.save_chat(chat)
-                message = self.__new_message(user, chat, message.text, data)
-                self.storage_worker.save_message(message)
-        except Exception as ex : # pylint: disable=broad-except
-            self.logger.info("Failed to save to DB")
-            self.logger.exception(ex)
-
-
-    def __new_user_from_tgmessage(self, message: telebot.types.Message)-> User:
-        user = User()
-        user.id = message.from_user.id
-        user.username = message.from_user.username
-        user.first_name = message.from_user.first_name
-        user.last_name = message.from_user.last_name
-        user.full_name = message.from_user.full_name
-        user.language_code = message.from_user.language_code
-        user.is_bot = message.from_user.is_bot
-        return user
-
-    def __new_chat_from_tgmessage(self, message: telebot.types.Message)-> Chat:
-        chat = Chat()
-        chat.id = message.chat.id
-        chat.bio = message.chat.bio
-        if message.chat.description:
-            chat.description = message.chat.description
-        else:
-            chat.description = f"{message.chat.type} - {message.chat.username}"
-        return chat
-
-    def __new_message(self, user: User, chat: Chat, txt: str, data: str | None)-> Message:
-        message = Message()
-        message.user = user
-        message.chat = chat
-        message.full_user_name = f"{user.username} - {user.full_name}"
-        message.text = txt
-        message.call_data = data
-        return message
+        if self.message_writer:
+            record = MessageRecord(
+                user=self.__user_from_tgmessage(message),
+                chat=self.__chat_from_tgmessage(message),
+                text=message.text,
+                call_data=data,
+            )
+            self.message_writer.write(record)
+
+    @staticmethod
+    def __user_from_tgmessage(message: telebot.types.Message)-> dict:
+        return {
+            "id": message.from_user.id,
+            "username": message.from_user.username,
+            "first_name": message.from_user.first_name,
+            "last_name": message.from_user.last_name,
+            "full_name": message.from_user.full_name,
+            "language_code": message.from_user.language_code,
+            "is_bot": message.from_user.is_bot,
+        }
+
+    @staticmethod
+    def __chat_from_tgmessage(message: telebot.types.Message)-> dict:
+        description = message.chat.description
+        if not description:
+            description = f"{message.chat.type} - {message.chat.username}"
+        return {
+            "id": message.chat.id,
+            "bio": message.chat.bio,
+            "description": description,
+        }
@@ -0,0 +1,159 @@
+"""The module contains background prefetching of random content: every pool keeps
+a few ready items of one source, so commands get them without waiting for the upstream"""
+
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Hashable, List
+
+class PrefetchPool: # pylint: disable=too-many-instance-attributes
+    """Bounded pool of unique items returned by fetch. When the pool has low_water items
+    or less it is refilled up to size in the background. Items served recently
+    are not added again"""
+
+    def __init__(self, name: str, fetch: Callable[[], Any], prefetcher: "Prefetcher", # pylint: disable=too-many-arguments,too-many-positional-arguments
+    size: int = 10, low_water: int = 3, key: Callable[[Any], Hashable] | None = None):
+        self.name = name
+        self.fetch = fetch
+        self.size = size
+        self.low_water = low_water
+        self.key = key or (lambda item: item)
+        self.served = 0
+        self.missed = 0
+        self.fetched = 0
+        self.duplicates = 0
+        self.errors = 0
+        self.__prefetcher = prefetcher
+        self.__lock = threading.Lock()
+        self.__items: Deque[Any] = deque()
+        self.__keys: set = set()
+        self.__recent: Deque[Hashable] = deque(maxlen=size * 2)
+        self.__refilling = False
+
+    def take(self, count: int = 1) -> List[Any]:
+        """Get up to count ready items, the rest has to be fetched by the caller"""
+        with self.__lock:
+            count = max(count, 0)
+            items = [self.__items.popleft() for _ in range(min(count, len(self.__items)))]
+            for item in items:
+                self.__keys.discard(self.key(item))
+                self.__recent.append(self.key(item))
+            self.served += len(items)
+            self.missed += count - len(items)
+        self.schedule_refill()
+        return items
+
+    def __len__(self) -> int:
+        return len(self.__items)
+
+    def schedule_refill(self):
+        """Start refilling in the background if the pool is low and the prefetcher runs"""
+        with self.__lock:
+            if self.__refilling or len(self.__items) > self.low_water:
+                return
+            self.__refilling = self.__prefetcher.submit(self.refill)
+
+    def refill(self):
+        """Fetch items until the pool is full, giving up after 2 * size attempts"""
+        try:
+            for _ in range(self.size * 2):
+                if len(self.__items) >= self.size or not self.__prefetcher.running:
+                    break
+                try:
+                    item = self.fetch()
+                except Exception as ex: # pylint: disable=broad-exception-caught
+                    self.errors += 1
+                    self.__prefetcher.logger.warning("Prefetch of %s failed: %s", self.name, ex)
+                    continue
+                if item is not None:
+                    self.__add(item)
+        finally:
+            with self.__lock:
+                self.__refilling = False
+
+    def stats(self) -> Dict[str, int]:
+        """Get pool size and counters"""
+        return {"ready": len(self), "served": self.served, "missed": self.missed,
+            "fetched": self.fetched, "duplicates": self.duplicates, "errors": self.errors}
+
+    def __add(self, item: Any):
+        key = self.key(item)
+        with self.__lock:
+            self.fetched += 1
+            if key in self.__keys or key in self.__recent:
+                self.duplicates += 1
+                return
+            self.__items.append(item)
+            self.__keys.add(key)
+
+class Prefetcher:
+    """Owner of the prefetch pools and the threads that refill them.
+    Pools are not refilled until start is called"""
+
+    __default: "Prefetcher | None" = None
+    __default_lock = threading.Lock()
+
+    def __init__(self, workers: int = 2, enabled: bool = True,
+    logger: logging.Logger | None = None):
+        self.enabled = enabled
+        self.logger = logger or logging.getLogger(__name__)
+        self.__started = False
+        self.__lock = threading.Lock()
+        self.__pools: Dict[str, PrefetchPool] = {}
+        self.__executor = ThreadPoolExecutor(workers, "prefetch")
+
+    @classmethod
+    def default(cls) -> "Prefetcher":
+        """The prefetcher shared by all atomic functions.
+        Settings are taken from PREFETCH_ENABLED and PREFETCH_WORKERS"""
+        with cls.__default_lock:
+            if cls.__default is None:
+                cls.__default = cls(int(os.environ.get("PREFETCH_WORKERS", "2")),
+                    os.environ.get("PREFETCH_ENABLED", "true").lower() == "true")
+            return cls.__default
+
+    def pool(self, name: str, fetch: Callable[[], Any], size: int = 10, low_water: int = 3,
+    key: Callable[[Any], Hashable] | None = None) -> PrefetchPool:
+        """Create the pool of the name or return the existing one"""
+        with self.__lock:
+            pool = self.__pools.get(name)
+            if pool is None:
+                pool = self.__pools[name] = PrefetchPool(name, fetch, self, size, low_water, key)
+        pool.schedule_refill()
+        return pool
+
+    def start(self):
+        """Fill all pools and keep them filled"""
+        self.__started = True
+        with self.__lock:
+            pools = list(self.__pools.values())
+        for pool in pools:
+            pool.schedule_refill()
+
+    @property
+    def running(self) -> bool:
+        """Whether the pools are refilled"""
+        return self.enabled and self.__started
+
+    def submit(self, task: Callable[[], None]) -> bool:
+        """Run the task in background if the prefetcher runs. Returns whether it was queued"""
+        if not self.running:
+            return False
+        try:
+            self.__executor.submit(task)
+        except RuntimeError:
+            return False
+        return True
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Get the state of the pools by name"""
+        with self.__lock:
+            pools = dict(self.__pools)
+        return {name: pool.stats() for name, pool in sorted(pools.items())}
+
+    def close(self):
+        """Stop refilling"""
+        self.__started = False
+        self.__executor.shutdown(wait=False, cancel_futures=True)
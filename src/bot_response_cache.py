@@ -0,0 +1,189 @@
+"""The module contains an in-memory cache of upstream API responses
+with per-endpoint TTL, LRU eviction and stale-while-revalidate.
+It is shared by the requests and the aiohttp clients"""
+
+import copy
+import dataclasses
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Tuple
+import requests
+
+@dataclasses.dataclass(frozen=True)
+class CachePolicy:
+    """ttl - seconds a response is fresh; stale_ttl - seconds after that
+    the stale response is still returned while it is refreshed in the background"""
+    ttl: float
+    stale_ttl: float = 0.0
+
+@dataclasses.dataclass
+class CacheLookup:
+    """Result of ResponseCache.lookup: response is a copy of the cached response or None,
+    refresh tells the caller to fetch the URL in the background and pass it to refreshed"""
+    prefix: str
+    policy: CachePolicy
+    response: Any
+    refresh: bool = False
+
+@dataclasses.dataclass
+class _Entry:
+    response: Any
+    size: int
+    fresh_until: float
+    stale_until: float
+    refreshing: bool = False
+
+@dataclasses.dataclass
+class _PrefixStats:
+    hits: int = 0
+    stale_hits: int = 0
+    misses: int = 0
+    refreshes: int = 0
+    refresh_errors: int = 0
+
+class ResponseCache: # pylint: disable=too-many-instance-attributes
+    """Successful GET responses of URLs matching a registered prefix are cached.
+    The longest matching prefix defines the policy. Memory is bounded by the total
+    size of the response bodies, least recently used entries are evicted first.
+    Responses need status_code and content like requests.Response"""
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, refresh_workers: int = 4):
+        self.max_bytes = max_bytes
+        self.logger = logging.getLogger(__name__)
+        self.evictions = 0
+        self.__policies: Dict[str, CachePolicy] = {}
+        self.__entries: OrderedDict[str, _Entry] = OrderedDict()
+        self.__bytes = 0
+        self.__stats: Dict[str, _PrefixStats] = {}
+        self.__lock = threading.Lock()
+        self.__refresh_pool = ThreadPoolExecutor(refresh_workers, "response-cache-refresh")
+
+    def add_policies(self, policies: Dict[str, CachePolicy]):
+        """Register cache policies by URL prefix"""
+        with self.__lock:
+            self.__policies.update(policies)
+            for prefix in policies:
+                self.__stats.setdefault(prefix, _PrefixStats())
+
+    def policy_for(self, url: str) -> Tuple[str, CachePolicy] | None:
+        """Longest registered prefix of the URL and its policy"""
+        with self.__lock:
+            matches = [prefix for prefix in self.__policies if url.startswith(prefix)]
+            if not matches:
+                return None
+            prefix = max(matches, key=len)
+            return prefix, self.__policies[prefix]
+
+    def get(self, url: str, fetch: Callable[[], requests.Response]) -> requests.Response:
+        """Return the cached response of the full URL or call fetch.
+        URLs without a policy are always fetched"""
+        lookup = self.lookup(url)
+        if lookup is None:
+            return fetch()
+        if lookup.refresh:
+            self.__refresh_pool.submit(self.__refresh, url, lookup, fetch)
+        if lookup.response is not None:
+            return lookup.response
+        response = fetch()
+        self.store(url, lookup.policy, response)
+        return response
+
+    def lookup(self, url: str) -> CacheLookup | None:
+        """Find the fresh or stale response of the full URL and count the hit or miss.
+        None if the URL has no policy"""
+        match = self.policy_for(url)
+        if match is None:
+            return None
+        prefix, policy = match
+        lookup = CacheLookup(prefix, policy, None)
+        now = time.monotonic()
+        with self.__lock:
+            stats = self.__stats[prefix]
+            entry = self.__entries.get(url)
+            if entry is None or now >= entry.stale_until:
+                stats.misses += 1
+                return lookup
+            self.__entries.move_to_end(url)
+            lookup.response = copy.copy(entry.response)
+            if now < entry.fresh_until:
+                stats.hits += 1
+                return lookup
+            stats.stale_hits += 1
+            if not entry.refreshing:
+                entry.refreshing = lookup.refresh = True
+            return lookup
+
+    def refreshed(self, url: str, lookup: CacheLookup, response: Any | None):
+        """Store the response of a background refresh, None if it failed"""
+        with self.__lock:
+            entry = self.__entries.get(url)
+            if entry is not None:
+                entry.refreshing = False
+            if response is None or response.status_code != 200:
+                self.__stats[lookup.prefix].refresh_errors += 1
+                return
+            self.__stats[lookup.prefix].refreshes += 1
+        self.store(url, lookup.policy, response)
+
+    def get_any(self, url: str) -> requests.Response | None:
+        """Cached response of the URL regardless of its age, used when the upstream fails"""
+        with self.__lock:
+            entry = self.__entries.get(url)
+            return None if entry is None else copy.copy(entry.response)
+
+    def clear(self):
+        """Remove all entries"""
+        with self.__lock:
+            self.__entries.clear()
+            self.__bytes = 0
+
+    def close(self):
+        """Stop background refreshes"""
+        self.__refresh_pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, object]:
+        """Get cache size and hit/miss counters by prefix"""
+        with self.__lock:
+            return {
+                "entries": len(self.__entries),
+                "bytes": self.__bytes,
+                "evictions": self.evictions,
+                "prefixes": {prefix: dataclasses.asdict(stats)
+                    for prefix, stats in self.__stats.items()},
+            }
+
+    def __refresh(self, url: str, lookup: CacheLookup, fetch: Callable[[], requests.Response]):
+        response = None
+        try:
+            response = fetch()
+        except requests.RequestException as ex:
+            self.logger.warning("Cache refresh of %s failed: %s", url, ex)
+        except Exception as ex: # pylint: disable=broad-exception-caught
+            self.logger.exception("Cache refresh of %s failed: %s", url, ex)
+        finally:
+            # Without it the entry would never be refreshed again
+            self.refreshed(url, lookup, response)
+
+    def store(self, url: str, policy: CachePolicy, response: Any):
+        """Cache the response of the full URL if its status is 200 and it fits"""
+        if response.status_code != 200:
+            return
+        size = len(response.content)
+        if size > self.max_bytes:
+            return
+        now = time.monotonic()
+        entry = _Entry(response, size, now + policy.ttl,
+            now + policy.ttl + policy.stale_ttl)
+        with self.__lock:
+            previous = self.__entries.pop(url, None)
+            if previous is not None:
+                self.__bytes -= previous.size
+            self.__entries[url] = entry
+            self.__bytes += size
+            while self.__bytes > self.max_bytes:
+                _, evicted = self.__entries.popitem(last=False)
+                self.__bytes -= evicted.size
+                self.evictions += 1
@@ -0,0 +1,161 @@
+"""The module contains routing of incoming updates by key: instead of testing every handler,
+telebot gets only the handlers of the key and the handlers that may accept any update,
+in the order they were registered. Messages are routed by command,
+callback queries by the prefix of their CallbackData"""
+
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Tuple
+import telebot
+from telebot import types, util
+from telebot.callback_data import CallbackDataFilter
+from bot_metrics import LatencyStats
+
+OTHER = "<other>"
+
+class UpdateRouter(ABC):
+    """Hash index of handlers by key, rebuilt when handlers are added.
+    Keeps a latency histogram of the handling of every key"""
+
+    no_key = "<none>"
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__indexed: List[Dict[str, Any]] | None = None
+        self.__indexed_size = 0
+        self.__by_key: Dict[str, List[Dict[str, Any]]] = {}
+        self.__generic: List[Dict[str, Any]] = []
+        self.__latency: Dict[str, LatencyStats] = {
+            self.no_key: LatencyStats(), OTHER: LatencyStats()}
+
+    @abstractmethod
+    def handler_keys(self, handler: Dict[str, Any]) -> List[str] | None:
+        """Keys of the updates the handler may accept, None for any update"""
+
+    @abstractmethod
+    def update_key(self, update: Any) -> str | None:
+        """Key of the update, None if it has no key. Called with the lock held"""
+
+    def route(self, handlers: List[Dict[str, Any]],
+    update: Any) -> Tuple[str, List[Dict[str, Any]]]:
+        """Get the histogram key and the handlers that may accept the update"""
+        with self.__lock:
+            if handlers is not self.__indexed or len(handlers) != self.__indexed_size:
+                self.__build(handlers)
+            key = self.update_key(update)
+            if key is None:
+                return self.no_key, self.__generic
+            if key in self.__by_key:
+                return key, self.__by_key[key]
+            return OTHER, self.__generic
+
+    def observe(self, key: str, seconds: float):
+        """Add the handling time of an update"""
+        self.__latency[key].observe(seconds)
+
+    def keys(self) -> List[str]:
+        """Indexed keys"""
+        with self.__lock:
+            return sorted(self.__by_key)
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        """Get the latency histograms of the keys that were used"""
+        with self.__lock:
+            latency = dict(self.__latency)
+        return {key: stats.snapshot() for key, stats in sorted(latency.items()) if stats.count}
+
+    def _is_indexed(self, key: str) -> bool:
+        """Check whether the key has its own handlers. Call with the lock held"""
+        return key in self.__by_key
+
+    def _build_started(self):
+        """Called before the handlers are indexed. Call with the lock held"""
+
+    def __build(self, handlers: List[Dict[str, Any]]):
+        """Index the handlers. Call with the lock held"""
+        self._build_started()
+        by_key: Dict[str, List[Dict[str, Any]]] = {}
+        generic: List[Dict[str, Any]] = []
+        for handler in handlers:
+            keys = self.handler_keys(handler)
+            if keys is None:
+                generic.append(handler)
+                for key_handlers in by_key.values():
+                    key_handlers.append(handler)
+                continue
+            for key in dict.fromkeys(keys):
+                # Handlers without a key registered before the key's first handler go first
+                by_key.setdefault(key, list(generic)).append(handler)
+                self.__latency.setdefault(key, LatencyStats())
+        self.__by_key = by_key
+        self.__generic = generic
+        self.__indexed = handlers
+        self.__indexed_size = len(handlers)
+
+class CommandRouter(UpdateRouter):
+    """Routes messages by command"""
+
+    no_key = "<text>"
+
+    def handler_keys(self, handler: Dict[str, Any]) -> List[str] | None:
+        return handler["filters"].get("commands")
+
+    def update_key(self, update: types.Message) -> str | None:
+        if update.content_type != "text":
+            return None
+        return util.extract_command(update.text)
+
+class CallbackRouter(UpdateRouter):
+    """Routes callback queries by the prefix of the CallbackData filter of the handler
+    (registered with config=factory.filter() only). The key is the prefix with the separator"""
+
+    def __init__(self):
+        super().__init__()
+        self.__separators: Dict[str, None] = {}
+
+    def handler_keys(self, handler: Dict[str, Any]) -> List[str] | None:
+        config = handler["filters"].get("config")
+        if not isinstance(config, CallbackDataFilter) or set(handler["filters"]) != {"config"}:
+            return None
+        self.__separators[config.factory.sep] = None
+        return [config.factory.prefix + config.factory.sep]
+
+    def update_key(self, update: types.CallbackQuery) -> str | None:
+        if not update.data:
+            return None
+        first = None
+        for separator in self.__separators:
+            prefix, found, _ = update.data.partition(separator)
+            if not found:
+                continue
+            if self._is_indexed(prefix + separator):
+                return prefix + separator
+            first = first or prefix + separator
+        return first
+
+    def _build_started(self):
+        self.__separators.clear()
+
+class RoutedTeleBot(telebot.TeleBot):
+    """TeleBot that dispatches messages through the CommandRouter
+    and callback queries through the CallbackRouter"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.command_router = CommandRouter()
+        self.callback_router = CallbackRouter()
+
+    def _notify_command_handlers(self, handlers, new_messages, update_type):
+        if update_type == "message" and handlers is self.message_handlers:
+            router: UpdateRouter = self.command_router
+        elif update_type == "callback_query" and handlers is self.callback_query_handlers:
+            router = self.callback_router
+        else:
+            super()._notify_command_handlers(handlers, new_messages, update_type)
+            return
+        for update in new_messages:
+            key, routed = router.route(handlers, update)
+            started_at = time.perf_counter()
+            super()._notify_command_handlers(routed, [update], update_type)
+            router.observe(key, time.perf_counter() - started_at)
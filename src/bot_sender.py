@@ -0,0 +1,293 @@
+"""The module implements rate limiting of outgoing Telegram API calls.
+Sending methods wait for tokens of the global and the per-chat token buckets,
+interactive replies are granted before bulk messages and 429 responses are retried
+after the retry_after interval returned by Telegram"""
+
+import asyncio
+import contextlib
+import contextvars
+import dataclasses
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterator, List
+import requests
+from requests.adapters import HTTPAdapter
+from telebot import asyncio_helper
+from bot_metrics import LatencyStats
+
+INTERACTIVE = 0
+BULK = 1
+_LANE_NAMES = ("interactive", "bulk")
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar(
+    "send_priority", default=INTERACTIVE)
+
+@contextlib.contextmanager
+def bulk_sends() -> Iterator[None]:
+    """Messages sent inside the block go to the bulk lane and wait for interactive replies"""
+    token = _priority.set(BULK)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+class SendQueueFull(RuntimeError):
+    """Too many messages are waiting to be sent"""
+
+class TokenBucket:
+    """rate tokens per second, at most capacity tokens. Not thread-safe"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self, now: float):
+        """Add tokens for the time passed"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def delay(self) -> float:
+        """Seconds until a token is available, call after refill"""
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+@dataclasses.dataclass
+class _Waiter:
+    chat_id: str | None
+    lane: int
+    queued_at: float
+    granted: bool = False
+
+class TelegramSender: # pylint: disable=too-many-instance-attributes
+    """Replacement of the telebot request sender (apihelper.CUSTOM_REQUEST_SENDER).
+    Calls of sending methods block the calling thread until they are allowed to go,
+    coroutines wait in acquire_async.
+    Messages of one chat are sent one at a time in the order of the calls"""
+
+    RATE_LIMITED_PREFIXES = ("send", "copyMessage", "forwardMessage", "editMessage")
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, logger: logging.Logger, global_rate: float = 30, chat_rate: float = 1, # pylint: disable=too-many-arguments,too-many-positional-arguments
+    chat_burst: float = 3, queue_size: int = 1000, max_retries: int = 3):
+        self.logger = logger
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=32))
+        self.sent = [0, 0]
+        self.rejected = 0
+        self.retried = 0
+        self.wait_time = [LatencyStats(), LatencyStats()]
+        self.__global = TokenBucket(global_rate, global_rate)
+        self.__chats: Dict[str, TokenBucket] = {}
+        self.__paused: Dict[str | None, float] = {}
+        self.__in_flight: set = set()
+        self.__lanes: List[Deque[_Waiter]] = [deque(), deque()]
+        self.__condition = threading.Condition()
+
+    def send_request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send the Telegram API request, waiting for the rate limits if needed"""
+        api_method = url.rsplit("/", 1)[-1]
+        if not api_method.startswith(self.RATE_LIMITED_PREFIXES):
+            return self.session.request(method, url, **kwargs)
+        chat_id = self.__chat_id(kwargs.get("params"))
+        response = None
+        for _ in range(self.max_retries + 1):
+            self.acquire(chat_id)
+            try:
+                response = self.session.request(method, url, **kwargs)
+            finally:
+                self.release(chat_id)
+            if response.status_code != 429:
+                break
+            self.__retry_later(chat_id, response, kwargs.get("files"))
+        return response
+
+    async def send_request_async(self, api_method: str, params: Dict[str, Any] | None,
+    files: Dict[str, Any] | None, request: Callable[[], Awaitable[Any]]) -> Any:
+        """send_request for AsyncTeleBot, request makes one call of the API method.
+        Telegram 429 errors (asyncio_helper.ApiTelegramException) are retried like there"""
+        if not api_method.startswith(self.RATE_LIMITED_PREFIXES):
+            return await request()
+        chat_id = self.__chat_id(params)
+        for _ in range(self.max_retries):
+            try:
+                return await self.__limited(chat_id, request)
+            except asyncio_helper.ApiTelegramException as ex:
+                if ex.error_code != 429:
+                    raise
+                self.__retry_later(chat_id, ex.result_json, files)
+        return await self.__limited(chat_id, request)
+
+    def acquire(self, chat_id: str | None, lane: int | None = None):
+        """Wait until a message to the chat may be sent. Raises SendQueueFull"""
+        waiter = self.__enqueue(chat_id, lane)
+        with self.__condition:
+            while True:
+                delay = self.__grant()
+                if waiter.granted:
+                    break
+                self.__condition.wait(delay)
+            # Other waiters may have become ready by the same grant
+            self.__condition.notify_all()
+        self.__observe(waiter)
+
+    async def acquire_async(self, chat_id: str | None, lane: int | None = None):
+        """acquire for coroutines, waits with asyncio.sleep and does not hold a thread.
+        Raises SendQueueFull"""
+        waiter = self.__enqueue(chat_id, lane)
+        try:
+            while True:
+                with self.__condition:
+                    delay = self.__grant()
+                    if waiter.granted:
+                        self.__condition.notify_all()
+                        break
+                # Releases do not wake coroutines, poll for them
+                await asyncio.sleep(self.POLL_INTERVAL if delay is None
+                    else min(delay, self.POLL_INTERVAL))
+        except asyncio.CancelledError:
+            with self.__condition:
+                if waiter.granted:
+                    self.__in_flight.discard(chat_id)
+                else:
+                    self.__lanes[waiter.lane].remove(waiter)
+                self.__condition.notify_all()
+            raise
+        self.__observe(waiter)
+
+    def release(self, chat_id: str | None):
+        """The message to the chat was sent"""
+        with self.__condition:
+            self.__in_flight.discard(chat_id)
+            self.__condition.notify_all()
+
+    def pause(self, chat_id: str | None, seconds: float):
+        """Do not send to the chat (None - to any chat) for the given time"""
+        with self.__condition:
+            self.__paused[chat_id] = time.monotonic() + seconds
+
+    @property
+    def pending(self) -> int:
+        """Number of waiting messages"""
+        return sum(len(lane) for lane in self.__lanes)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get queue lengths, counters and wait times by lane"""
+        with self.__condition:
+            lanes = {name: {"waiting": len(self.__lanes[i]), "sent": self.sent[i],
+                "wait_time": self.wait_time[i].snapshot()} for i, name in enumerate(_LANE_NAMES)}
+        return {"lanes": lanes, "rejected": self.rejected, "retried_429": self.retried}
+
+    def __enqueue(self, chat_id: str | None, lane: int | None) -> _Waiter:
+        lane = _priority.get() if lane is None else lane
+        waiter = _Waiter(chat_id, lane, time.monotonic())
+        with self.__condition:
+            if self.pending >= self.queue_size:
+                self.rejected += 1
+                raise SendQueueFull(f"{self.queue_size} messages are waiting to be sent")
+            self.__lanes[lane].append(waiter)
+        return waiter
+
+    def __observe(self, waiter: _Waiter):
+        self.wait_time[waiter.lane].observe(time.monotonic() - waiter.queued_at)
+        self.sent[waiter.lane] += 1
+
+    def __grant(self) -> float | None:
+        """Grant waiters that may go now in lane and FIFO order.
+        Returns the time to wait before the next waiter may go. Call with the lock held"""
+        now = time.monotonic()
+        self.__global.refill(now)
+        global_pause = self.__paused.get(None, 0.0) - now
+        if global_pause > 0:
+            return global_pause
+        blocked = set(self.__in_flight)
+        delay = None
+        for lane in self.__lanes:
+            for waiter in list(lane):
+                if waiter.chat_id in blocked:
+                    continue
+                blocked.add(waiter.chat_id)
+                wait = self.__chat_delay(waiter.chat_id, now)
+                if wait <= 0:
+                    wait = self.__global.delay()
+                    if wait > 0:
+                        return wait if delay is None else min(delay, wait)
+                    self.__take(waiter, lane)
+                    continue
+                delay = wait if delay is None else min(delay, wait)
+        return delay
+
+    def __chat_delay(self, chat_id: str | None, now: float) -> float:
+        if chat_id in self.__paused:
+            paused = self.__paused[chat_id] - now
+            if paused > 0:
+                return paused
+            del self.__paused[chat_id]
+        if chat_id is None:
+            return 0.0
+        bucket = self.__chats.get(chat_id)
+        if bucket is None:
+            return 0.0
+        bucket.refill(now)
+        return bucket.delay()
+
+    def __take(self, waiter: _Waiter, lane: Deque[_Waiter]):
+        lane.remove(waiter)
+        waiter.granted = True
+        self.__global.tokens -= 1
+        if waiter.chat_id is not None:
+            bucket = self.__chats.get(waiter.chat_id)
+            if bucket is None:
+                if len(self.__chats) > 10 * self.queue_size:
+                    self.__forget_full_buckets()
+                bucket = self.__chats[waiter.chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            bucket.tokens -= 1
+            self.__in_flight.add(waiter.chat_id)
+
+    def __forget_full_buckets(self):
+        now = time.monotonic()
+        for chat_id, bucket in list(self.__chats.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.capacity:
+                del self.__chats[chat_id]
+
+    async def __limited(self, chat_id: str | None, request: Callable[[], Awaitable[Any]]) -> Any:
+        await self.acquire_async(chat_id)
+        try:
+            return await request()
+        finally:
+            self.release(chat_id)
+
+    def __retry_later(self, chat_id: str | None, response: requests.Response | Dict[str, Any],
+    files: Dict[str, Any] | None):
+        self.retried += 1
+        retry_after = self.__retry_after(response)
+        self.logger.warning("Telegram 429 for chat %s, retry after %s s", chat_id, retry_after)
+        self.pause(chat_id, retry_after)
+        self.__rewind_files(files)
+
+    @staticmethod
+    def __chat_id(params: Dict[str, Any] | None) -> str | None:
+        chat_id = (params or {}).get("chat_id")
+        return None if chat_id is None else str(chat_id)
+
+    @staticmethod
+    def __retry_after(response: requests.Response | Dict[str, Any]) -> float:
+        try:
+            result = response.json() if isinstance(response, requests.Response) else response
+            return float(result["parameters"]["retry_after"])
+        except (ValueError, KeyError, TypeError):
+            return 1.0
+
+    @staticmethod
+    def __rewind_files(files: Dict[str, Any] | None):
+        for value in (files or {}).values():
+            file = value[1] if isinstance(value, tuple) else value
+            if hasattr(file, "seek"):
+                file.seek(0)
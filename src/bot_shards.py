@@ -0,0 +1,186 @@
+"""The module implements the supervisor of the sharded mode: updates are routed
+to worker processes by the hash of the chat, so updates of one chat keep their order
+while the handlers of different chats run on all cores"""
+
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from multiprocessing.process import BaseProcess
+from typing import Any, Callable, Dict, List
+from telebot import types
+from bot_dispatcher import UpdateDispatcher
+
+# (shard index, queue of updates) -> None, runs in the worker process until None is received
+ShardWorker = Callable[[int, Any], None]
+
+class _Shard: # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    """Worker process of a shard with its queue"""
+
+    def __init__(self, index: int, updates: Any):
+        self.index = index
+        self.updates = updates
+        self.process: BaseProcess | None = None
+        self.started_at = 0.0
+        self.submitted = 0
+        self.rejected = 0
+        self.restarts = 0
+        self.backoff = 0.0
+        self.restart_at: float | None = None
+
+class ShardSupervisor: # pylint: disable=too-many-instance-attributes
+    """Starts a worker process per shard and passes each update to the shard of its chat.
+    A worker that exits is started again with the same queue, after a delay that doubles
+    from min_backoff up to max_backoff while it keeps exiting sooner than max_backoff.
+    A blocking submit waits at most submit_timeout for a full shard queue, so one stuck
+    shard does not stop the updates of the others.
+    Has the interface of UpdateDispatcher used by the polling loop and WebhookServer"""
+
+    def __init__(self, worker: ShardWorker, logger: logging.Logger, # pylint: disable=too-many-arguments,too-many-positional-arguments
+    shards: int = 2, queue_size: int = 1000, check_interval: float = 1.0,
+    submit_timeout: float = 1.0, min_backoff: float = 1.0, max_backoff: float = 60.0):
+        if shards < 1 or queue_size < 1:
+            raise ValueError("shards and queue_size must be positive")
+        self.logger = logger
+        self.shards = shards
+        self.queue_size = queue_size
+        self.check_interval = check_interval
+        self.submit_timeout = submit_timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.__worker = worker
+        self.__context = self.context()
+        self.__shards: List[_Shard] = [_Shard(index, self.__context.Queue(queue_size))
+            for index in range(shards)]
+        self.__lock = threading.Lock()
+        self.__stopped = threading.Event()
+        self.__monitor: threading.Thread | None = None
+
+    @staticmethod
+    def context() -> multiprocessing.context.BaseContext:
+        """Multiprocessing context of the workers and their queues.
+        Fork would copy the threads and connections of the ingress process"""
+        return multiprocessing.get_context("spawn")
+
+    @staticmethod
+    def use_local_paths(index: int, env_keys: List[str]):
+        """Append .shard<index> to the file paths set in the environment variables,
+        so the worker processes do not write the same files. Call in the worker"""
+        for env_key in env_keys:
+            if os.environ.get(env_key):
+                os.environ[env_key] = f"{os.environ[env_key]}.shard{index}"
+
+    @staticmethod
+    def divide_rates(shards: int, env_defaults: Dict[str, float]):
+        """Set the rates of the environment variables (or their defaults) to an equal part
+        for one shard, so all worker processes together keep the limit. Call in the worker"""
+        for env_key, default in env_defaults.items():
+            os.environ[env_key] = str(float(os.environ.get(env_key) or default) / shards)
+
+    def start(self):
+        """Start the worker processes and the thread that restarts them"""
+        for shard in self.__shards:
+            self.__start_worker(shard)
+        self.__monitor = threading.Thread(target=self.__watch, name="shard-monitor",
+            daemon=True)
+        self.__monitor.start()
+
+    def stop(self, timeout: float | None = None):
+        """Let the workers process the queued updates and wait for them to exit"""
+        self.__stopped.set()
+        if self.__monitor:
+            self.__monitor.join()
+        for shard in self.__shards:
+            try:
+                shard.updates.put(None, timeout=timeout)
+            except queue.Full:
+                self.logger.warning("Shard %d queue is full", shard.index)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for shard in self.__shards:
+            if shard.process is None:
+                continue
+            shard.process.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+            if shard.process.is_alive():
+                self.logger.warning("Shard %d did not stop, terminating", shard.index)
+                shard.process.terminate()
+                shard.process.join()
+
+    def shard_of(self, update: types.Update) -> int:
+        """Get the index of the shard that handles the chat of the update"""
+        return hash(UpdateDispatcher.chat_key(update)) % self.shards
+
+    def submit(self, update: types.Update, block: bool = True,
+    timeout: float | None = None) -> bool:
+        """Queue the update to its shard. Returns False if the shard queue is full.
+        A blocking call waits at most submit_timeout unless timeout is given"""
+        shard = self.__shards[self.shard_of(update)]
+        try:
+            shard.updates.put(update, block, self.submit_timeout if timeout is None else timeout)
+        except queue.Full:
+            with self.__lock:
+                shard.rejected += 1
+            return False
+        with self.__lock:
+            shard.submitted += 1
+        return True
+
+    @property
+    def pending(self) -> int:
+        """Number of updates waiting in the shard queues"""
+        return sum(self.__queue_depth(shard) or 0 for shard in self.__shards)
+
+    def stats(self) -> Dict[str, object]:
+        """Get the state and queue depth of the shards"""
+        with self.__lock:
+            shards = [{
+                "shard": shard.index,
+                "pid": shard.process.pid if shard.process else None,
+                "alive": bool(shard.process and shard.process.is_alive()),
+                "queue_depth": self.__queue_depth(shard),
+                "submitted": shard.submitted,
+                "rejected": shard.rejected,
+                "restarts": shard.restarts,
+                "backoff": shard.backoff,
+            } for shard in self.__shards]
+        return {"shards": self.shards, "queue_size": self.queue_size, "workers": shards}
+
+    @staticmethod
+    def __queue_depth(shard: _Shard) -> int | None:
+        try:
+            return shard.updates.qsize()
+        except NotImplementedError:
+            return None
+
+    def __start_worker(self, shard: _Shard):
+        process = self.__context.Process( # pylint: disable=too-many-function-args
+            target=self.__worker, args=(shard.index, shard.updates),
+            name=f"shard-{shard.index}", daemon=True)
+        process.start()
+        shard.process = process
+        shard.started_at = time.monotonic()
+        self.logger.info("Shard %d started, pid %s", shard.index, process.pid)
+
+    def __watch(self):
+        while not self.__stopped.wait(self.check_interval): # pylint: disable=too-many-function-args
+            for shard in self.__shards:
+                if shard.process is None or shard.process.is_alive():
+                    continue
+                now = time.monotonic()
+                if shard.restart_at is None:
+                    self.__schedule_restart(shard, now)
+                if now >= shard.restart_at:
+                    with self.__lock:
+                        shard.restarts += 1
+                        shard.restart_at = None
+                    self.__start_worker(shard)
+
+    def __schedule_restart(self, shard: _Shard, now: float):
+        with self.__lock:
+            if now - shard.started_at >= self.max_backoff:
+                shard.backoff = 0.0
+            shard.backoff = min(self.max_backoff, shard.backoff * 2 or self.min_backoff)
+            shard.restart_at = now + shard.backoff
+        self.logger.error("Shard %d exited with code %s, restarting in %.1f s",
+            shard.index, shard.process.exitcode, shard.backoff)
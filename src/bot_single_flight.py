@@ -0,0 +1,49 @@
+"""The module contains request coalescing: concurrent calls with the same key
+share one execution and its result"""
+
+import dataclasses
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+@dataclasses.dataclass
+class _Call:
+    done: threading.Event = dataclasses.field(default_factory=threading.Event)
+    result: Any = None
+    error: BaseException | None = None
+
+class SingleFlight:
+    """The first caller of a key runs the function, callers arriving while it runs
+    wait and get the same result or exception"""
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, function: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run or join the call. Returns the result and whether it was shared"""
+        with self.__lock:
+            call = self.__calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.__calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = function()
+        except BaseException as ex:
+            call.error = ex
+            raise
+        finally:
+            with self.__lock:
+                del self.__calls[key]
+            call.done.set()
+        return call.result, False
+
+    @property
+    def in_flight(self) -> int:
+        """Number of running calls"""
+        with self.__lock:
+            return len(self.__calls)
@@ -0,0 +1,236 @@
+"""The module contains the storage of next step handlers of multi-step dialogs.
+Handlers of abandoned dialogs expire after a TTL and the number of waiting chats is bounded.
+With a database the handlers that are methods of atomic functions are saved by reference
+as JSON: they survive restarts and are shared by the worker processes"""
+
+import importlib
+import inspect
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Set, Tuple
+from sqlalchemy import BigInteger, Column, Float, LargeBinary, MetaData, Table
+from sqlalchemy import create_engine, delete, func, insert, select
+from telebot import Handler
+from telebot.handler_backends import HandlerBackend
+
+# (module, class qualname) of a handler owner -> the object or None
+OwnerResolver = Callable[[str, str], Any]
+
+_metadata = MetaData()
+step_handlers_table = Table("step_handlers", _metadata,
+    Column("chat_id", BigInteger, primary_key=True),
+    Column("expires_at", Float, nullable=False, index=True),
+    # UTF-8 JSON list of {"module", "qualname", "attribute", "args", "kwargs"}
+    Column("handlers", LargeBinary, nullable=False))
+
+class StepHandlerStore(HandlerBackend): # pylint: disable=too-many-instance-attributes
+    """Next step handlers by chat id with a TTL and a size limit,
+    expired entries are removed by a sweeper thread.
+    connection_string - SQLAlchemy database for the handlers of bound methods,
+    resolver - finds the owner of a saved handler, e.g. after a restart.
+    Arguments of saved handlers must be JSON-serializable, register_handler raises TypeError
+    otherwise. A saved handler is only called if it is a method of the class of its owner.
+    The ids of the chats with saved handlers are read at start and kept in memory,
+    so only those chats are looked up in the database. A chat is handled by one process
+    (see ShardSupervisor), rows saved by other processes later are not seen"""
+
+    def __init__(self, ttl: float = 900, max_size: int = 10000, # pylint: disable=too-many-arguments,too-many-positional-arguments
+    sweep_interval: float = 60, connection_string: str | None = None,
+    resolver: OwnerResolver | None = None, logger: logging.Logger | None = None):
+        super().__init__()
+        self.ttl = ttl
+        self.max_size = max_size
+        self.__resolver = resolver
+        self.__logger = logger or logging.getLogger(__name__)
+        self.__lock = threading.Lock()
+        self.__entries: OrderedDict[int, Tuple[float, List[Handler]]] = OrderedDict()
+        self.__counters = dict.fromkeys(
+            ("registered", "expired", "evicted", "saved", "restored", "lost"), 0)
+        self.__engine = None
+        self.__saved_ids: Set[int] = set()
+        if connection_string:
+            self.__engine = create_engine(connection_string)
+            _metadata.create_all(self.__engine)
+            table = step_handlers_table
+            with self.__engine.connect() as connection:
+                self.__saved_ids.update(connection.execute(select(table.c.chat_id)
+                    .where(table.c.expires_at >= time.time())).scalars())
+        self.__stopped = threading.Event()
+        self.__sweeper = threading.Thread(target=self.__sweep_loop, args=(sweep_interval,),
+            name="step-sweeper", daemon=True)
+        self.__sweeper.start()
+
+    def register_handler(self, handler_group_id, handler):
+        if self.__engine is not None:
+            # Raises TypeError before the waiting handlers of the chat are taken
+            self.__references([handler])
+        handlers = self.__take(handler_group_id) or []
+        handlers.append(handler)
+        self.__put(handler_group_id, handlers)
+        self.__count("registered")
+
+    def clear_handlers(self, handler_group_id):
+        self.__take(handler_group_id)
+
+    def get_handlers(self, handler_group_id):
+        return self.__take(handler_group_id)
+
+    def sweep(self):
+        """Remove expired entries and database rows over the size limit"""
+        now = time.time()
+        with self.__lock:
+            expired = [chat_id for chat_id, (expires_at, _) in self.__entries.items()
+                if expires_at < now]
+            for chat_id in expired:
+                del self.__entries[chat_id]
+        self.__count("expired", len(expired))
+        if self.__engine is None:
+            return
+        table = step_handlers_table
+        with self.__engine.begin() as connection:
+            removed = connection.execute(delete(table).where(table.c.expires_at < now)
+                .returning(table.c.chat_id)).scalars().all()
+            overflow = select(table.c.chat_id).order_by(table.c.expires_at.desc()) \
+                .offset(self.max_size).scalar_subquery()
+            evicted = connection.execute(delete(table).where(table.c.chat_id.in_(overflow))
+                .returning(table.c.chat_id)).scalars().all()
+        with self.__lock:
+            self.__saved_ids.difference_update(removed + evicted)
+        self.__count("expired", len(removed))
+        self.__count("evicted", len(evicted))
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the number of waiting chats and the counters"""
+        with self.__lock:
+            stats: Dict[str, Any] = {"size": len(self.__entries), **self.__counters}
+        if self.__engine is not None:
+            with self.__engine.connect() as connection:
+                stats["saved_size"] = connection.execute(
+                    select(func.count()).select_from(step_handlers_table)).scalar()
+        return stats
+
+    def close(self):
+        """Stop the sweeper and close the database connections"""
+        self.__stopped.set()
+        self.__sweeper.join()
+        if self.__engine is not None:
+            self.__engine.dispose()
+
+    def __sweep_loop(self, interval: float):
+        while not self.__stopped.wait(interval): # pylint: disable=too-many-function-args
+            try:
+                self.sweep()
+            except Exception as ex: # pylint: disable=broad-except
+                self.__logger.error("Step handlers sweep exception: %s", ex)
+
+    def __count(self, name: str, value: int = 1):
+        with self.__lock:
+            self.__counters[name] += value
+
+    def __take(self, chat_id: int) -> List[Handler] | None:
+        """Remove and return the handlers of the chat that have not expired"""
+        with self.__lock:
+            entry = self.__entries.pop(chat_id, None)
+        if entry is not None:
+            if entry[0] >= time.time():
+                return entry[1]
+            self.__count("expired")
+        if self.__engine is None:
+            return None
+        with self.__lock:
+            if chat_id not in self.__saved_ids:
+                return None
+            self.__saved_ids.discard(chat_id)
+        table = step_handlers_table
+        with self.__engine.begin() as connection:
+            row = connection.execute(delete(table).where(table.c.chat_id == chat_id)
+                .returning(table.c.expires_at, table.c.handlers)).first()
+        if row is None:
+            return None
+        if row.expires_at < time.time():
+            self.__count("expired")
+            return None
+        return self.__restore(row.handlers)
+
+    def __put(self, chat_id: int, handlers: List[Handler]):
+        expires_at = time.time() + self.ttl
+        data = self.__references(handlers) if self.__engine is not None else None
+        if data is not None:
+            table = step_handlers_table
+            with self.__engine.begin() as connection:
+                connection.execute(delete(table).where(table.c.chat_id == chat_id))
+                connection.execute(insert(step_handlers_table),
+                    {"chat_id": chat_id, "expires_at": expires_at, "handlers": data})
+            with self.__lock:
+                self.__saved_ids.add(chat_id)
+            self.__count("saved")
+            return
+        with self.__lock:
+            self.__entries[chat_id] = (expires_at, handlers)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+                self.__counters["evicted"] += 1
+
+    @staticmethod
+    def __references(handlers: List[Handler]) -> bytes | None:
+        """Encode the handlers as JSON records of the owner class, the method and the arguments,
+        None if one of them is not a method. Raises TypeError if the arguments are not JSON"""
+        references = []
+        for handler in handlers:
+            owner = getattr(handler.callback, "__self__", None)
+            if owner is None or "<locals>" in type(owner).__qualname__:
+                return None
+            owner_type = type(owner)
+            # The name of the attribute, mangled for private methods
+            attribute = next((name for klass in owner_type.__mro__ for name, value
+                in vars(klass).items() if value is handler.callback.__func__), None)
+            if attribute is None:
+                return None
+            references.append({"module": owner_type.__module__,
+                "qualname": owner_type.__qualname__, "attribute": attribute,
+                "args": handler.args, "kwargs": handler.kwargs})
+        try:
+            return json.dumps(references).encode("utf-8")
+        except (TypeError, ValueError) as ex:
+            raise TypeError(f"Arguments of a saved step handler must be JSON: {ex}") from ex
+
+    def __restore(self, data: bytes) -> List[Handler] | None:
+        try:
+            references = json.loads(data)
+        except ValueError as ex:
+            self.__logger.warning("Step handlers are not restored: %s", ex)
+            self.__count("lost")
+            return None
+        handlers = []
+        for reference in references:
+            handler = self.__resolve(reference)
+            if handler is None:
+                self.__logger.warning("Step handler %s is not restored", reference)
+                self.__count("lost")
+                continue
+            handlers.append(handler)
+            self.__count("restored")
+        return handlers or None
+
+    def __resolve(self, reference: Any) -> Handler | None:
+        """Handler of a JSON record if its owner is found and the attribute is a method
+        of the owner class imported by its module and qualname"""
+        try:
+            module, qualname, attribute = (reference["module"], reference["qualname"],
+                reference["attribute"])
+            args, kwargs = list(reference["args"]), dict(reference["kwargs"])
+            owner_type: Any = importlib.import_module(module)
+            for name in qualname.split("."):
+                owner_type = getattr(owner_type, name)
+        except (ImportError, AttributeError, KeyError, TypeError, ValueError):
+            return None
+        if attribute.startswith("__") and attribute.endswith("__") \
+        or not inspect.isfunction(getattr(owner_type, attribute, None)):
+            return None
+        owner = self.__resolver(module, qualname) if self.__resolver else None
+        if not isinstance(owner, owner_type):
+            return None
+        return Handler(getattr(owner, attribute), *args, **kwargs)
@@ -0,0 +1,111 @@
+"""The module implements a local HTTP server that receives Telegram updates
+via webhook and passes them to the update dispatcher"""
+
+import json
+import logging
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Tuple
+from telebot import types
+from bot_dispatcher import UpdateDispatcher
+
+class WebhookServer:
+    """HTTP server for Telegram webhook updates.
+    POST <path> - accept an update, GET /metrics - runtime metrics in JSON.
+    With path None updates are not accepted and only metrics are served"""
+
+    SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+    METRICS_PATH = "/metrics"
+    RETRY_AFTER = 1
+
+    def __init__(self, dispatcher: UpdateDispatcher, logger: logging.Logger, # pylint: disable=too-many-arguments,too-many-positional-arguments
+    address: Tuple[str, int], path: str | None = "/", secret_token: str | None = None,
+    metrics: Callable[[], Dict[str, object]] | None = None):
+        self.dispatcher = dispatcher
+        self.logger = logger
+        self.path = path
+        self.secret_token = secret_token
+        self.metrics = metrics or dispatcher.stats
+        self.__httpd = ThreadingHTTPServer(address, _WebhookRequestHandler)
+        self.__httpd.daemon_threads = True
+        self.__httpd.webhook = self
+        self.__thread: threading.Thread | None = None
+
+    @property
+    def server_address(self) -> Tuple[str, int]:
+        """Address the server is bound to"""
+        return self.__httpd.server_address[:2]
+
+    def serve_forever(self):
+        """Handle requests until shutdown"""
+        self.logger.info("Webhook server listening on %s:%d%s", *self.server_address,
+            self.path or self.METRICS_PATH)
+        self.__httpd.serve_forever()
+
+    def start(self):
+        """Handle requests in a background thread"""
+        self.__thread = threading.Thread(target=self.serve_forever, name="webhook", daemon=True)
+        self.__thread.start()
+
+    def shutdown(self):
+        """Stop the server and release the socket"""
+        self.__httpd.shutdown()
+        self.__httpd.server_close()
+        if self.__thread:
+            self.__thread.join()
+            self.__thread = None
+
+    def accept(self, body: bytes, secret_token: str | None) -> HTTPStatus:
+        """Parse the update and queue it. Returns the HTTP status for Telegram"""
+        if self.secret_token and secret_token != self.secret_token:
+            return HTTPStatus.FORBIDDEN
+        try:
+            update = types.Update.de_json(body.decode("utf-8"))
+        except (ValueError, KeyError, TypeError) as ex:
+            self.logger.warning("Bad webhook update: %s", ex)
+            return HTTPStatus.BAD_REQUEST
+        if update is None:
+            return HTTPStatus.BAD_REQUEST
+        if not self.dispatcher.submit(update, block=False):
+            self.logger.warning("Dispatcher queue is full, update %s rejected", update.update_id)
+            return HTTPStatus.TOO_MANY_REQUESTS
+        return HTTPStatus.OK
+
+
+class _WebhookRequestHandler(BaseHTTPRequestHandler):
+    """Request handler bound to WebhookServer"""
+
+    def do_POST(self): # pylint: disable=invalid-name
+        """Receive an update"""
+        webhook: WebhookServer = self.server.webhook
+        if self.path != webhook.path:
+            self.__reply(HTTPStatus.NOT_FOUND)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        status = webhook.accept(body, self.headers.get(WebhookServer.SECRET_HEADER))
+        headers = {}
+        if status == HTTPStatus.TOO_MANY_REQUESTS:
+            headers["Retry-After"] = str(WebhookServer.RETRY_AFTER)
+        self.__reply(status, headers=headers)
+
+    def do_GET(self): # pylint: disable=invalid-name
+        """Return metrics"""
+        webhook: WebhookServer = self.server.webhook
+        if self.path != WebhookServer.METRICS_PATH:
+            self.__reply(HTTPStatus.NOT_FOUND)
+            return
+        body = json.dumps(webhook.metrics(), default=str).encode("utf-8")
+        self.__reply(HTTPStatus.OK, body, {"Content-Type": "application/json"})
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        self.server.webhook.logger.debug(format, *args)
+
+    def __reply(self, status: HTTPStatus, body: bytes = b"", headers: Dict[str, str] = None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
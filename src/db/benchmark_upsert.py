@@ -0,0 +1,77 @@
+"""Micro-benchmark of the message log write paths.
+
+Compares the read-then-insert path (get_user, save_user, get_chat, save_chat, save_message)
+with StorageWorker.upsert_record and the batched StorageWorker.save_records.
+
+Run from the repository root:
+    python src/db/benchmark_upsert.py [connection_string] [count]
+Without a connection string a temporary SQLite database is used."""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from db.storage_worker import StorageWorker # pylint: disable=wrong-import-position
+from db.message_record import MessageRecord # pylint: disable=wrong-import-position
+from db.models_msg_log import User, Chat, Message # pylint: disable=wrong-import-position
+
+def make_records(count: int, users: int = 50) -> List[MessageRecord]:
+    """Records of a few users writing to their private chats"""
+    records = []
+    for i in range(count):
+        user_id = 1000 + i % users
+        user = {
+            "id": user_id, "username": f"user{user_id}", "first_name": "first",
+            "last_name": "last", "full_name": "first last", "language_code": "ru",
+            "is_bot": False,
+        }
+        chat = {"id": user_id, "bio": None, "description": f"private - user{user_id}"}
+        records.append(MessageRecord(user=user, chat=chat, text=f"message {i}", call_data=None))
+    return records
+
+def read_then_insert(storage_worker: StorageWorker, record: MessageRecord):
+    """The original Middleware write path"""
+    user = storage_worker.get_user(record.user["id"])
+    if user is None:
+        user = storage_worker.save_user(User(**record.user))
+    chat = storage_worker.get_chat(record.chat["id"])
+    if chat is None:
+        chat = storage_worker.save_chat(Chat(**record.chat))
+    message = Message()
+    message.user_id = user.id
+    message.chat_id = chat.id
+    message.full_user_name = record.full_user_name
+    message.text = record.text
+    message.call_data = record.call_data
+    storage_worker.save_message(message)
+
+def measure(name: str, records: List[MessageRecord], write: Callable[[List[MessageRecord]], None]):
+    """Print the time per record of the write path"""
+    started_at = time.perf_counter()
+    write(records)
+    elapsed = time.perf_counter() - started_at
+    print(f"{name:<20} {elapsed:8.3f}s {elapsed / len(records) * 1e6:10.1f} us/record")
+
+def main():
+    """Run the benchmark"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        default = f"sqlite:///{Path(tmp_dir) / 'benchmark.db'}"
+        connection_string = (sys.argv[1] if len(sys.argv) > 1 else "") or default
+        count = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+        storage_worker = StorageWorker(connection_string)
+        records = make_records(count)
+        print(f"{count} records, {connection_string.split(':', 1)[0]}")
+        measure("read-then-insert", records,
+            lambda batch: [read_then_insert(storage_worker, r) for r in batch])
+        measure("upsert_record", records,
+            lambda batch: [storage_worker.upsert_record(r) for r in batch])
+        measure("save_records x100", records,
+            lambda batch: [storage_worker.save_records(batch[i:i + 100])
+                for i in range(0, len(batch), 100)])
+
+if __name__ == '__main__':
+    main()
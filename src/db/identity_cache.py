@@ -0,0 +1,51 @@
+"""The module contains a bounded LRU cache with TTL for the known users and chats.
+The cache keeps a snapshot of the stored profile fields to detect changes"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Tuple
+
+class IdentityCache:
+    """Thread-safe LRU cache with expiration of entries"""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.__lock = threading.Lock()
+        self.__entries: OrderedDict[Hashable, Tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable) -> Any:
+        """Get the cached value or None if it is missing or expired"""
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.__entries[key]
+                self.misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any):
+        """Add or refresh the value, evicting the least recently used entries"""
+        with self.__lock:
+            self.__entries[key] = (time.monotonic() + self.ttl, value)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        """Remove the value from the cache"""
+        with self.__lock:
+            self.__entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def stats(self) -> Dict[str, int]:
+        """Get cache counters"""
+        return {"size": len(self), "hits": self.hits, "misses": self.misses}
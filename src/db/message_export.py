@@ -0,0 +1,174 @@
+"""The module implements a chunked export of the message log tables
+to gzip-compressed CSV or, if pyarrow is installed, to Parquet files"""
+
+import csv
+import gzip
+import json
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List
+from sqlalchemy import Boolean, DateTime, Engine, Integer, Table, select
+from db.models_msg_log import User, Chat, Message
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+class MessageExporter:
+    """Export of the users, chats and messages tables in chunks ordered by id.
+    The last exported message id is kept in a state file in the target directory,
+    so the next incremental export continues from it. An export filtered by time
+    neither reads nor moves the saved id, otherwise the messages outside the window
+    would be skipped by the next run. Users and chats are keyed by
+    Telegram ids, which are not assigned in order and change their rows in place,
+    so they are exported in full every time"""
+
+    TABLES: Dict[str, Table] = {
+        "users": User.__table__,
+        "chats": Chat.__table__,
+        "messages": Message.__table__,
+    }
+    INCREMENTAL_TABLES = ("messages",)
+    STATE_FILE = "export_state.json"
+
+    def __init__(self, engine: Engine, logger: logging.Logger, target_dir: str, # pylint: disable=too-many-arguments,too-many-positional-arguments
+    file_format: str | None = None, chunk_size: int = 10000):
+        """file_format - "csv" or "parquet", by default Parquet when pyarrow is available"""
+        self.engine = engine
+        self.logger = logger
+        self.target_dir = Path(target_dir)
+        self.file_format = file_format or ("parquet" if pyarrow is not None else "csv")
+        if self.file_format == "parquet" and pyarrow is None:
+            raise ValueError("Parquet export requires pyarrow")
+        if self.file_format not in ("csv", "parquet"):
+            raise ValueError(f"Unknown export format: {self.file_format}")
+        self.chunk_size = chunk_size
+
+    def export(self, since: datetime | None = None, until: datetime | None = None,
+    incremental: bool = True) -> Dict[str, int]:
+        """Export all tables. since and until filter messages by date_time,
+        such an export is a one-off and does not use the saved state.
+        Returns the number of exported rows per table"""
+        self.target_dir.mkdir(parents=True, exist_ok=True)
+        window = since is not None or until is not None
+        state = {name: last_id for name, last_id in self.load_state().items()
+            if name in self.INCREMENTAL_TABLES} if incremental and not window else {}
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        result = {}
+        for name, table in self.TABLES.items():
+            if name not in self.INCREMENTAL_TABLES:
+                suffix = "full"
+            elif window:
+                suffix = "-".join(f"{bound:%Y%m%d}" if bound else "" for bound in (since, until))
+            else:
+                suffix = state.get(name, 0)
+            path = self.target_dir / f"{name}_{stamp}_{suffix}.{self.__extension}"
+            rows, last_id = self.export_table(table, path, state.get(name), since, until)
+            result[name] = rows
+            if last_id is not None and name in self.INCREMENTAL_TABLES:
+                state[name] = last_id
+            self.logger.info("Exported %d rows of %s", rows, name)
+        if not window:
+            self.__save_state(state)
+        return result
+
+    def export_table(self, table: Table, path: Path, after_id: int | None = None, # pylint: disable=too-many-arguments,too-many-positional-arguments
+    since: datetime | None = None, until: datetime | None = None) -> tuple:
+        """Export rows with id greater than after_id chunk by chunk.
+        Returns the number of rows and the last exported id. No file is created without rows"""
+        writer = None
+        rows = 0
+        try:
+            for chunk in self.__chunks(table, after_id, since, until):
+                if writer is None:
+                    writer = self.__open_writer(table, path)
+                writer.write(chunk)
+                rows += len(chunk)
+                after_id = chunk[-1]["id"]
+        finally:
+            if writer is not None:
+                writer.close()
+        return rows, after_id
+
+    def load_state(self) -> Dict[str, int]:
+        """Last exported ids of the incremental tables"""
+        path = self.target_dir / self.STATE_FILE
+        if not path.exists():
+            return {}
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    def __save_state(self, state: Dict[str, int]):
+        path = self.target_dir / self.STATE_FILE
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_text(json.dumps(state, indent=2), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+    @property
+    def __extension(self) -> str:
+        return "parquet" if self.file_format == "parquet" else "csv.gz"
+
+    def __chunks(self, table: Table, after_id: int | None, since: datetime | None,
+    until: datetime | None):
+        query = select(table).order_by(table.c.id).limit(self.chunk_size)
+        if table is Message.__table__:
+            if since is not None:
+                query = query.where(table.c.date_time >= since)
+            if until is not None:
+                query = query.where(table.c.date_time < until)
+        while True:
+            page = query if after_id is None else query.where(table.c.id > after_id)
+            with self.engine.connect() as connection:
+                chunk = [dict(row) for row in connection.execute(page).mappings()]
+            if chunk:
+                yield chunk
+            if len(chunk) < self.chunk_size:
+                return
+            after_id = chunk[-1]["id"]
+
+    def __open_writer(self, table: Table, path: Path):
+        if self.file_format == "parquet":
+            return _ParquetChunkWriter(table, path)
+        return _CsvChunkWriter(table, path)
+
+class _CsvChunkWriter:
+    def __init__(self, table: Table, path: Path):
+        self.columns = [column.name for column in table.columns]
+        self.file = gzip.open(path, "wt", encoding="utf-8", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.columns)
+
+    def write(self, chunk: List[Dict[str, Any]]):
+        """Append rows"""
+        self.writer.writerows([row[column] for column in self.columns] for row in chunk)
+
+    def close(self):
+        """Finish the file"""
+        self.file.close()
+
+class _ParquetChunkWriter:
+    def __init__(self, table: Table, path: Path):
+        self.schema = pyarrow.schema([
+            (column.name, self.__arrow_type(column.type)) for column in table.columns])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression="zstd")
+
+    def write(self, chunk: List[Dict[str, Any]]):
+        """Append rows as a row group"""
+        self.writer.write_table(pyarrow.Table.from_pylist(chunk, schema=self.schema))
+
+    def close(self):
+        """Finish the file"""
+        self.writer.close()
+
+    @staticmethod
+    def __arrow_type(column_type):
+        if isinstance(column_type, Boolean):
+            return pyarrow.bool_()
+        if isinstance(column_type, Integer):
+            return pyarrow.int64()
+        if isinstance(column_type, DateTime):
+            return pyarrow.timestamp("us")
+        return pyarrow.string()
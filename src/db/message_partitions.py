@@ -0,0 +1,208 @@
+"""The module implements monthly partitioning of the messages table on PostgreSQL,
+retention of old months and compaction of repeated callbacks"""
+
+import logging
+import re
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+from sqlalchemy import Engine, and_, delete, inspect, or_, select, text
+from db.models_msg_log import Message
+
+PARTITIONED_MESSAGES_DDL = """
+CREATE TABLE messages (
+    id SERIAL NOT NULL,
+    user_id BIGINT REFERENCES users (id),
+    chat_id BIGINT REFERENCES chats (id),
+    full_user_name VARCHAR(700),
+    date_time TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+    text VARCHAR(3000),
+    call_data VARCHAR(3000),
+    PRIMARY KEY (id, date_time)
+) PARTITION BY RANGE (date_time)
+"""
+
+def month_start(value: datetime, months: int = 0) -> datetime:
+    """First moment of the month of the value shifted by the number of months"""
+    index = value.year * 12 + value.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+class MessagePartitions:
+    """Partition management and maintenance of the messages table"""
+
+    PARTITION_NAME = re.compile(r"^messages_(\d{4})_(\d{2})$")
+    ARCHIVE_PREFIX = "messages_archive_"
+    DEFAULT_PARTITION = "messages_default"
+
+    def __init__(self, engine: Engine, logger: logging.Logger):
+        self.engine = engine
+        self.logger = logger
+
+    @property
+    def is_postgresql(self) -> bool:
+        """Partitioning is supported only on PostgreSQL"""
+        return self.engine.dialect.name == "postgresql"
+
+    def is_partitioned(self) -> bool:
+        """Check that the messages table is partitioned"""
+        if not self.is_postgresql:
+            return False
+        query = text(
+            "SELECT 1 FROM pg_partitioned_table pt "
+            "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = 'messages'"
+        )
+        with self.engine.connect() as connection:
+            return connection.execute(query).first() is not None
+
+    def create_table(self, months_ahead: int = 2) -> bool:
+        """Create the partitioned messages table if it does not exist yet.
+        Users and chats tables must already exist"""
+        if not self.is_postgresql or inspect(self.engine).has_table("messages"):
+            return False
+        with self.engine.begin() as connection:
+            connection.execute(text(PARTITIONED_MESSAGES_DDL))
+            connection.execute(text(
+                f"CREATE TABLE {self.DEFAULT_PARTITION} PARTITION OF messages DEFAULT"))
+        self.logger.info("Created partitioned messages table")
+        self.ensure_partitions(months_ahead)
+        return True
+
+    def ensure_partitions(self, months_ahead: int = 2, now: datetime | None = None):
+        """Create partitions for the current month and the next months_ahead months.
+        PostgreSQL refuses a partition whose range overlaps rows in the DEFAULT partition,
+        so a missing month is created as a plain table, its rows are moved out of DEFAULT
+        and the table is attached, all in one transaction with DEFAULT locked for writes"""
+        if not self.is_partitioned():
+            return
+        now = now or datetime.now()
+        with self.engine.begin() as connection:
+            has_default = self.__exists(connection, self.DEFAULT_PARTITION)
+            if has_default:
+                connection.execute(text(
+                    f"LOCK TABLE {self.DEFAULT_PARTITION} IN SHARE ROW EXCLUSIVE MODE"))
+            for shift in range(months_ahead + 1):
+                start = month_start(now, shift)
+                end = month_start(now, shift + 1)
+                name = f"messages_{start:%Y_%m}"
+                if self.__exists(connection, name):
+                    continue
+                bounds = f"FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+                if not has_default:
+                    connection.execute(text(
+                        f"CREATE TABLE {name} PARTITION OF messages FOR VALUES {bounds}"))
+                    continue
+                connection.execute(text(f"CREATE TABLE {name} "
+                    "(LIKE messages INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+                moved = connection.execute(text(
+                    f"WITH moved AS (DELETE FROM {self.DEFAULT_PARTITION} "
+                    f"WHERE date_time >= '{start:%Y-%m-%d}' AND date_time < '{end:%Y-%m-%d}' "
+                    f"RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+                )).rowcount
+                connection.execute(text(
+                    f"ALTER TABLE messages ATTACH PARTITION {name} FOR VALUES {bounds}"))
+                if moved:
+                    self.logger.info("Moved %d rows from %s to %s",
+                        moved, self.DEFAULT_PARTITION, name)
+
+    def partitions(self) -> List[Tuple[str, datetime]]:
+        """Monthly partitions with the first day of their month, oldest first"""
+        if not self.is_partitioned():
+            return []
+        query = text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = 'messages'"
+        )
+        with self.engine.connect() as connection:
+            names = [row[0] for row in connection.execute(query)]
+        result = []
+        for name in names:
+            match = self.PARTITION_NAME.match(name)
+            if match:
+                result.append((name, datetime(int(match[1]), int(match[2]), 1)))
+        return sorted(result, key=lambda item: item[1])
+
+    def apply_retention(self, keep_months: int, archive: bool = False,
+    now: datetime | None = None, batch_size: int = 10000) -> int:
+        """Remove messages older than keep_months full months.
+        Partitions are dropped or, with archive, detached and renamed to messages_archive_*.
+        Without partitioning old rows are deleted in batches. Returns the number of
+        removed partitions or rows"""
+        cutoff = month_start(now or datetime.now(), -keep_months)
+        if not self.is_partitioned():
+            return self.__delete_before(cutoff, batch_size)
+        removed = 0
+        for name, start in self.partitions():
+            if month_start(start, 1) > cutoff:
+                continue
+            with self.engine.begin() as connection:
+                connection.execute(text(f"ALTER TABLE messages DETACH PARTITION {name}"))
+                if archive:
+                    archive_name = self.ARCHIVE_PREFIX + name.removeprefix("messages_")
+                    connection.execute(text(f"ALTER TABLE {name} RENAME TO {archive_name}"))
+                else:
+                    connection.execute(text(f"DROP TABLE {name}"))
+            self.logger.info("Partition %s %s", name, "archived" if archive else "dropped")
+            removed += 1
+        return removed
+
+    def compact_callbacks(self, older_than: datetime, window: timedelta,
+    batch_size: int = 1000) -> int:
+        """Delete repeated presses of the same button: messages with the same user, chat
+        and call_data within window of the previous one. Returns the number of deleted rows"""
+        table = Message.__table__
+        last_seen: Dict[tuple, datetime] = {}
+        duplicates: List[int] = []
+        deleted = 0
+        after = None
+        while True:
+            rows = self.__callbacks_page(older_than, after, batch_size)
+            for row in rows:
+                key = (row.user_id, row.chat_id, row.call_data)
+                previous = last_seen.get(key)
+                if previous is not None and row.date_time - previous <= window:
+                    duplicates.append(row.id)
+                else:
+                    last_seen[key] = row.date_time
+            if rows:
+                after = (rows[-1].date_time, rows[-1].id)
+                horizon = after[0] - window
+                last_seen = {k: v for k, v in last_seen.items() if v >= horizon}
+            if len(duplicates) >= batch_size or (duplicates and len(rows) < batch_size):
+                with self.engine.begin() as connection:
+                    connection.execute(delete(table).where(table.c.id.in_(duplicates)))
+                deleted += len(duplicates)
+                duplicates = []
+            if len(rows) < batch_size:
+                return deleted
+
+    @staticmethod
+    def __exists(connection, name: str) -> bool:
+        return connection.execute(
+            text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}).scalar()
+
+    def __callbacks_page(self, older_than: datetime, after: Tuple[datetime, int] | None,
+    limit: int) -> list:
+        table = Message.__table__
+        query = select(table.c.id, table.c.date_time, table.c.user_id,
+            table.c.chat_id, table.c.call_data).where(
+            table.c.call_data.is_not(None), table.c.date_time < older_than)
+        if after is not None:
+            query = query.where(or_(
+                table.c.date_time > after[0],
+                and_(table.c.date_time == after[0], table.c.id > after[1]),
+            ))
+        query = query.order_by(table.c.date_time, table.c.id).limit(limit)
+        with self.engine.connect() as connection:
+            return connection.execute(query).all()
+
+    def __delete_before(self, cutoff: datetime, batch_size: int) -> int:
+        table = Message.__table__
+        deleted = 0
+        while True:
+            ids = select(table.c.id).where(table.c.date_time < cutoff).limit(batch_size)
+            with self.engine.begin() as connection:
+                count = connection.execute(
+                    delete(table).where(table.c.id.in_(ids.scalar_subquery()))).rowcount
+            deleted += count
+            if count < batch_size:
+                return deleted
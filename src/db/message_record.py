@@ -0,0 +1,42 @@
+"""The module contains a plain record of the message log
+that is passed between the bot and the database layer"""
+
+import dataclasses
+from datetime import datetime
+from typing import Any, Dict
+
+@dataclasses.dataclass
+class MessageRecord:
+    """Message log record with the user and chat it belongs to"""
+    user: Dict[str, Any]
+    chat: Dict[str, Any]
+    text: str | None
+    call_data: str | None
+    date_time: datetime = dataclasses.field(default_factory=datetime.now)
+
+    @property
+    def full_user_name(self) -> str:
+        """User name in the message log format"""
+        return f"{self.user.get('username')} - {self.user.get('full_name')}"
+
+    def message_row(self) -> Dict[str, Any]:
+        """Values of the messages table row"""
+        return {
+            "user_id": self.user["id"],
+            "chat_id": self.chat["id"],
+            "full_user_name": self.full_user_name,
+            "date_time": self.date_time,
+            "text": self.text,
+            "call_data": self.call_data,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-compatible representation of the record"""
+        data = dataclasses.asdict(self)
+        data["date_time"] = self.date_time.isoformat()
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "MessageRecord":
+        """Restore the record from to_dict output"""
+        return cls(**{**data, "date_time": datetime.fromisoformat(data["date_time"])})
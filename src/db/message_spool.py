@@ -0,0 +1,143 @@
+"""The module implements a local append-only spool file for message log records
+that could not be saved to the database.
+Each record is stored as a 4-byte big-endian length followed by the record JSON.
+Replay progress is kept in a separate offset file, so a restart does not save
+already replayed records again. A record torn by a crash is cut off before the next append,
+a record that is JSON but not a message log record is moved to the .rejected file on replay"""
+
+import json
+import os
+import struct
+import time
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Tuple
+from db.message_record import MessageRecord
+
+class MessageSpool:
+    """Length-prefixed JSON records in a file. Not thread-safe, used by one writer thread"""
+
+    _HEADER = struct.Struct(">I")
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.replay_path = self.path.with_name(self.path.name + ".replay")
+        self.offset_path = self.path.with_name(self.path.name + ".offset")
+        self.rejected_path = self.path.with_name(self.path.name + ".rejected")
+        self.rejected = 0
+        self.__next_offset: int | None = None
+        self.__tail_checked = False
+
+    def append(self, records: List[MessageRecord]):
+        """Append records and flush them to disk"""
+        if not self.__tail_checked:
+            self.__truncate_torn_tail()
+            self.__tail_checked = True
+        with open(self.path, "ab") as file:
+            for record in records:
+                data = json.dumps(record.to_dict(), ensure_ascii=False).encode("utf-8")
+                file.write(self._HEADER.pack(len(data)) + data)
+            file.flush()
+            os.fsync(file.fileno())
+
+    def has_records(self) -> bool:
+        """Check whether there are records waiting for replay"""
+        return self.path.exists() or self.replay_path.exists()
+
+    def read_batch(self, batch_size: int) -> List[MessageRecord]:
+        """Read the next batch of spooled records. The spool file is moved aside
+        before replay so new records go to a fresh file. Returns an empty list
+        when everything was replayed"""
+        while True:
+            if not self.replay_path.exists():
+                if not self.path.exists():
+                    return []
+                self.path.rename(self.replay_path)
+                self.__write_offset(0)
+            records, self.__next_offset = self.__read(self.__read_offset(), batch_size)
+            if records:
+                return records
+            self.replay_path.unlink()
+            self.offset_path.unlink(missing_ok=True)
+
+    def commit(self):
+        """Mark the batch returned by read_batch as saved"""
+        if self.__next_offset is not None:
+            self.__write_offset(self.__next_offset)
+            self.__next_offset = None
+
+    def quarantine(self) -> Path | None:
+        """Move aside the replay file that can not be read, so replay goes on with
+        the records spooled after it. Returns the new path of the file"""
+        if not self.replay_path.exists():
+            return None
+        bad_path = self.path.with_name(f"{self.path.name}.bad-{time.time_ns()}")
+        self.replay_path.rename(bad_path)
+        self.offset_path.unlink(missing_ok=True)
+        self.__next_offset = None
+        return bad_path
+
+    def __frames(self, file: BinaryIO) -> Iterator[Tuple[bytes, int]]:
+        """Yield complete records and the offset after each of them"""
+        while True:
+            header = file.read(self._HEADER.size)
+            if len(header) < self._HEADER.size:
+                return
+            (length,) = self._HEADER.unpack(header)
+            data = file.read(length)
+            if len(data) < length:
+                # the last write was interrupted
+                return
+            yield data, file.tell()
+
+    def __truncate_torn_tail(self):
+        """Cut the file after the last record that can be parsed"""
+        try:
+            with open(self.path, "r+b") as file:
+                end = 0
+                for data, offset in self.__frames(file):
+                    try:
+                        json.loads(data.decode("utf-8"))
+                    except ValueError:
+                        break
+                    end = offset
+                if end < file.seek(0, os.SEEK_END):
+                    file.truncate(end)
+        except FileNotFoundError:
+            pass
+
+    def __read(self, offset: int, batch_size: int) -> Tuple[List[MessageRecord], int]:
+        """Raises ValueError if a record is damaged"""
+        records: List[MessageRecord] = []
+        with open(self.replay_path, "rb") as file:
+            file.seek(offset)
+            for data, end in self.__frames(file):
+                record = self.__parse(data)
+                offset = end
+                if record is not None:
+                    records.append(record)
+                if len(records) >= batch_size:
+                    break
+        return records, offset
+
+    def __parse(self, data: bytes) -> MessageRecord | None:
+        """Raises ValueError if the data is not JSON, records of an unknown format
+        are appended to the rejected file and None is returned"""
+        value = json.loads(data.decode("utf-8"))
+        try:
+            return MessageRecord.from_dict(value)
+        except (KeyError, TypeError, ValueError):
+            with open(self.rejected_path, "ab") as file:
+                file.write(self._HEADER.pack(len(data)) + data)
+            self.rejected += 1
+            return None
+
+    def __read_offset(self) -> int:
+        try:
+            return int(self.offset_path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def __write_offset(self, offset: int):
+        tmp_path = self.offset_path.with_name(self.offset_path.name + ".tmp")
+        tmp_path.write_text(str(offset), encoding="utf-8")
+        os.replace(tmp_path, self.offset_path)
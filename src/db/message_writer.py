@@ -0,0 +1,148 @@
+"""The module implements write-behind persistence of the message log:
+records are queued in memory and saved to the database in batches by a background thread.
+While the database is unavailable batches go to a local spool file and are replayed later"""
+
+import logging
+import queue
+import threading
+import time
+from typing import List
+from bot_circuit_breaker import CircuitBreaker
+from db.storage_worker import StorageWorker
+from db.message_record import MessageRecord
+from db.message_spool import MessageSpool
+
+class MessageLogWriter: # pylint: disable=too-many-instance-attributes
+    """Background batch writer of message log records"""
+
+    def __init__(self, storage_worker: StorageWorker, logger: logging.Logger, # pylint: disable=too-many-arguments,too-many-positional-arguments
+    batch_size: int = 100, flush_interval: float = 1.0, queue_size: int = 10000,
+    spool: MessageSpool | None = None, breaker: CircuitBreaker | None = None):
+        self.storage_worker = storage_worker
+        self.logger = logger
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool = spool
+        self.breaker = breaker or CircuitBreaker(failure_threshold=3, reset_timeout=30.0)
+        self.dropped = 0
+        self.saved = 0
+        self.spooled = 0
+        self.replayed = 0
+        self.__has_spooled = spool is not None and spool.has_records()
+        self.__queue: queue.Queue = queue.Queue(queue_size)
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, name="message-log-writer", daemon=True)
+        self.__thread.start()
+
+    def write(self, record: MessageRecord) -> bool:
+        """Queue the record without waiting. Returns False if the queue is full"""
+        try:
+            self.__queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            self.logger.warning("Message log queue is full, record dropped")
+            return False
+
+    @property
+    def pending(self) -> int:
+        """Number of records waiting to be saved"""
+        return self.__queue.qsize()
+
+    def close(self, timeout: float = 5.0):
+        """Flush queued records and stop the writer, waiting at most timeout seconds"""
+        self.__stop.set()
+        self.__thread.join(timeout)
+        if self.__thread.is_alive():
+            self.logger.error("Message log writer did not finish, %d records lost", self.pending)
+
+    def __run(self):
+        while not (self.__stop.is_set() and self.__queue.empty()):
+            batch = self.__collect_batch()
+            if batch:
+                self.__flush(batch)
+            elif self.__has_spooled:
+                self.__replay()
+
+    def __collect_batch(self) -> List[MessageRecord]:
+        batch: List[MessageRecord] = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if self.__stop.is_set():
+                remaining = 0
+            try:
+                if remaining > 0:
+                    batch.append(self.__queue.get(timeout=remaining))
+                else:
+                    batch.append(self.__queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def __flush(self, batch: List[MessageRecord]):
+        if self.__save(batch):
+            self.__replay()
+            return
+        if self.spool is None:
+            self.dropped += len(batch)
+            return
+        try:
+            self.spool.append(batch)
+            self.spooled += len(batch)
+            self.__has_spooled = True
+        except OSError as ex:
+            self.dropped += len(batch)
+            self.logger.error("Failed to spool %d message log records", len(batch))
+            self.logger.exception(ex)
+
+    def __save(self, batch: List[MessageRecord]) -> bool:
+        if not self.breaker.allow():
+            return False
+        try:
+            self.storage_worker.save_records(batch)
+        except Exception as ex: # pylint: disable=broad-except
+            self.breaker.record_failure()
+            self.logger.info("Failed to save to DB")
+            self.logger.exception(ex)
+            return False
+        self.breaker.record_success()
+        self.saved += len(batch)
+        return True
+
+    def __replay(self):
+        """Save spooled batches while the live queue is short, so new records are not delayed"""
+        while self.__has_spooled and not self.__stop.is_set() \
+        and self.__queue.qsize() < self.batch_size:
+            rejected = self.spool.rejected
+            try:
+                records = self.spool.read_batch(self.batch_size)
+            except (ValueError, OSError, KeyError, TypeError) as ex:
+                self.logger.error("Message log spool can not be read: %s", ex)
+                if not self.__quarantine_spool():
+                    return
+                continue
+            if self.spool.rejected > rejected:
+                self.logger.error("%d malformed message log records moved to %s",
+                    self.spool.rejected - rejected, self.spool.rejected_path)
+            if not records:
+                self.__has_spooled = False
+                self.logger.info("Message log spool replayed")
+                return
+            if not self.__save(records):
+                return
+            self.spool.commit()
+            self.replayed += len(records)
+
+    def __quarantine_spool(self) -> bool:
+        """Move the damaged spool file aside. Returns False if replay has to stop"""
+        try:
+            bad_path = self.spool.quarantine()
+        except OSError as ex:
+            self.logger.exception(ex)
+            bad_path = None
+        if bad_path is None:
+            self.__has_spooled = False
+            return False
+        self.logger.error("Damaged message log spool moved to %s", bad_path)
+        return True
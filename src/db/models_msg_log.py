@@ -3,7 +3,7 @@ sqlalchemy.orm DeclarativeBase for describing tables"""
 
 import dataclasses
 from datetime import datetime
-from sqlalchemy import Boolean, Integer, String, Column, DateTime, ForeignKey, BigInteger
+from sqlalchemy import Boolean, Integer, String, Column, DateTime, ForeignKey, BigInteger, Index
 from sqlalchemy.orm import relationship, DeclarativeBase
 
 @dataclasses.dataclass
@@ -36,6 +36,10 @@ class Chat(Base):
 class Message(Base):
     """Definitions of the messages table"""
     __tablename__ = 'messages'
+    __table_args__ = (
+        Index("ix_messages_user_id_date_time", "user_id", "date_time"),
+        Index("ix_messages_chat_id_date_time", "chat_id", "date_time"),
+    )
     id = Column(Integer, primary_key=True)
     user_id = Column(BigInteger, ForeignKey('users.id'))
     user = relationship("User", back_populates="messages")
@@ -1,23 +1,78 @@
 """The module contains the implementation of methods for working with the database"""
 
-from typing import List
-from sqlalchemy import create_engine
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Tuple
+from sqlalchemy import Engine, and_, create_engine, insert, make_url, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
 from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy_utils import database_exists, create_database
 from db.models_msg_log import Base, User, Chat, Message
+from db.message_record import MessageRecord
+from db.identity_cache import IdentityCache
+from db.timed_pool import TimedQueuePool
+from db.message_partitions import MessagePartitions
 
 class StorageWorker:
     """Database operations"""
 
-    def __init__(self, connection_string: str):
+    USER_PROFILE_FIELDS = ("username", "first_name", "last_name", "full_name", "language_code")
+    CHAT_PROFILE_FIELDS = ("bio", "description")
+    UPSERT_DIALECTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+    def __init__(self, connection_string: str, cache_size: int = 10000, cache_ttl: float = 3600, # pylint: disable=too-many-arguments,too-many-positional-arguments
+    pool_options: Dict[str, Any] | None = None, statement_timeout: int | None = None,
+    bootstrap_schema: bool = True, partitioning: bool = False):
+        """pool_options - keyword arguments of the QueuePool (pool_size, max_overflow,
+        pool_timeout, pool_recycle, pool_pre_ping); statement_timeout - milliseconds,
+        PostgreSQL only; bootstrap_schema=False skips creating the database and tables;
+        partitioning - create a new messages table partitioned by month (PostgreSQL)"""
+        self.user_cache = IdentityCache(cache_size, cache_ttl)
+        self.chat_cache = IdentityCache(cache_size, cache_ttl)
         self.__connection_string = connection_string
-        self.__engine = create_engine(self.__connection_string)
-        if not database_exists(self.__engine.url):
-            create_database(self.__engine.url)
-        Base.metadata.create_all(self.__engine)
+        self.__engine = create_engine(self.__connection_string,
+            **self.__engine_options(connection_string, pool_options, statement_timeout))
+        if bootstrap_schema:
+            if not database_exists(self.__engine.url):
+                create_database(self.__engine.url)
+            if partitioning:
+                Base.metadata.create_all(self.__engine, tables=[User.__table__, Chat.__table__])
+                MessagePartitions(self.__engine, logging.getLogger(__name__)).create_table()
+            Base.metadata.create_all(self.__engine)
+            for index in Message.__table__.indexes:
+                index.create(self.__engine, checkfirst=True)
         session = sessionmaker(autocommit=False, autoflush=False, bind=self.__engine)
         self.__db_session = scoped_session(session)
 
+    @staticmethod
+    def __engine_options(connection_string: str, pool_options: Dict[str, Any] | None,
+    statement_timeout: int | None) -> Dict[str, Any]:
+        url = make_url(connection_string)
+        options: Dict[str, Any] = {}
+        # In-memory SQLite lives in a single connection and keeps its own pool
+        if not (url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")):
+            options["poolclass"] = TimedQueuePool
+            options.update(pool_options or {})
+        if statement_timeout and url.get_backend_name() == "postgresql":
+            options["connect_args"] = {"options": f"-c statement_timeout={statement_timeout}"}
+        return options
+
+    @property
+    def engine(self) -> Engine:
+        """Database engine"""
+        return self.__engine
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Get connection pool state and checkout wait time"""
+        pool = self.__engine.pool
+        stats: Dict[str, Any] = {"status": pool.status()}
+        if isinstance(pool, TimedQueuePool):
+            stats["checked_out"] = pool.checkedout()
+            stats["overflow"] = pool.overflow()
+            stats["checkout_wait"] = pool.checkout_wait.snapshot()
+        return stats
+
     def save_message(self, msg: Message):
         """Save message"""
         with self.__db_session() as session:
@@ -40,6 +95,105 @@ class StorageWorker:
             session.refresh(chat)
             return chat
 
+    def save_records(self, records: List[MessageRecord]):
+        """Save a batch of message log records in one transaction.
+        New users and chats are inserted, changed profiles are updated.
+        Identities known from the cache with unchanged profiles skip the database"""
+        users = {record.user["id"]: record.user for record in records}
+        chats = {record.chat["id"]: record.chat for record in records}
+        user_rows, user_profiles = self.__dirty_identities(users, self.user_cache,
+            self.USER_PROFILE_FIELDS)
+        chat_rows, chat_profiles = self.__dirty_identities(chats, self.chat_cache,
+            self.CHAT_PROFILE_FIELDS)
+        with self.__db_session() as session:
+            self.__save_identities(session, User, user_rows, self.USER_PROFILE_FIELDS)
+            self.__save_identities(session, Chat, chat_rows, self.CHAT_PROFILE_FIELDS)
+            session.execute(insert(Message), [record.message_row() for record in records])
+            session.commit()
+        self.__remember(self.user_cache, user_profiles)
+        self.__remember(self.chat_cache, chat_profiles)
+
+    def upsert_record(self, record: MessageRecord):
+        """Save one message log record with its user and chat in one transaction.
+        On PostgreSQL the user and chat upserts are CTEs of the message insert,
+        so the whole record costs a single statement"""
+        user_rows, user_profiles = self.__dirty_identities({record.user["id"]: record.user},
+            self.user_cache, self.USER_PROFILE_FIELDS)
+        chat_rows, chat_profiles = self.__dirty_identities({record.chat["id"]: record.chat},
+            self.chat_cache, self.CHAT_PROFILE_FIELDS)
+        with self.__db_session() as session:
+            if self.__engine.dialect.name == "postgresql":
+                statement = insert(Message).values(record.message_row())
+                if user_rows:
+                    user_upsert = self.__upsert_statement(User, self.USER_PROFILE_FIELDS,
+                        user_rows[0])
+                    statement = statement.add_cte(user_upsert.cte("user_upsert"))
+                if chat_rows:
+                    chat_upsert = self.__upsert_statement(Chat, self.CHAT_PROFILE_FIELDS,
+                        chat_rows[0])
+                    statement = statement.add_cte(chat_upsert.cte("chat_upsert"))
+                session.execute(statement)
+            else:
+                self.__save_identities(session, User, user_rows, self.USER_PROFILE_FIELDS)
+                self.__save_identities(session, Chat, chat_rows, self.CHAT_PROFILE_FIELDS)
+                session.execute(insert(Message).values(record.message_row()))
+            session.commit()
+        self.__remember(self.user_cache, user_profiles)
+        self.__remember(self.chat_cache, chat_profiles)
+
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """Get hit and miss counters of the identity caches"""
+        return {"users": self.user_cache.stats(), "chats": self.chat_cache.stats()}
+
+    @staticmethod
+    def __dirty_identities(rows: Dict[int, dict], cache: IdentityCache,
+    fields: Tuple[str, ...]) -> Tuple[List[dict], Dict[int, tuple]]:
+        """Get rows that are missing in the cache or differ from it,
+        and the profiles to put into the cache after commit"""
+        profiles = {key: tuple(row.get(field) for field in fields) for key, row in rows.items()}
+        dirty = [rows[key] for key, profile in profiles.items() if cache.get(key) != profile]
+        return dirty, profiles
+
+    @staticmethod
+    def __remember(cache: IdentityCache, profiles: Dict[int, tuple]):
+        for key, profile in profiles.items():
+            cache.put(key, profile)
+
+    def __save_identities(self, session: Session, model: type, rows: List[dict],
+    fields: Tuple[str, ...]):
+        """Insert missing and update changed rows of users or chats"""
+        if not rows:
+            return
+        if self.__engine.dialect.name in self.UPSERT_DIALECTS:
+            session.execute(self.__upsert_statement(model, fields), rows)
+            return
+        columns = [getattr(model, field) for field in fields]
+        query = select(model.id, *columns).where(model.id.in_([row["id"] for row in rows]))
+        stored = {row[0]: tuple(row[1:]) for row in session.execute(query)}
+        new_rows = [row for row in rows if row["id"] not in stored]
+        changed = [
+            row for row in rows
+            if row["id"] in stored and stored[row["id"]] != tuple(row.get(f) for f in fields)
+        ]
+        if new_rows:
+            session.execute(insert(model), new_rows)
+        if changed:
+            session.execute(update(model), changed)
+
+    def __upsert_statement(self, model: type, fields: Tuple[str, ...], row: dict | None = None):
+        """INSERT ... ON CONFLICT (id) DO UPDATE of the profile fields that changed"""
+        statement = self.UPSERT_DIALECTS[self.__engine.dialect.name](model)
+        if row is not None:
+            statement = statement.values(row)
+        return statement.on_conflict_do_update(
+            index_elements=[model.id],
+            set_={field: statement.excluded[field] for field in fields},
+            where=or_(*(
+                getattr(model, field).is_distinct_from(statement.excluded[field])
+                for field in fields
+            )),
+        )
+
     def get_messages(self) -> List[Message]:
         """Get list messages"""
         with self.__db_session() as session:
@@ -47,10 +201,44 @@ class StorageWorker:
             return messages
 
     def get_user_messages(self, user: User) -> List[Message]:
-        """Get list users"""
+        """Get list of user messages"""
+        return list(self.iter_messages(user_id=user.id))
+
+    def get_messages_page(self, user_id: int | None = None, chat_id: int | None = None, # pylint: disable=too-many-arguments,too-many-positional-arguments
+    since: datetime | None = None, until: datetime | None = None,
+    after: Tuple[datetime, int] | None = None, limit: int = 100) -> List[Message]:
+        """Get a page of messages ordered by date_time and id.
+        after - (date_time, id) of the last message of the previous page"""
+        query = select(Message)
+        if user_id is not None:
+            query = query.where(Message.user_id == user_id)
+        if chat_id is not None:
+            query = query.where(Message.chat_id == chat_id)
+        if since is not None:
+            query = query.where(Message.date_time >= since)
+        if until is not None:
+            query = query.where(Message.date_time < until)
+        if after is not None:
+            after_date_time, after_id = after
+            query = query.where(or_(
+                Message.date_time > after_date_time,
+                and_(Message.date_time == after_date_time, Message.id > after_id),
+            ))
+        query = query.order_by(Message.date_time, Message.id).limit(limit)
         with self.__db_session() as session:
-            messages = session.query(Message).filter(User.id == user.id).all()
-            return messages
+            return list(session.scalars(query))
+
+    def iter_messages(self, user_id: int | None = None, chat_id: int | None = None,
+    since: datetime | None = None, until: datetime | None = None,
+    page_size: int = 1000) -> Iterator[Message]:
+        """Iterate over messages page by page, keeping at most one page in memory"""
+        after = None
+        while True:
+            page = self.get_messages_page(user_id, chat_id, since, until, after, page_size)
+            yield from page
+            if len(page) < page_size:
+                return
+            after = (page[-1].date_time, page[-1].id)
 
     def get_user(self, user_id: str) -> User:
         """Get user"""
@@ -0,0 +1,25 @@
+"""The module contains a connection pool that measures how long
+sessions wait to check out a connection"""
+
+import time
+from sqlalchemy.pool import QueuePool
+from bot_metrics import LatencyStats
+
+class TimedQueuePool(QueuePool):
+    """QueuePool with checkout wait time statistics"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkout_wait = LatencyStats()
+
+    def recreate(self) -> "TimedQueuePool":
+        pool = super().recreate()
+        pool.checkout_wait = self.checkout_wait
+        return pool
+
+    def _do_get(self):
+        started_at = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.checkout_wait.observe(time.perf_counter() - started_at)
@@ -0,0 +1,36 @@
+"""Message log export for offline analytics: streams the users, chats and messages tables
+in chunks to gzip-compressed CSV or Parquet (with pyarrow installed) files:
+    python src/db_export.py <target_dir> [--since 2024-01-01] [--until 2024-02-01]
+    [--format csv|parquet] [--full]
+By default messages are exported incrementally from the id saved in the target directory,
+users and chats are exported in full. --since and --until export a one-off time window
+and leave the saved state untouched.
+Settings: CONECTION_PGDB"""
+
+import argparse
+import logging
+import os
+from datetime import datetime
+from db.storage_worker import StorageWorker
+from db.message_export import MessageExporter
+
+def main():
+    """Run the export with command line arguments"""
+    parser = argparse.ArgumentParser(description="Export the message log")
+    parser.add_argument("target_dir")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="messages from, ISO date")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="messages before, ISO date")
+    parser.add_argument("--format", choices=("csv", "parquet"), dest="file_format")
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--full", action="store_true", help="ignore the saved export state")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    logger = logging.getLogger("db_export")
+    storage_worker = StorageWorker(os.environ["CONECTION_PGDB"], bootstrap_schema=False)
+    exporter = MessageExporter(storage_worker.engine, logger, args.target_dir,
+        args.file_format, args.chunk_size)
+    exporter.export(args.since, args.until, incremental=not args.full)
+
+if __name__ == '__main__':
+    main()
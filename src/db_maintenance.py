@@ -0,0 +1,32 @@
+"""Message log maintenance: creates upcoming monthly partitions, removes old messages
+and compacts repeated callbacks. Intended to be run periodically, for example daily by cron:
+    python src/db_maintenance.py
+Settings: CONECTION_PGDB, DB_RETENTION_MONTHS, DB_RETENTION_ARCHIVE, DB_COMPACT_WINDOW"""
+
+import logging
+import os
+from datetime import datetime, timedelta
+from db.storage_worker import StorageWorker
+from db.message_partitions import MessagePartitions, month_start
+
+def main():
+    """Run retention and compaction with settings from environment variables"""
+    logging.basicConfig(level=logging.INFO)
+    logger = logging.getLogger("db_maintenance")
+    storage_worker = StorageWorker(os.environ["CONECTION_PGDB"], bootstrap_schema=False)
+    partitions = MessagePartitions(storage_worker.engine, logger)
+    partitions.ensure_partitions()
+
+    keep_months = int(os.environ.get("DB_RETENTION_MONTHS", "12"))
+    archive = os.environ.get("DB_RETENTION_ARCHIVE", "false").lower() in ("1", "true", "yes")
+    removed = partitions.apply_retention(keep_months, archive)
+    logger.info("Retention: %d removed", removed)
+
+    window = float(os.environ.get("DB_COMPACT_WINDOW", "0"))
+    if window > 0:
+        older_than = month_start(datetime.now())
+        deleted = partitions.compact_callbacks(older_than, timedelta(seconds=window))
+        logger.info("Compaction: %d repeated callbacks deleted", deleted)
+
+if __name__ == '__main__':
+    main()
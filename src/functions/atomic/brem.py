@@ -1,11 +1,12 @@
 """Модуль, присылающий цитаты"""
 
 from typing import List
-import requests
 import telebot
 from telebot import types
 from telebot.callback_data import CallbackData
 from bot_func_abc import AtomicBotFunctionABC
+from bot_fan_out import fan_out
+from bot_prefetch import PrefetchPool
 
 
 class AtomicExampleBotFunction(AtomicBotFunctionABC):
@@ -22,12 +23,14 @@ class AtomicExampleBotFunction(AtomicBotFunctionABC):
 
     bot: telebot.TeleBot
     example_keyboard_factory: CallbackData
+    __quotes: PrefetchPool
 
     def set_handlers(self, bot: telebot.TeleBot):
         self.bot = bot
         self.example_keyboard_factory = CallbackData(
             't_key_button', prefix=self.commands[0]
         )
+        self.__quotes = self.prefetcher.pool("quote", self.__get_quote)
 
         @bot.message_handler(commands=self.commands)
         def send_quote(message: types.Message):
@@ -48,14 +51,18 @@ class AtomicExampleBotFunction(AtomicBotFunctionABC):
 
     def get_quotes(self, num_quotes: int) -> List[str]:
         """Получает цитаты из API Breaking Bad."""
-        quotes = []
-        for _ in range(num_quotes):
-            response = requests.get(
-                "https://api.breakingbadquotes.xyz/v1/quotes", timeout=10
-            )
-            if response.status_code == 200:
-                data = response.json()[0]
-                quote = data['quote']
-                author = data['author']
-                quotes.append(f"Цитата: {quote}\nАвтор: {author}")
-        return quotes
+        quotes = self.__quotes.take(num_quotes)
+        result = fan_out(self.__get_quote, range(num_quotes - len(quotes)))
+        return quotes + [quote for quote in result.values if quote]
+
+    def __get_quote(self, _=None) -> str | None:
+        """Получает одну цитату."""
+        response = self.http.get(
+            "https://api.breakingbadquotes.xyz/v1/quotes", coalesce=False
+        )
+        if response.status_code != 200:
+            return None
+        data = response.json()[0]
+        quote = data['quote']
+        author = data['author']
+        return f"Цитата: {quote}\nАвтор: {author}"
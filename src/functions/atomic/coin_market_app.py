@@ -1,17 +1,18 @@
 """Module implementation of the atomic function for cryptocurrency market data using 
 CoinMarketCap API."""
 
+import asyncio
 import os
 import logging
 from typing import List, Dict, Any
-import requests
-import telebot
+import aiohttp
 from telebot import types
+from telebot.async_telebot import AsyncTeleBot
 from telebot.callback_data import CallbackData
-from bot_func_abc import AtomicBotFunctionABC
+from bot_async_func_abc import AsyncAtomicBotFunctionABC
 
 
-class AtomicCoinMarketFunction(AtomicBotFunctionABC):
+class AtomicCoinMarketFunction(AsyncAtomicBotFunctionABC):
     """Implementation of atomic function for cryptocurrency market data"""
 
     commands: List[str] = ["crypto", "market"]
@@ -25,40 +26,40 @@ class AtomicCoinMarketFunction(AtomicBotFunctionABC):
     """
     state: bool = True
 
-    bot: telebot.TeleBot
+    bot: AsyncTeleBot
     coin_keyboard_factory: CallbackData
 
     # API configuration
     API_URL_BASE = "https://pro-api.coinmarketcap.com/v1/"
     SANDBOX_URL_BASE = "https://sandbox-api.coinmarketcap.com/v1/"
 
-    def set_handlers(self, bot: telebot.TeleBot):
+    def set_handlers(self, bot: AsyncTeleBot):
         """Set message handlers"""
 
         self.bot = bot
         self.coin_keyboard_factory = CallbackData("action", "coin_id", prefix=self.commands[0])
 
         @bot.message_handler(commands=self.commands)
-        def crypto_message_handler(message: types.Message):
+        async def crypto_message_handler(message: types.Message):
             try:
                 command = message.text.split()[0][
                     1:
                 ]  # Remove the '/' and get the command
 
                 if command == "crypto":
-                    self.__handle_top_coins(message)
+                    await self.__handle_top_coins(message)
                 elif command == "market":
-                    self.__handle_market_info(message)
+                    await self.__handle_market_info(message)
                 else:
-                    self.__send_help(message)
+                    await self.__send_help(message)
             except (ValueError, IndexError) as ex:
                 logging.exception("Error processing command: %s", ex)
-                bot.reply_to(message, f"Произошла ошибка: {str(ex)}")
+                await bot.reply_to(message, f"Произошла ошибка: {str(ex)}")
 
         @bot.callback_query_handler(
             func=None, config=self.coin_keyboard_factory.filter()
         )
-        def coin_keyboard_callback(call: types.CallbackQuery):
+        async def coin_keyboard_callback(call: types.CallbackQuery):
             callback_data: dict = self.coin_keyboard_factory.parse(
                 callback_data=call.data
             )
@@ -67,16 +68,16 @@ class AtomicCoinMarketFunction(AtomicBotFunctionABC):
 
             try:
                 if action == "info":
-                    self.__send_coin_details(call.message.chat.id, coin_id)
+                    await self.__send_coin_details(call.message.chat.id, coin_id)
                 elif action == "price":
-                    self.__send_coin_price(call.message.chat.id, coin_id)
+                    await self.__send_coin_price(call.message.chat.id, coin_id)
                 elif action == "back":
-                    self.__handle_top_coins(call.message)
+                    await self.__handle_top_coins(call.message)
                 else:
-                    bot.answer_callback_query(call.id, "Неизвестное действие")
+                    await bot.answer_callback_query(call.id, "Неизвестное действие")
             except (ValueError, KeyError, RuntimeError) as ex:
                 logging.exception("Error processing callback: %s", ex)
-                bot.answer_callback_query(call.id, f"Ошибка: {str(ex)}")
+                await bot.answer_callback_query(call.id, f"Ошибка: {str(ex)}")
 
     def __get_api_key(self) -> str:
         """Get CoinMarketCap API key from environment variables"""
@@ -87,7 +88,7 @@ class AtomicCoinMarketFunction(AtomicBotFunctionABC):
             return "b54bcf4d-1bca-4e8e-9a24-22ff2c3d462c"
         return api_key
 
-    def __make_api_request(
+    async def __make_api_request(
         self, endpoint: str, params: Dict[str, Any] = None
     ) -> Dict[str, Any]:
         """Make a request to the CoinMarketCap API"""
@@ -102,40 +103,40 @@ class AtomicCoinMarketFunction(AtomicBotFunctionABC):
         url = f"{base_url}{endpoint}"
 
         try:
-            response = requests.get(url, headers=headers, params=params, timeout=10)
+            response = await self.http.get(url, headers=headers, params=params)
             response.raise_for_status()
             return response.json()
-        except requests.exceptions.RequestException as e:
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             logging.error("API request error: %s", e)
             raise RuntimeError(f"Ошибка API запроса: {str(e)}") from e
 
-    def __handle_top_coins(self, message: types.Message) -> None:
+    async def __handle_top_coins(self, message: types.Message) -> None:
         """Handle request for top cryptocurrencies"""
         chat_id = message.chat.id
 
-        self.bot.send_message(chat_id, "Получаю данные о топ-5 криптовалютах...")
+        await self.bot.send_message(chat_id, "Получаю данные о топ-5 криптовалютах...")
 
         try:
-            data = self.__make_api_request(
+            data = await self.__make_api_request(
                 "cryptocurrency/listings/latest",
                 {"start": "1", "limit": "5", "convert": "USD"},
             )
 
             if "data" not in data or not data["data"]:
-                self.bot.send_message(
+                await self.bot.send_message(
                     chat_id, "Не удалось получить данные о криптовалютах."
                 )
                 return
 
             response = self.__format_top_coins_response(data["data"])
             markup = self.__gen_coins_markup(data["data"])
-            self.bot.send_message(
+            await self.bot.send_message(
                 chat_id, response, parse_mode="Markdown", reply_markup=markup
             )
 
         except (KeyError, ValueError, RuntimeError) as ex:
             logging.exception("Error fetching top coins: %s", ex)
-            self.bot.send_message(chat_id, f"Ошибка при получении данных: {str(ex)}")
+            await self.bot.send_message(chat_id, f"Ошибка при получении данных: {str(ex)}")
     def __format_top_coins_response(self, coins_data: List[Dict[str, Any]]) -> str:
         """Format response for top coins"""
         response = "🔝 *Топ-5 криптовалют:*\n\n"
@@ -157,19 +158,19 @@ class AtomicCoinMarketFunction(AtomicBotFunctionABC):
             )
         return response
 
-    def __handle_market_info(self, message: types.Message) -> None:
+    async def __handle_market_info(self, message: types.Message) -> None:
         """Handle request for global market information"""
         chat_id = message.chat.id
 
-        self.bot.send_message(
+        await self.bot.send_message(
             chat_id, "Получаю данные о глобальном рынке криптовалют..."
         )
 
         try:
-            data = self.__make_api_request("global-metrics/quotes/latest")
+            data = await self.__make_api_request("global-metrics/quotes/latest")
 
             if "data" not in data:
-                self.bot.send_message(chat_id, "Не удалось получить данные о рынке.")
+                await self.bot.send_message(chat_id, "Не удалось получить данные о рынке.")
                 return
 
             market_data = data["data"]
@@ -195,17 +196,17 @@ class AtomicCoinMarketFunction(AtomicBotFunctionABC):
                 f"Доминирование ETH: {eth_dominance:.2f}%\n"
             )
 
-            self.bot.send_message(chat_id, response, parse_mode="Markdown")
+            await self.bot.send_message(chat_id, response, parse_mode="Markdown")
 
-        except (KeyError, ValueError, RuntimeError, requests.RequestException) as ex:
+        except (KeyError, ValueError, RuntimeError, aiohttp.ClientError) as ex:
             logging.exception("Error fetching market data: %s", ex)
-            self.bot.send_message(chat_id, f"Ошибка при получении данных: {str(ex)}")
+            await self.bot.send_message(chat_id, f"Ошибка при получении данных: {str(ex)}")
 
-    def __send_coin_details(self, chat_id: int, coin_id: str) -> None:
+    async def __send_coin_details(self, chat_id: int, coin_id: str) -> None:
         """Send detailed information about a specific coin"""
         try:
             # Get coin data
-            coin_data, quote_data = self.__fetch_coin_data(coin_id)
+            coin_data, quote_data = await self.__fetch_coin_data(coin_id)
 
             # Format response
             response = self.__format_coin_details(coin_data, quote_data)
@@ -213,7 +214,7 @@ class AtomicCoinMarketFunction(AtomicBotFunctionABC):
             # Create markup with actions
             markup = self.__create_coin_detail_markup(coin_id)
 
-            self.bot.send_message(
+            await self.bot.send_message(
                 chat_id,
                 response,
                 parse_mode="Markdown",
@@ -223,16 +224,16 @@ class AtomicCoinMarketFunction(AtomicBotFunctionABC):
 
         except (KeyError, ValueError, RuntimeError) as ex:
             logging.exception("Error fetching coin details: %s", ex)
-            self.bot.send_message(chat_id, f"Ошибка при получении данных: {str(ex)}")
+            await self.bot.send_message(chat_id, f"Ошибка при получении данных: {str(ex)}")
 
-    def __fetch_coin_data(self, coin_id: str):
+    async def __fetch_coin_data(self, coin_id: str):
         """Fetch coin data from API"""
-        # Get coin metadata
-        metadata = self.__make_api_request("cryptocurrency/info", {"id": coin_id})
-
-        # Get coin quotes
-        quotes = self.__make_api_request(
-            "cryptocurrency/quotes/latest", {"id": coin_id, "convert": "USD"}
+        # Get coin metadata and quotes at the same time
+        metadata, quotes = await asyncio.gather(
+            self.__make_api_request("cryptocurrency/info", {"id": coin_id}),
+            self.__make_api_request(
+                "cryptocurrency/quotes/latest", {"id": coin_id, "convert": "USD"}
+            ),
         )
 
         if (
@@ -308,16 +309,16 @@ class AtomicCoinMarketFunction(AtomicBotFunctionABC):
 
         return markup
 
-    def __send_coin_price(self, chat_id: int, coin_id: str) -> None:
+    async def __send_coin_price(self, chat_id: int, coin_id: str) -> None:
         """Send price information and chart for a specific coin"""
         try:
             # Get coin data
-            data = self.__make_api_request(
+            data = await self.__make_api_request(
                 "cryptocurrency/quotes/latest", {"id": coin_id, "convert": "USD"}
             )
 
             if "data" not in data or not data["data"]:
-                self.bot.send_message(chat_id, "Не удалось получить данные о цене.")
+                await self.bot.send_message(chat_id, "Не удалось получить данные о цене.")
                 return
 
             coin_data = data["data"][coin_id]
@@ -353,7 +354,7 @@ class AtomicCoinMarketFunction(AtomicBotFunctionABC):
                 )
             )
 
-            self.bot.send_message(
+            await self.bot.send_message(
                 chat_id,
                 response,
                 parse_mode="Markdown",
@@ -361,9 +362,9 @@ class AtomicCoinMarketFunction(AtomicBotFunctionABC):
                 reply_markup=markup,
             )
 
-        except (KeyError, ValueError, RuntimeError, requests.RequestException) as ex:
+        except (KeyError, ValueError, RuntimeError, aiohttp.ClientError) as ex:
             logging.exception("Error fetching coin price data: %s", ex)
-            self.bot.send_message(
+            await self.bot.send_message(
                 chat_id, f"Ошибка при получении данных о цене: {str(ex)}"
             )
 
@@ -395,7 +396,7 @@ class AtomicCoinMarketFunction(AtomicBotFunctionABC):
 
         return markup
 
-    def __send_help(self, message: types.Message) -> None:
+    async def __send_help(self, message: types.Message) -> None:
         """Send help information about available commands"""
         help_text = (
             "*Команды для работы с криптовалютами:*\n\n"
@@ -404,4 +405,4 @@ class AtomicCoinMarketFunction(AtomicBotFunctionABC):
             "Используйте эти команды для получения актуальной информации о криптовалютах."
         )
 
-        self.bot.send_message(message.chat.id, help_text, parse_mode="Markdown")
+        await self.bot.send_message(message.chat.id, help_text, parse_mode="Markdown")
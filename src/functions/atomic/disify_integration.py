@@ -18,7 +18,6 @@ class DisifyIntegrationFunction(AtomicBotFunctionABC):
     state: bool = True
 
     API_URL = "https://www.disify.com/api/email/"
-    TIMEOUT = 5
 
     bot: telebot.TeleBot
 
@@ -36,7 +35,7 @@ class DisifyIntegrationFunction(AtomicBotFunctionABC):
             email = args[1]
 
             try:
-                response = requests.get(f"{self.API_URL}{email}", timeout=self.TIMEOUT)
+                response = self.http.get(f"{self.API_URL}{email}")
                 response.raise_for_status()
             except requests.RequestException as err:
                 status = getattr(err.response, "status_code", "N/A")
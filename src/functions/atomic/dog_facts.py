@@ -39,6 +39,7 @@ class DogFactBotFunction(AtomicBotFunctionABC):
         :param bot: Экземпляр TeleBot.
         """
         self.bot = bot
+        facts_pool = self.prefetcher.pool("dogfact", self.__get_dog_fact)
 
         @self.bot.message_handler(commands=self.commands)
         def dog_fact_message_handler(message: types.Message):
@@ -56,13 +57,13 @@ class DogFactBotFunction(AtomicBotFunctionABC):
                     self.bot.send_message(chat_id=message.chat.id, text="Неверный формат числа.")
                     return
 
-            all_facts = []
+            all_facts = facts_pool.take(num_facts)
             while len(all_facts) < num_facts:
                 try:
-                    response = requests.get(
+                    response = self.http.get(
                         DogFactBotFunction.DOG_FACT_API_URL,
                         params={'limit': min(num_facts - len(all_facts), 10)},
-                        timeout=5
+                        coalesce=False
                     )
 
                     if response.status_code == 200:
@@ -89,6 +90,18 @@ class DogFactBotFunction(AtomicBotFunctionABC):
             )
             self.bot.send_message(chat_id=message.chat.id, text=msg)
 
+    def __get_dog_fact(self) -> str | None:
+        """
+        Получает один факт для пула предзагрузки.
+
+        :return: Факт или None, если API его не вернул.
+        """
+        response = self.http.get(DogFactBotFunction.DOG_FACT_API_URL,
+                                 params={'limit': 1}, coalesce=False)
+        response.raise_for_status()
+        facts = response.json()['facts']
+        return facts[0] if facts else None
+
     def check_bot_state(self) -> bool:
         """
         Проверяет состояние бота перед выполнением основной функции.
@@ -2,10 +2,10 @@
 
 from typing import List
 import json
-import requests
 from requests.exceptions import RequestException
 from telebot.types import Message
 from bot_func_abc import AtomicBotFunctionABC
+from bot_fan_out import fan_out
 
 
 class FactSvNFunction(AtomicBotFunctionABC):
@@ -20,6 +20,7 @@ class FactSvNFunction(AtomicBotFunctionABC):
 
     def set_handlers(self, bot):
         """Устанавливает обработчики команд для бота."""
+        facts_pool = self.prefetcher.pool("factsvn", self.__get_fact)
 
         @bot.message_handler(commands=self.commands)
         def handle_factsvn(message: Message):
@@ -31,17 +32,24 @@ class FactSvNFunction(AtomicBotFunctionABC):
                     count = int(arr[1])
                     count = min(count, 10)  # ограничим до 10 фактов
 
-                facts: List[str] = []
-                for i in range(count):
-                    response = requests.get(
-                        "https://uselessfacts.jsph.pl/api/v2/facts/random?language=en", timeout=5
-                    )
-                    response.raise_for_status()
-                    fact = response.json().get("text", "Не удалось получить факт.")
-                    facts.append(f"{i + 1}. {fact}")
+                ready = facts_pool.take(count)
+                result = fan_out(self.__get_fact, range(count - len(ready)))
+                if not ready and not result.values:
+                    raise (result.errors[0] if result.errors
+                        else RequestException("Превышено время ожидания"))
+                facts: List[str] = [f"{i + 1}. {fact}"
+                    for i, fact in enumerate(ready + result.values)]
 
                 message_text = "💡 Did you know?\n\n" + "\n\n".join(facts)
                 bot.send_message(message.chat.id, message_text)
 
             except (RequestException, json.JSONDecodeError) as e:
                 bot.send_message(message.chat.id, f"Произошла ошибка: {e}")
+
+    def __get_fact(self, _=None) -> str:
+        """Получает один случайный факт."""
+        response = self.http.get(
+            "https://uselessfacts.jsph.pl/api/v2/facts/random?language=en", coalesce=False
+        )
+        response.raise_for_status()
+        return response.json().get("text", "Не удалось получить факт.")
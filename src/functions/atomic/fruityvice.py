@@ -1,11 +1,12 @@
 """Модуль для работы с API фруктов через Telegram бота."""
 import logging
-from typing import List
+from typing import Dict, List
 import telebot
 import requests
 from telebot import types
 from telebot.callback_data import CallbackData
 from bot_func_abc import AtomicBotFunctionABC
+from bot_response_cache import CachePolicy
 
 class AtomicFruitBotFunction(AtomicBotFunctionABC):
     """Реализация функции бота для работы с вывода списка фруктов и
@@ -21,6 +22,9 @@ class AtomicFruitBotFunction(AtomicBotFunctionABC):
         "Источник данных: Fruityvice API, предоставляющий актуальную информацию о составе фруктов."
     )
     state: bool = True
+    cache_policies: Dict[str, CachePolicy] = {
+        "https://fruityvice.com/api/fruit/": CachePolicy(ttl=24 * 3600, stale_ttl=7 * 24 * 3600),
+    }
 
     bot: telebot.TeleBot
     fruit_keyboard_factory: CallbackData
@@ -76,7 +80,7 @@ class AtomicFruitBotFunction(AtomicBotFunctionABC):
     def get_all_fruits(self) -> str:
         """Получить список всех фруктов"""
         try:
-            response = requests.get(f"{self.api_url}/all", timeout=10)
+            response = self.http.get(f"{self.api_url}/all")
             response.raise_for_status()
             fruits = response.json()
             fruit_list = "\n".join([f"• {fruit['name']}" for fruit in fruits])
@@ -88,7 +92,7 @@ class AtomicFruitBotFunction(AtomicBotFunctionABC):
     def get_fruit_info(self, name: str) -> str:
         """Получить информацию о конкретном фрукте"""
         try:
-            response = requests.get(f"{self.api_url}/{name.lower()}", timeout=10)
+            response = self.http.get(f"{self.api_url}/{name.lower()}")
             response.raise_for_status()
             fruit = response.json()
 
@@ -24,7 +24,6 @@ class IceAndFireFunction(AtomicBotFunctionABC):
     state: bool = True
 
     BASE_URL = "https://anapioficeandfire.com/api/"
-    TIMEOUT = 15
     PAGE_SIZE = 10
 
     bot: telebot.TeleBot
@@ -86,9 +85,8 @@ class IceAndFireFunction(AtomicBotFunctionABC):
     def send_characters_page(self, chat_id: int, page: int = 1, call=None):
         """Отправляет список персонажей с кнопками выбора и пагинацией."""
         try:
-            response = requests.get(
-                f"{self.BASE_URL}characters?page={page}&pageSize={self.PAGE_SIZE}",
-                timeout=self.TIMEOUT
+            response = self.http.get(
+                f"{self.BASE_URL}characters?page={page}&pageSize={self.PAGE_SIZE}"
             )
             response.raise_for_status()
             characters = response.json()
@@ -118,7 +116,7 @@ class IceAndFireFunction(AtomicBotFunctionABC):
         """Показывает информацию о выбранном персонаже."""
         url = f"{self.BASE_URL}characters/{char_id}"
         try:
-            response = requests.get(url, timeout=self.TIMEOUT)
+            response = self.http.get(url)
             response.raise_for_status()
             character = response.json()
         except requests.RequestException:
@@ -1,11 +1,12 @@
 """Модуль для работы с ISO-кодами стран и их административными единицами."""
 
-from typing import List
+from typing import Dict, List
 import requests
 import telebot
 from telebot import types
 from telebot.callback_data import CallbackData
 from bot_func_abc import AtomicBotFunctionABC
+from bot_response_cache import CachePolicy
 
 class CountryCodesBot(AtomicBotFunctionABC):
     """Класс для получения ISO-кодов стран и их административных единиц."""
@@ -17,6 +18,11 @@ class CountryCodesBot(AtomicBotFunctionABC):
         "а после принимает код от пользователя и выводит в ответ административные единицы."
     )
     state: bool = True
+    cache_policies: Dict[str, CachePolicy] = {
+        "https://restcountries.com/v3.1/all": CachePolicy(ttl=24 * 3600, stale_ttl=7 * 24 * 3600),
+        "https://rawcdn.githack.com/kamikazechaser/administrative-divisions-db/":
+            CachePolicy(ttl=24 * 3600, stale_ttl=7 * 24 * 3600),
+    }
 
     bot: telebot.TeleBot
     example_keyboard_factory: CallbackData
@@ -52,7 +58,7 @@ class CountryCodesBot(AtomicBotFunctionABC):
     def get_iso_country_codes(self):
         """Получает список ISO-кодов стран."""
         url = "https://restcountries.com/v3.1/all"
-        response = requests.get(url, timeout=10)  # Добавлен таймаут
+        response = self.http.get(url)
 
         if response.status_code == 200:
             countries_data = response.json()
@@ -75,7 +81,7 @@ class CountryCodesBot(AtomicBotFunctionABC):
         url = url_part1 + url_part2
 
         try:
-            response = requests.get(url, timeout=10)  # Добавлен таймаут
+            response = self.http.get(url)
             response.raise_for_status()
             divisions = response.json()
             return divisions
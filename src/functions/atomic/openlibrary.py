@@ -3,8 +3,8 @@
 from typing import List
 import telebot
 from telebot import types
-import requests
 from bot_func_abc import AtomicBotFunctionABC
+from bot_media import send_photo
 
 class OpenLibraryBotFunction(AtomicBotFunctionABC):
     """Open Library API"""
@@ -27,34 +27,34 @@ class OpenLibraryBotFunction(AtomicBotFunctionABC):
             name = "+".join(message.text.replace(" ", "+").split("+")[1:])
             req = ("https://openlibrary.org/search.json?q=" + name +
                    "&page=1&limit=1&mode=everything")
-            r = requests.get(url=req, timeout=5)
+            r = self.http.get(url=req)
             bookdata = r.json()
             reply = (f"Автор: {bookdata['docs'][0]['author_name'][0]}, \nГод издания: "
                      f"{bookdata['docs'][0]['first_publish_year']}, "
                      f"\nСреднее количество страниц: "
                      f"{bookdata['docs'][0]['number_of_pages_median']}\n")
-            self.bot.send_photo(caption=reply, photo="https://covers.openlibrary.org/b/OLID/" + str(
-                dict(bookdata)["docs"][0]["cover_edition_key"]) + "-L.jpg", chat_id=message.chat.id)
+            send_photo(self.bot, message.chat.id, "https://covers.openlibrary.org/b/OLID/" + str(
+                dict(bookdata)["docs"][0]["cover_edition_key"]) + "-L.jpg", caption=reply)
 
         def __find_book_by_author(message):
             name = "+".join(message.text.replace(" ", "+").split("+")[1:])
             print(name)
             req = ("https://openlibrary.org/search/authors.json?q=" +
                    name + "&page=1&limit=3&mode=everything")
-            r = requests.get(url=req, timeout=5)
+            r = self.http.get(url=req)
             bookdata = r.json()
             print(bookdata)
-            r = requests.get(
+            r = self.http.get(
                 f"https://openlibrary.org/authors/{str(dict(bookdata)['docs'][0]['key'])}/"
-                f"works.json?limit=3", timeout=5)
+                f"works.json?limit=3")
             print(r.json())
             reply = f"Автор: {bookdata['docs'][0]['name']}\nПопулярные работы:\n"
             c = 1
             for e in r.json()["entries"]:
                 reply += str(c) + ') ' + e["title"] + '\n'
                 c += 1
-            bot.send_photo(caption=reply, photo="https://covers.openlibrary.org/a/OLID/" + str(
-                dict(bookdata)["docs"][0]["key"]) + "-L.jpg", chat_id=message.chat.id)
+            send_photo(bot, message.chat.id, "https://covers.openlibrary.org/a/OLID/" + str(
+                dict(bookdata)["docs"][0]["key"]) + "-L.jpg", caption=reply)
 
         @bot.message_handler(commands=[self.commands[0]])
         def find_book_by_name(message: types.Message):
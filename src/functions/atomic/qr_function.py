@@ -3,7 +3,6 @@
 from typing import List
 from io import BytesIO
 import telebot
-import requests
 from telebot import types
 from bot_func_abc import AtomicBotFunctionABC
 
@@ -69,7 +68,7 @@ class QRBotFunction(AtomicBotFunctionABC):
             if qrtype == "png":
                 self.bot.send_photo(chat_id=message.chat.id,photo=req)
             else:
-                response = requests.get(url=req, timeout=20)
+                response = self.http.get(url=req)
                 if response.status_code == 200:
                     svg_bytes = BytesIO(response.text.encode('utf-8'))
                     svg_bytes.name = 'output.svg'
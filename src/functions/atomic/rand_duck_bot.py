@@ -3,13 +3,16 @@
  Использует API RandomDuck.
  """
 
+import asyncio
 import logging
-import requests
-import telebot
+import aiohttp
 from telebot import types
-from bot_func_abc import AtomicBotFunctionABC
+from telebot.async_telebot import AsyncTeleBot
+from bot_async_func_abc import AsyncAtomicBotFunctionABC
+from bot_media import send_photos_async
+from bot_prefetch import PrefetchPool
 
-class AtomicRandomDuckBotFunction(AtomicBotFunctionABC):
+class AtomicRandomDuckBotFunction(AsyncAtomicBotFunctionABC):
 
     """
     Модуль для создания одной или нескольких картинок уток.
@@ -24,62 +27,72 @@ class AtomicRandomDuckBotFunction(AtomicBotFunctionABC):
                    /ducktype <gif|jpg|jpeg|png> - по типу.
                    """
     state = True
+    __images: PrefetchPool
 
     def __init__(self):
         self.bot = None
 
-    def set_handlers(self, bot: telebot.TeleBot):
+    def set_handlers(self, bot: AsyncTeleBot):
         """Set message handlers"""
         self.bot = bot
+        self.__images = self.prefetcher.pool("randomduck",
+            lambda: self.run_in_loop(self._get_random_duck_image()))
 
         @bot.message_handler(commands=self.commands)
-        def handle_commands(message: types.Message):
+        async def handle_commands(message: types.Message):
             cmd = message.text.split()[0][1:]
             if cmd == "randomduck":
-                self._send_duck_images(message, count=1)
+                await self._send_duck_images(message, count=1)
             elif cmd == "multiduck":
                 try:
                     count = int(message.text.split()[1])
                     if 1 <= count <= 7:
-                        self._send_duck_images(message, count)
+                        await self._send_duck_images(message, count)
                     else:
-                        bot.send_message(message.chat.id, "Число от 1 до 7!")
+                        await bot.send_message(message.chat.id, "Число от 1 до 7!")
                 except (IndexError, ValueError):
-                    bot.send_message(message.chat.id, "Использование: /multiduck <1-7>")
+                    await bot.send_message(message.chat.id, "Использование: /multiduck <1-7>")
             elif cmd == "ducktype":
                 try:
                     ext = message.text.split()[1].lower()
                     if ext in ('gif', 'jpg', 'jpeg', 'png'):
-                        self._send_duck_images(message, count=1, extension=ext)
+                        await self._send_duck_images(message, count=1, extension=ext)
                     else:
-                        bot.send_message(message.chat.id, "Тип: gif, jpg, jpeg, png")
+                        await bot.send_message(message.chat.id, "Тип: gif, jpg, jpeg, png")
                 except IndexError:
-                    bot.send_message(message.chat.id, "Использование: /ducktype <gif|jpg|jpeg|png>")
+                    await bot.send_message(message.chat.id,
+                        "Использование: /ducktype <gif|jpg|jpeg|png>")
 
-    def _send_duck_images(self, message: types.Message, count=1, extension=None):
-        images = self._get_random_duck_images(count, extension)
+    async def _send_duck_images(self, message: types.Message, count=1, extension=None):
+        images = await self._get_random_duck_images(count, extension)
         if not images:
-            self.bot.send_message(message.chat.id,
+            await self.bot.send_message(message.chat.id,
                                   f"Не удалось получить {'изо-ние' if count == 1 else 'изо-ния'}.")
             return
-        for img in images:
-            self.bot.send_photo(message.chat.id, img)
+        await send_photos_async(self.bot, message.chat.id, images)
 
-    def _get_random_duck_images(self, count=1, extension=None):
-        images = []
-        for _ in range(count * 7):
-            if len(images) >= count:
-                break
-            try:
-                response = requests.get("https://random-d.uk/api/v2/random", timeout=5)
-                response.raise_for_status()
-                img_url = response.json().get("url")
+    async def _get_random_duck_images(self, count=1, extension=None):
+        images = [] if extension else self.__images.take(count)
+        attempts = (count - len(images)) * 7
+        while len(images) < count and attempts > 0:
+            # Filtered and repeated URLs are dropped, so ask for more of them at once
+            batch = min(attempts, (count - len(images)) * (3 if extension else 1))
+            attempts -= batch
+            for img_url in await asyncio.gather(
+                *(self._get_random_duck_image() for _ in range(batch))):
                 if not isinstance(img_url, str):
                     continue
                 if extension and not img_url.lower().endswith(f".{extension}"):
                     continue
-                if img_url and img_url not in images:
+                if img_url and img_url not in images and len(images) < count:
                     images.append(img_url)
-            except (requests.exceptions.RequestException, ValueError) as ex:
-                logging.warning("Failed to fetch duck image: %s", ex)
         return images
+
+    async def _get_random_duck_image(self):
+        try:
+            response = await self.http.get("https://random-d.uk/api/v2/random", coalesce=False)
+            response.raise_for_status()
+            return response.json().get("url")
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as ex:
+            logging.warning("Failed to fetch duck image: %s", ex)
+            return None
@@ -1,15 +1,18 @@
 """Модуль для реализации функции бота для получения случайных картинок собак."""
 
+import asyncio
 import logging
 from typing import List
-import requests
-import telebot
+import aiohttp
 from telebot import types
+from telebot.async_telebot import AsyncTeleBot
 from telebot.callback_data import CallbackData
-from bot_func_abc import AtomicBotFunctionABC
+from bot_async_func_abc import AsyncAtomicBotFunctionABC
+from bot_media import send_photos_async
+from bot_prefetch import PrefetchPool
 
 
-class AtomicRandomDogBotFunction(AtomicBotFunctionABC):
+class AtomicRandomDogBotFunction(AsyncAtomicBotFunctionABC):
     """Реализация функции бота для получения случайных картинок собак."""
 
     commands: List[str] = ["randomdog", "rdog", "randog"]
@@ -20,53 +23,62 @@ class AtomicRandomDogBotFunction(AtomicBotFunctionABC):
     """
     state: bool = True
 
-    bot: telebot.TeleBot
+    bot: AsyncTeleBot
     dog_keyboard_factory: CallbackData
+    __images: PrefetchPool
 
-    def set_handlers(self, bot: telebot.TeleBot):
+    def set_handlers(self, bot: AsyncTeleBot):
         """Set message handlers"""
         self.bot = bot
         self.dog_keyboard_factory = CallbackData('dog_button', prefix=self.commands[0])
+        self.__images = self.prefetcher.pool("randomdog",
+            lambda: self.run_in_loop(self.__get_random_dog_image()))
 
         self.bot.message_handler(commands=self.commands)(self.random_dog_message_handler)
 
         @bot.callback_query_handler(func=None, config=self.dog_keyboard_factory.filter())
-        def dog_keyboard_callback(call: types.CallbackQuery):
+        async def dog_keyboard_callback(call: types.CallbackQuery):
             callback_data = self.dog_keyboard_factory.parse(callback_data=call.data)
             dog_button = callback_data['dog_button']
-            self._send_dog_images(call.message, dog_button)
+            await self._send_dog_images(call.message, dog_button)
 
-    def _send_dog_images(self, message: types.Message, dog_button: str):
+    async def _send_dog_images(self, message: types.Message, dog_button: str):
         """Helper method to send dog images based on the button pressed."""
         count = int(dog_button)
-        images = self.__get_random_dog_images(count)
-        for img in images:
-            self.bot.send_photo(chat_id=message.chat.id, photo=img)
+        images = await self.__get_random_dog_images(count)
+        # Up to 3 photos go as one album, a reply to the button
+        await send_photos_async(self.bot, message.chat.id, images)
 
-    def random_dog_message_handler(self, message: types.Message):
+    async def random_dog_message_handler(self, message: types.Message):
         """Handler for random dog message commands."""
         markup = self.__gen_markup()
-        self.bot.send_message(chat_id=message.chat.id, text="Choose qty pic:", reply_markup=markup)
+        await self.bot.send_message(chat_id=message.chat.id, text="Choose qty pic:",
+            reply_markup=markup)
 
-    def __get_random_dog_images(self, count=1):
+    async def __get_random_dog_images(self, count=1):
         """Fetches a given number of random dog images from Random Dog API."""
-        image_extensions = ('jpg', 'jpeg', 'png', 'gif')
-        images = []
-        attempts = 0
-        while len(images) < count and attempts < count * 2:
-            try:
-                response = requests.get("https://random.dog/woof.json", timeout=5)
-                img_url = response.json().get("url")
-                if not isinstance(img_url, str) or not img_url.endswith(image_extensions):
-                    attempts += 1
-                    continue
-                images.append(img_url)
-                attempts += 1
-            except (requests.exceptions.RequestException, ValueError) as ex:
-                logging.exception(ex)
-                attempts += 1
+        images: List[str] = self.__images.take(count)
+        attempts = (count - len(images)) * 2
+        while len(images) < count and attempts > 0:
+            batch = min(attempts, count - len(images))
+            attempts -= batch
+            results = await asyncio.gather(*(self.__get_random_dog_image() for _ in range(batch)))
+            images.extend(img_url for img_url in results if img_url)
         return images
 
+    async def __get_random_dog_image(self):
+        """Fetches one random dog image URL, None if it is not an image."""
+        image_extensions = ('jpg', 'jpeg', 'png', 'gif')
+        try:
+            response = await self.http.get("https://random.dog/woof.json", coalesce=False)
+            img_url = response.json().get("url")
+            if isinstance(img_url, str) and img_url.endswith(image_extensions):
+                return img_url
+            return None
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as ex:
+            logging.exception(ex)
+            return None
+
     def __gen_markup(self):
         markup = types.InlineKeyboardMarkup()
         markup.row_width = 3
@@ -3,7 +3,7 @@
 import logging
 import re
 from datetime import datetime
-from typing import List
+from typing import Dict, List
 
 import requests
 import telebot
@@ -11,6 +11,7 @@ from telebot import types
 from telebot.callback_data import CallbackData
 
 from bot_func_abc import AtomicBotFunctionABC
+from bot_response_cache import CachePolicy
 
 
 class AtomicStarTrekBotFunction(AtomicBotFunctionABC):
@@ -26,6 +27,10 @@ class AtomicStarTrekBotFunction(AtomicBotFunctionABC):
         "Источник данных: stapi.co"
     )
     state: bool = True
+    cache_policies: Dict[str, CachePolicy] = {
+        "https://stapi.co/api/v1/rest/movie/search":
+            CachePolicy(ttl=24 * 3600, stale_ttl=7 * 24 * 3600),
+    }
 
     bot: telebot.TeleBot
     movie_keyboard_factory: CallbackData
@@ -85,7 +90,7 @@ class AtomicStarTrekBotFunction(AtomicBotFunctionABC):
         try:
             url = "https://stapi.co/api/v1/rest/movie/search"
             params = {"title": "Star Trek"}
-            response = requests.get(url, params=params, timeout=10)
+            response = self.http.get(url, params=params)
             response.raise_for_status()
             data = response.json()
             return data.get('movies', [])
@@ -127,7 +132,7 @@ class AtomicStarTrekBotFunction(AtomicBotFunctionABC):
 
             url = "https://stapi.co/api/v1/rest/movie/search"
             params = {"title": title_clean}
-            response = requests.get(url, params=params, timeout=10)
+            response = self.http.get(url, params=params)
             response.raise_for_status()
             data = response.json()
             movies = data.get('movies', [])
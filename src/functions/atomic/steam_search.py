@@ -8,6 +8,7 @@ import requests
 from telebot import TeleBot, types
 from telebot.callback_data import CallbackData
 from bot_func_abc import AtomicBotFunctionABC
+from bot_sender import bulk_sends
 
 class GameDealsFunction(AtomicBotFunctionABC):
     """Функция для поиска игровых сделок с использованием CheapShark API."""
@@ -99,7 +100,7 @@ class GameDealsFunction(AtomicBotFunctionABC):
             params['title'] = title
 
         try:
-            response = requests.get(url, params=params, timeout=10)
+            response = self.http.get(url, params=params)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -113,11 +114,19 @@ class GameDealsFunction(AtomicBotFunctionABC):
             self.bot.send_message(chat_id, "Не найдено никаких сделок.")
             return
 
-        for deal in deals[:5]:  # Ограничиваем вывод первых 5 сделок
-            self.bot.send_message(
-                chat_id,
-                f"Название: {deal['title']}\n"
-                f"Цена: ${deal['salePrice']} (обычная: ${deal['normalPrice']})\n"
-                f"Скидка: {deal['savings']}%\n"
-                f"Ссылка: https://www.cheapshark.com/redirect?dealID={deal['dealID']}"
-            )
+        deals = deals[:5]  # Ограничиваем вывод первых 5 сделок
+        # The first deal answers the command, the rest wait for other users' replies
+        self.__send_deal(chat_id, deals[0])
+        with bulk_sends():
+            for deal in deals[1:]:
+                self.__send_deal(chat_id, deal)
+
+    def __send_deal(self, chat_id, deal):
+        """Отправляет одну сделку."""
+        self.bot.send_message(
+            chat_id,
+            f"Название: {deal['title']}\n"
+            f"Цена: ${deal['salePrice']} (обычная: ${deal['normalPrice']})\n"
+            f"Скидка: {deal['savings']}%\n"
+            f"Ссылка: https://www.cheapshark.com/redirect?dealID={deal['dealID']}"
+        )
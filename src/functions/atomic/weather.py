@@ -51,7 +51,7 @@ class WeatherBotFunction(AtomicBotFunctionABC):
             "lang": "ru"
         }
         try:
-            response = requests.get(self.api_url, params=params, timeout=10)
+            response = self.http.get(self.api_url, params=params)
             response.raise_for_status()
             data = response.json()
 
@@ -1,14 +1,40 @@
-"""The module contains the function of reading and loading atomic modules into a list"""
+"""The module contains the function of reading and loading atomic modules into a list.
+With a manifest of the commands and descriptions the modules are imported lazily,
+on the first command of the function. Async atomic functions are always imported at start"""
 
+import hashlib
 import inspect
+import json
+import logging
 import os
+import threading
+import time
 from pathlib import Path
-from typing import List
+from typing import Any, Dict, List
+import telebot
+from telebot import types
+from telebot.handler_backends import ContinueHandling
 from bot_func_abc import AtomicBotFunctionABC
+from bot_async_func_abc import AsyncAtomicBotFunctionABC
+from bot_http_client import HttpClient
+
+MANIFEST_FIELDS = ("commands", "authors", "about", "description", "state")
+
+# module name -> {"import": seconds, "init": seconds}
+load_times: Dict[str, Dict[str, float]] = {}
+_load_times_lock = threading.Lock()
+# Lazy functions find their new handlers by the sizes of the shared handler lists
+_set_handlers_lock = threading.Lock()
 
 def load_atomic_functions(func_dir:str = "functions",
-atomic_dir:str = "atomic") -> List[AtomicBotFunctionABC]:
-    """Loading atomic functions into a list"""
+atomic_dir:str = "atomic", manifest: str | None = None) -> List[AtomicBotFunctionABC]:
+    """Loading atomic functions (sync and async) into a list.
+    With an up-to-date manifest file the list contains LazyAtomicFunction proxies
+    of the sync functions"""
+    if manifest:
+        functions = _read_manifest(manifest, func_dir, atomic_dir)
+        if functions is not None:
+            return functions
     atomic_func_path = Path.cwd() / "src" / func_dir / atomic_dir
     suffix = ".py"
     lst = os.listdir(atomic_func_path)
@@ -16,11 +42,179 @@ atomic_dir:str = "atomic") -> List[AtomicBotFunctionABC]:
     for fn_str in lst:
         if suffix in fn_str:
             module_name = fn_str.removesuffix(suffix)
-            module = __import__(f"{func_dir}.{atomic_dir}.{module_name}", fromlist = ["*"])
-            for name, cls in inspect.getmembers(module):
-                if inspect.isclass(cls) and cls.__base__ is AtomicBotFunctionABC:
-                    obj: AtomicBotFunctionABC = cls()
-                    function_objects.append(obj)
-                    print(f"{name} - Added!")
+            for name, obj in _load_module(func_dir, atomic_dir, module_name):
+                function_objects.append(obj)
+                print(f"{name} - Added!")
     function_objects.sort(key=lambda f: f.commands[0], reverse=False)
     return function_objects
+
+def write_manifest(path: str, func_dir:str = "functions", atomic_dir:str = "atomic"):
+    """Load all atomic functions and save their commands and descriptions"""
+    entries = []
+    for funct in load_atomic_functions(func_dir, atomic_dir):
+        entry: Dict[str, Any] = {"module": type(funct).__module__.rsplit(".", 1)[-1],
+            "class": type(funct).__name__,
+            "async": isinstance(funct, AsyncAtomicBotFunctionABC)}
+        entry.update({field: getattr(funct, field) for field in MANIFEST_FIELDS})
+        entries.append(entry)
+    data = {"sources": _module_hashes(func_dir, atomic_dir), "functions": entries}
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(data, file, ensure_ascii=False, indent=1)
+
+def disable_duplicate_commands(functions: List[AtomicBotFunctionABC], reserved: List[str],
+logger: logging.Logger) -> Dict[str, str]:
+    """Turn off enabled functions that use a command of a reserved list or of an earlier function.
+    Returns the duplicate commands with the name of the function that keeps them"""
+    owners = {command: "start commands" for command in reserved}
+    duplicates: Dict[str, str] = {}
+    for funct in functions:
+        if not funct.state:
+            continue
+        taken = {command: owners[command] for command in funct.commands if command in owners}
+        if taken:
+            logger.error("%s - duplicate commands %s, state FALSE!", funct, taken)
+            funct.state = False
+            duplicates.update(taken)
+            continue
+        owners.update((command, str(funct)) for command in funct.commands)
+    return duplicates
+
+def load_report() -> List[Dict[str, Any]]:
+    """Import and constructor time of the loaded modules, the slowest first"""
+    with _load_times_lock:
+        times = dict(load_times)
+    report = [{"module": module, **timing, "total": sum(timing.values())}
+        for module, timing in times.items()]
+    report.sort(key=lambda row: row["total"], reverse=True)
+    return report
+
+class LazyAtomicFunction(AtomicBotFunctionABC): # pylint: disable=too-many-instance-attributes
+    """Proxy of an atomic function described in the manifest.
+    The module is imported and the handlers are set on the first command
+    or callback query (with data prefixed by one of the commands), then the update
+    is passed to the first of the new handlers that accepts it"""
+
+    commands: List[str] = []
+    authors: List[str] = []
+    about: str = ""
+    description: str = ""
+    state: bool = True
+
+    def __init__(self, entry: Dict[str, Any], func_dir: str = "functions",
+    atomic_dir: str = "atomic"):
+        for field in MANIFEST_FIELDS:
+            setattr(self, field, entry[field])
+        self.module_name: str = entry["module"]
+        self.class_name: str = entry["class"]
+        self.function: AtomicBotFunctionABC | None = None
+        self.loaded = False
+        self.__func_dir = func_dir
+        self.__atomic_dir = atomic_dir
+        self.__lock = threading.Lock()
+        self.__placeholders: Dict[str, Dict[str, Any]] = {}
+        self.__added: Dict[str, List[Dict[str, Any]]] = {}
+
+    def __str__(self) -> str:
+        return f"{self.class_name} (lazy)"
+
+    def set_handlers(self, bot: telebot.TeleBot):
+        """Set handlers that load the function"""
+        prefixes = tuple(f"{command}:" for command in self.commands)
+
+        @bot.message_handler(commands=self.commands, func=lambda _: not self.loaded)
+        def load_on_message(message: types.Message):
+            return self.load(bot, "message_handlers", message)
+
+        @bot.callback_query_handler(func=lambda call: not self.loaded
+            and (call.data or "").startswith(prefixes))
+        def load_on_callback(call: types.CallbackQuery):
+            return self.load(bot, "callback_query_handlers", call)
+
+        self.__placeholders = {"message_handlers": bot.message_handlers[-1],
+            "callback_query_handlers": bot.callback_query_handlers[-1]}
+
+    def load(self, bot: telebot.TeleBot, handlers_name: str,
+    update: types.Message | types.CallbackQuery) -> Any:
+        """Import the module, set its handlers in place of the loading handlers
+        and pass the update to them. ContinueHandling if none of them accepts it"""
+        self.ensure_loaded(bot)
+        for handler in self.__added.get(handlers_name, []):
+            if bot._test_message_handler(handler, update): # pylint: disable=protected-access
+                return handler["function"](update)
+        return ContinueHandling()
+
+    def ensure_loaded(self, bot: telebot.TeleBot) -> AtomicBotFunctionABC | None:
+        """Import the module and set its handlers if it is not loaded yet.
+        Returns the atomic function, None if it failed to load"""
+        with self.__lock:
+            if not self.loaded:
+                self.__load(bot)
+        return self.function if self.state else None
+
+    def __load(self, bot: telebot.TeleBot):
+        try:
+            self.function = _load_module(self.__func_dir, self.__atomic_dir,
+                self.module_name, self.class_name)[0][1]
+            HttpClient.default().cache.add_policies(self.function.cache_policies)
+            with _set_handlers_lock:
+                sizes = _handler_list_sizes(bot)
+                self.function.set_handlers(bot)
+                self.__move_new_handlers(bot, sizes)
+            logging.getLogger(__name__).info("%s - lazy start OK!", self.function)
+        except Exception as ex: # pylint: disable=broad-except
+            logging.getLogger(__name__).error("%s - lazy start EXCEPTION! %s", self, ex)
+            self.state = False
+        self.loaded = True
+
+    def __move_new_handlers(self, bot: telebot.TeleBot, sizes: Dict[str, int]):
+        for name, size in sizes.items():
+            handlers = getattr(bot, name)
+            placeholder = self.__placeholders.get(name)
+            if placeholder is None or len(handlers) == size:
+                continue
+            added = self.__added[name] = handlers[size:]
+            del handlers[size:]
+            index = handlers.index(placeholder) + 1
+            handlers[index:index] = added
+
+def _load_module(func_dir: str, atomic_dir: str, module_name: str,
+class_name: str | None = None) -> List[tuple]:
+    """Import the module and create its atomic functions, recording the time spent"""
+    started_at = time.perf_counter()
+    module = __import__(f"{func_dir}.{atomic_dir}.{module_name}", fromlist = ["*"])
+    imported_at = time.perf_counter()
+    objects = []
+    for name, cls in inspect.getmembers(module):
+        if inspect.isclass(cls) and not inspect.isabstract(cls) \
+        and cls.__base__ in (AtomicBotFunctionABC, AsyncAtomicBotFunctionABC) \
+        and class_name in (None, name):
+            objects.append((name, cls()))
+    with _load_times_lock:
+        load_times[module_name] = {"import": imported_at - started_at,
+            "init": time.perf_counter() - imported_at}
+    return objects
+
+def _read_manifest(path: str, func_dir: str, atomic_dir: str) -> List[AtomicBotFunctionABC] | None:
+    logger = logging.getLogger(__name__)
+    try:
+        with open(path, encoding="utf-8") as file:
+            data = json.load(file)
+    except (OSError, ValueError) as ex:
+        logger.warning("Atomic manifest %s is not loaded: %s", path, ex)
+        return None
+    if data.get("sources") != _module_hashes(func_dir, atomic_dir):
+        logger.warning("Atomic manifest %s is out of date, modules are loaded eagerly", path)
+        return None
+    # The handlers of async functions are set on another bot, they are not loaded lazily
+    return [_load_module(func_dir, atomic_dir, entry["module"], entry["class"])[0][1]
+        if entry.get("async") else LazyAtomicFunction(entry, func_dir, atomic_dir)
+        for entry in data["functions"]]
+
+def _module_hashes(func_dir: str, atomic_dir: str) -> Dict[str, str]:
+    atomic_func_path = Path.cwd() / "src" / func_dir / atomic_dir
+    return {path.name: hashlib.sha1(path.read_bytes()).hexdigest()
+        for path in sorted(atomic_func_path.glob("*.py"))}
+
+def _handler_list_sizes(bot: telebot.TeleBot) -> Dict[str, int]:
+    return {name: len(value) for name, value in vars(bot).items()
+        if name.endswith("_handlers") and isinstance(value, list)}
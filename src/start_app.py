@@ -1,39 +1,194 @@
 """Application setup and configuration"""
 
+import functools
 import logging
+import signal
 import sys
 import os
+import time
 from typing import List
 import telebot
+from telebot import types, apihelper
 from telebot.callback_data import CallbackData
-from load_atomic import load_atomic_functions
+from load_atomic import load_atomic_functions, load_report, disable_duplicate_commands
+from load_atomic import LazyAtomicFunction
 from bot_middleware import Middleware
 from bot_callback_filter import BotCallbackCustomFilter
 from bot_func_abc import AtomicBotFunctionABC
+from bot_async_func_abc import AsyncAtomicBotFunctionABC
+from bot_async_runtime import AsyncRuntime
+from bot_dispatcher import UpdateDispatcher
+from bot_shards import ShardSupervisor
+from bot_webhook import WebhookServer
+from bot_http_client import HttpClient
+from bot_media import FileIdCache
+from bot_fan_out import FanOut
+from bot_prefetch import Prefetcher
+from bot_sender import TelegramSender
+from bot_router import RoutedTeleBot
+from bot_step_store import StepHandlerStore
 from functions.defoult_bot_function import DefoultBotFunction
 
-class StartApp():
+class StartApp(): # pylint: disable=too-many-instance-attributes
     """Configuring and running the application"""
 
     _LOGLEVEL_ENV_KEY = "LOGLEVEL"
     _TBOT_LOGLEVEL_ENV_KEY = "TBOT_LOGLEVEL"
     _TBOTTOKEN_ENV_KEY = "TBOTTOKEN"
+    _DISPATCH_WORKERS_ENV_KEY = "DISPATCH_WORKERS"
+    _DISPATCH_QUEUE_SIZE_ENV_KEY = "DISPATCH_QUEUE_SIZE"
+    _WEBHOOK_URL_ENV_KEY = "WEBHOOK_URL"
+    _WEBHOOK_HOST_ENV_KEY = "WEBHOOK_HOST"
+    _WEBHOOK_PORT_ENV_KEY = "WEBHOOK_PORT"
+    _WEBHOOK_PATH_ENV_KEY = "WEBHOOK_PATH"
+    _WEBHOOK_SECRET_ENV_KEY = "WEBHOOK_SECRET"
+    _METRICS_PORT_ENV_KEY = "METRICS_PORT"
+    _SEND_GLOBAL_RATE_ENV_KEY = "SEND_GLOBAL_RATE"
+    _SEND_CHAT_RATE_ENV_KEY = "SEND_CHAT_RATE"
+    _SEND_CHAT_BURST_ENV_KEY = "SEND_CHAT_BURST"
+    _SEND_QUEUE_SIZE_ENV_KEY = "SEND_QUEUE_SIZE"
+    _ATOMIC_MANIFEST_ENV_KEY = "ATOMIC_MANIFEST"
+    _STEP_TTL_ENV_KEY = "STEP_HANDLER_TTL"
+    _STEP_MAX_SIZE_ENV_KEY = "STEP_HANDLER_MAX_SIZE"
+    _STEP_DB_ENV_KEY = "STEP_HANDLER_DB"
+    # Files written by every process: the message log spool and the file_id cache
+    SHARD_LOCAL_PATH_ENV_KEYS = ["DB_SPOOL_PATH", "FILE_ID_CACHE_PATH"]
+    # Limits of the whole bot with their defaults, every process gets its part
+    SHARD_DIVIDED_RATE_ENV_KEYS = {_SEND_GLOBAL_RATE_ENV_KEY: 30.0}
+    _POLLING_TIMEOUT = 20
+    _SHUTDOWN_TIMEOUT = 10
 
     keyboard_factory: CallbackData
 
-    def __init__(self, start_comannds: List[str]):
+    def __init__(self, start_comannds: List[str], shards: int = 1):
+        """shards > 1 - the process only receives updates
+        and passes them to the shard worker processes"""
         self.logger = self.get_logger()
+        self.sender = self.__get_sender()
+        self.atom_functions_list: List[AtomicBotFunctionABC] = []
+        self.step_store = self.__get_step_store()
         self.bot = self.__get_bot()
-        self.atom_functions_list = load_atomic_functions()
-        self.__decorate_atomic_functions()
+        self.dispatcher: UpdateDispatcher | ShardSupervisor
+        if shards > 1:
+            self.dispatcher = self.__get_shard_supervisor(start_comannds, shards)
+            return
+        self.async_runtime = AsyncRuntime(self.bot.token, self.logger, self.sender)
+        self.atom_functions_list = load_atomic_functions(
+            manifest=os.environ.get(self._ATOMIC_MANIFEST_ENV_KEY) or None)
+        self.__decorate_atomic_functions(start_comannds)
+        Prefetcher.default().start()
+        self.async_runtime.start()
         self.__decorate_defoult_functions(start_comannds, self.atom_functions_list)
         self.__add_middleware()
         self.__add_filter()
+        self.dispatcher = self.__get_dispatcher()
 
     def start_polling(self):
         """Start receiving messages"""
         self.logger.critical('-= START =-')
-        self.bot.infinity_polling()
+        self.dispatcher.start()
+        metrics_server = self.__get_metrics_server()
+        offset = None
+        try:
+            while True:
+                try:
+                    updates = self.bot.get_updates(offset=offset,
+                        timeout=self._POLLING_TIMEOUT, long_polling_timeout=self._POLLING_TIMEOUT)
+                except Exception as ex: # pylint: disable=broad-except
+                    self.logger.error("Polling exception: %s", ex)
+                    time.sleep(1)
+                    continue
+                for update in updates:
+                    offset = update.update_id + 1
+                    if not self.dispatcher.submit(update):
+                        self.logger.warning("Dispatcher queue is full, update %s dropped",
+                            update.update_id)
+        except KeyboardInterrupt:
+            self.logger.critical('-= STOP =-')
+        finally:
+            if metrics_server:
+                metrics_server.shutdown()
+            self.__stop()
+
+    def __get_metrics_server(self) -> WebhookServer | None:
+        """GET /metrics server for polling mode, started when METRICS_PORT is set"""
+        port = os.environ.get(self._METRICS_PORT_ENV_KEY)
+        if not port:
+            return None
+        host = os.environ.get(self._WEBHOOK_HOST_ENV_KEY, "0.0.0.0")
+        server = WebhookServer(self.dispatcher, self.logger, (host, int(port)), None,
+            metrics=self.get_metrics)
+        server.start()
+        return server
+
+    def start_webhook(self):
+        """Start receiving messages via webhook on a local HTTP server"""
+        self.logger.critical('-= START WEBHOOK =-')
+        host = os.environ.get(self._WEBHOOK_HOST_ENV_KEY, "0.0.0.0")
+        port = int(os.environ.get(self._WEBHOOK_PORT_ENV_KEY, "8080"))
+        path = os.environ.get(self._WEBHOOK_PATH_ENV_KEY, "/")
+        secret = os.environ.get(self._WEBHOOK_SECRET_ENV_KEY) or None
+        public_url = os.environ.get(self._WEBHOOK_URL_ENV_KEY)
+        server = WebhookServer(self.dispatcher, self.logger, (host, port), path, secret,
+            self.get_metrics)
+        if public_url:
+            self.bot.set_webhook(url=public_url, secret_token=secret)
+            self.logger.info("Webhook registered: %s", public_url)
+        self.dispatcher.start()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            self.logger.critical('-= STOP =-')
+        finally:
+            self.__stop()
+
+    def serve_shard(self, index: int, updates):
+        """Handle the updates of the shard queue until None is received"""
+        self.logger.critical('-= START SHARD %d =-', index)
+        self.dispatcher.start()
+        try:
+            for update in iter(updates.get, None):
+                self.dispatcher.submit(update)
+        finally:
+            self.__stop()
+
+    def __stop(self):
+        """Finish processing queued updates, flush the message log and close connections"""
+        self.dispatcher.stop(self._SHUTDOWN_TIMEOUT)
+        self.step_store.close()
+        if isinstance(self.dispatcher, ShardSupervisor):
+            return
+        # Pools of async functions fetch in the event loop, stop them first
+        Prefetcher.default().close()
+        self.async_runtime.stop(self._SHUTDOWN_TIMEOUT)
+        self.middleware.close()
+        FileIdCache.default().close()
+        FanOut.default().close()
+        HttpClient.default().close()
+
+    def get_metrics(self) -> dict:
+        """Get runtime metrics of the application"""
+        if isinstance(self.dispatcher, ShardSupervisor):
+            return {"shards": self.dispatcher.stats(), "sender": self.sender.stats()}
+        return {
+            "dispatcher": self.dispatcher.stats(),
+            "message_log": self.middleware.stats(),
+            "sender": self.sender.stats(),
+            "http": HttpClient.default().stats(),
+            "http_cache": HttpClient.default().cache.stats(),
+            "file_ids": FileIdCache.default().stats(),
+            "fan_out": FanOut.default().stats(),
+            "prefetch": Prefetcher.default().stats(),
+            "atomic_loading": load_report(),
+            "commands": self.bot.command_router.stats(),
+            "callbacks": self.bot.callback_router.stats(),
+            "next_steps": self.step_store.stats(),
+            "async": self.async_runtime.stats(),
+        }
+
+    def process_update(self, update: types.Update):
+        """Run middlewares and handlers for one update"""
+        self.bot.process_new_updates([update])
 
     def get_logger(self)-> logging.Logger:
         """Get a configured logger"""
@@ -56,28 +211,85 @@ class StartApp():
             return levels[str_level]
         return levels["INFO"]
 
-    def __get_bot(self)-> telebot.TeleBot:
+    def __get_bot(self)-> RoutedTeleBot:
         """Get a configured bot"""
         token = os.environ[self._TBOTTOKEN_ENV_KEY]
         log_level = self.__get_log_level(self._TBOT_LOGLEVEL_ENV_KEY)
         telebot.logger.setLevel(log_level)
-        new_bot = telebot.TeleBot(token, use_class_middlewares=True)
+        new_bot = RoutedTeleBot(token, threaded=False, use_class_middlewares=True,
+            next_step_backend=self.step_store)
         return new_bot
 
+    def __get_step_store(self)-> StepHandlerStore:
+        """Get the storage of next step handlers configured from environment variables"""
+        return StepHandlerStore(
+            ttl=float(os.environ.get(self._STEP_TTL_ENV_KEY, "900")),
+            max_size=int(os.environ.get(self._STEP_MAX_SIZE_ENV_KEY, "10000")),
+            connection_string=os.environ.get(self._STEP_DB_ENV_KEY) or None,
+            resolver=self.__find_step_owner,
+            logger=self.logger,
+        )
+
+    def __find_step_owner(self, module: str, qualname: str)-> AtomicBotFunctionABC | None:
+        """Find the atomic function of a saved next step handler, loading it if it is lazy"""
+        for funct in self.atom_functions_list:
+            if isinstance(funct, LazyAtomicFunction):
+                if (funct.module_name, funct.class_name) == (module.rsplit(".", 1)[-1], qualname):
+                    return funct.ensure_loaded(self.bot)
+            elif (type(funct).__module__, type(funct).__qualname__) == (module, qualname):
+                return funct
+        return None
+
+    def __get_sender(self)-> TelegramSender:
+        """Get the rate limiter of outgoing messages and install it into telebot"""
+        sender = TelegramSender(
+            self.logger,
+            global_rate=float(os.environ.get(self._SEND_GLOBAL_RATE_ENV_KEY)
+                or self.SHARD_DIVIDED_RATE_ENV_KEYS[self._SEND_GLOBAL_RATE_ENV_KEY]),
+            chat_rate=float(os.environ.get(self._SEND_CHAT_RATE_ENV_KEY, "1")),
+            chat_burst=float(os.environ.get(self._SEND_CHAT_BURST_ENV_KEY, "3")),
+            queue_size=int(os.environ.get(self._SEND_QUEUE_SIZE_ENV_KEY, "1000")),
+        )
+        apihelper.CUSTOM_REQUEST_SENDER = sender.send_request
+        return sender
+
+    def __get_dispatcher(self)-> UpdateDispatcher:
+        """Get a dispatcher configured from environment variables"""
+        workers = int(os.environ.get(self._DISPATCH_WORKERS_ENV_KEY, "8"))
+        queue_size = int(os.environ.get(self._DISPATCH_QUEUE_SIZE_ENV_KEY, "1000"))
+        self.logger.info("Dispatcher: workers = %d, queue size = %d", workers, queue_size)
+        return UpdateDispatcher(self.process_update, self.logger, workers, queue_size)
+
+    def __get_shard_supervisor(self, start_comannds: List[str], shards: int)-> ShardSupervisor:
+        """Get the supervisor of the shard worker processes"""
+        queue_size = int(os.environ.get(self._DISPATCH_QUEUE_SIZE_ENV_KEY, "1000"))
+        self.logger.info("Shards: %d worker processes, queue size = %d", shards, queue_size)
+        return ShardSupervisor(functools.partial(run_shard, start_comannds, shards), self.logger,
+            shards, queue_size)
+
     def __add_middleware(self):
         """Registering Middleware for Bot"""
-        self.bot.setup_middleware(Middleware(self.logger, self.bot))
+        self.middleware = Middleware(self.logger, self.bot)
+        self.bot.setup_middleware(self.middleware)
 
     def __add_filter(self):
         """Add a custom filter for the bot"""
         self.bot.add_custom_filter(BotCallbackCustomFilter())
 
-    def __decorate_atomic_functions(self):
+    def __decorate_atomic_functions(self, start_comannds: List[str]):
         """Decorate handlers functions"""
         self.logger.info("Number of modules found - %d", len(self.atom_functions_list))
+        disable_duplicate_commands(self.atom_functions_list, start_comannds, self.logger)
+        for row in load_report()[:3]:
+            self.logger.info("Slow module %s: import %.3f s, init %.3f s",
+                row["module"], row["import"], row["init"])
         for funct in self.atom_functions_list:
             try:
-                if funct.state:
+                if funct.state and isinstance(funct, AsyncAtomicBotFunctionABC):
+                    self.async_runtime.add_function(funct, self.bot)
+                    self.logger.info("%s - async start OK!", funct)
+                elif funct.state:
+                    HttpClient.default().cache.add_policies(funct.cache_policies)
                     funct.set_handlers(self.bot)
                     self.logger.info("%s - start OK!", funct)
                 else:
@@ -94,3 +306,13 @@ class StartApp():
 
         defouit_function = DefoultBotFunction(start_comannds, functions_list)
         defouit_function.set_handlers(self.bot)
+
+def run_shard(start_comannds: List[str], shards: int, index: int, updates):
+    """Entry point of a shard worker process.
+    The supervisor stops the workers, so Ctrl+C in the terminal is ignored.
+    The spool and the file_id cache of the shard get their own files,
+    the global send rate is divided between the shards"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    ShardSupervisor.use_local_paths(index, StartApp.SHARD_LOCAL_PATH_ENV_KEYS)
+    ShardSupervisor.divide_rates(shards, StartApp.SHARD_DIVIDED_RATE_ENV_KEYS)
+    StartApp(start_comannds).serve_shard(index, updates)
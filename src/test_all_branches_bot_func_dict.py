@@ -2,6 +2,7 @@
 
 import unittest
 from bot_func_abc import AtomicBotFunctionABC
+from bot_async_func_abc import AsyncAtomicBotFunctionABC
 from load_atomic import load_atomic_functions
 from app import _START_COMANDS
 
@@ -12,8 +13,10 @@ class TestTeleBot(unittest.TestCase):
         """Check what is inherited from the required class"""
         atom_functions_list = load_atomic_functions()
         for funct in atom_functions_list:
-            message = "Function class must be inherited from AtomicBotFunctionABC!"
-            self.assertIs(type(funct).__base__, AtomicBotFunctionABC, msg=message)
+            message = "Function class must be inherited from AtomicBotFunctionABC" \
+                " or AsyncAtomicBotFunctionABC!"
+            self.assertIn(type(funct).__base__,
+                (AtomicBotFunctionABC, AsyncAtomicBotFunctionABC), msg=message)
 
     def test_command_count(self):
         """Checks that an atomic function contains at least one command"""
@@ -0,0 +1,224 @@
+"""The module contains tests for the async atomic functions and their HTTP client"""
+
+import asyncio
+import itertools
+import logging
+import time
+import unittest
+from typing import List
+from unittest import mock
+from telebot import asyncio_helper, types
+from telebot.async_telebot import AsyncTeleBot
+from telebot.callback_data import CallbackData
+from bot_async_func_abc import AsyncAtomicBotFunctionABC
+from bot_async_http_client import AsyncHttpClient, UpstreamUnavailable
+from bot_async_runtime import AsyncRuntime
+from bot_http_client import HttpClient
+from bot_callback_filter import BotCallbackCustomFilter
+from bot_prefetch import Prefetcher
+from bot_response_cache import CachePolicy
+from bot_router import RoutedTeleBot
+from bot_sender import TelegramSender, bulk_sends
+from test_bot_http_client import start_stub_server
+from test_bot_prefetch import wait_for
+from test_bot_router import _callback, _message
+
+class Echo(AsyncAtomicBotFunctionABC):
+    """Replies to /echo, and to its button with count messages in the bulk lane"""
+
+    commands: List[str] = ["echo"]
+    authors: List[str] = ["test"]
+    about: str = "Echo"
+    description: str = "Echo"
+    state: bool = True
+
+    def set_handlers(self, bot: AsyncTeleBot):
+        """Set message handlers"""
+        factory = CallbackData("count", prefix=self.commands[0])
+
+        @bot.message_handler(commands=self.commands)
+        async def echo(message: types.Message):
+            # Later updates of a chat finish sooner if they are not kept in order
+            await asyncio.sleep(0.2 if int(message.text.split()[1]) % 8 < 4 else 0.05)
+            await bot.send_message(message.chat.id, message.text)
+
+        @bot.callback_query_handler(func=None, config=factory.filter())
+        async def repeat(call: types.CallbackQuery):
+            with bulk_sends():
+                await asyncio.gather(*(bot.send_message(call.message.chat.id, str(i))
+                    for i in range(int(factory.parse(call.data)["count"]))))
+
+class TestAsyncHttpClient(unittest.TestCase):
+    """Unittest AsyncHttpClient against a local stub server"""
+
+    def setUp(self):
+        self.server = start_stub_server()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.client = AsyncHttpClient(host_timeouts={"127.0.0.1": (1.0, 2.0)},
+            breaker_failures=2, breaker_reset=60)
+
+    def tearDown(self):
+        asyncio.run(self.client.close())
+        self.server.shutdown()
+        self.server.server_close()
+
+    def run_with_client(self, coroutine):
+        """Run the coroutine and close the session in the same loop"""
+        async def main():
+            try:
+                return await coroutine
+            finally:
+                await self.client.close()
+        return asyncio.run(main())
+
+    def test_single_flight_and_cache(self):
+        """Concurrent identical requests share one call, cached responses make none"""
+        self.client.cache.add_policies({f"{self.url}/slow": CachePolicy(ttl=60, stale_ttl=60)})
+
+        async def requests():
+            shared = await asyncio.gather(*(self.client.get(f"{self.url}/slow",
+                params={"page": 1}) for _ in range(8)))
+            cached = await self.client.get(f"{self.url}/slow?page=1")
+            separate = await asyncio.gather(*(self.client.get(f"{self.url}/slow",
+                coalesce=False) for _ in range(3)))
+            return shared + [cached] + separate
+
+        responses = self.run_with_client(requests())
+        self.assertEqual([response.json() for response in responses], [{"ok": True}] * 12)
+        self.assertEqual(responses[0].headers["content-type"], "application/json")
+        self.assertEqual(len(self.server.hits), 4)
+        self.assertEqual(self.client.stats()["127.0.0.1"]["coalesced"], 7)
+        self.assertEqual(self.client.in_flight, 0)
+        cache = self.client.cache.stats()
+        self.assertEqual((cache["entries"], cache["bytes"]), (2, 24))
+        self.assertEqual(cache["prefixes"][f"{self.url}/slow"]["hits"], 1)
+
+    def test_stale_while_revalidate(self):
+        """A stale response is returned at once and refreshed in the background"""
+        self.client.cache.add_policies({f"{self.url}/ok": CachePolicy(ttl=0.01, stale_ttl=60)})
+
+        async def requests():
+            fresh = await self.client.get(f"{self.url}/ok")
+            await asyncio.sleep(0.02)
+            stale = await self.client.get(f"{self.url}/ok")
+            hits = len(self.server.hits)
+            await asyncio.sleep(0.2)
+            return fresh, stale, hits
+
+        fresh, stale, hits = self.run_with_client(requests())
+        self.assertEqual(stale.json(), fresh.json())
+        self.assertEqual((hits, len(self.server.hits)), (1, 2))
+        stats = self.client.cache.stats()["prefixes"][f"{self.url}/ok"]
+        self.assertEqual((stats["stale_hits"], stats["refreshes"]), (1, 1))
+
+    def test_adaptive_timeout(self):
+        """The read timeout follows the p99 latency like in HttpClient"""
+        self.assertEqual(self.client.adaptive_timeout("127.0.0.1").sock_read, 2.0)
+
+        async def requests():
+            for _ in range(HttpClient.ADAPTIVE_MIN_SAMPLES):
+                await self.client.get(f"{self.url}/ok")
+
+        self.run_with_client(requests())
+        timeout = self.client.adaptive_timeout("127.0.0.1")
+        self.assertEqual((timeout.sock_connect, timeout.sock_read),
+            (1.0, HttpClient.ADAPTIVE_MIN_TIMEOUT))
+        self.assertEqual(self.client.stats()["127.0.0.1"]["timeout"],
+            (1.0, HttpClient.ADAPTIVE_MIN_TIMEOUT))
+
+    def test_circuit_breaker_fallback(self):
+        """A failing host is cut off, the cached response is returned instead"""
+        self.client.cache.add_policies({f"{self.url}/ok": CachePolicy(ttl=0)})
+
+        async def requests():
+            fresh = await self.client.get(f"{self.url}/ok")
+            self.server.failing = True
+            self.assertEqual((await self.client.get(f"{self.url}/other")).status, 500)
+            fallback = await self.client.get(f"{self.url}/ok")
+            with self.assertRaises(UpstreamUnavailable):
+                await self.client.get(f"{self.url}/other")
+            return fresh, fallback
+
+        fresh, fallback = self.run_with_client(requests())
+        self.assertEqual((fallback.status, fallback.content), (200, fresh.content))
+        stats = self.client.stats()["127.0.0.1"]
+        self.assertEqual(stats["breaker"]["state"], "open")
+        self.assertEqual(stats["fallbacks"], 1)
+
+class TestAsyncRuntime(unittest.TestCase):
+    """Unittest passing updates from the sync bot to async functions"""
+
+    def setUp(self):
+        self.sent = []
+        self.retry_after = None
+
+        async def process_request(token, url, method="get", params=None, files=None, # pylint: disable=unused-argument,too-many-arguments,too-many-positional-arguments
+        **kwargs):
+            if self.retry_after is not None:
+                retry_after, self.retry_after = self.retry_after, None
+                raise asyncio_helper.ApiTelegramException(url, None, {"error_code": 429,
+                    "description": "Too Many Requests", "parameters": {"retry_after": retry_after}})
+            self.sent.append((int(params["chat_id"]), params["text"]))
+            return {"message_id": len(self.sent), "date": 0, "text": params["text"],
+                "chat": {"id": int(params["chat_id"]), "type": "private"}}
+
+        self.process_request = process_request
+        patcher = mock.patch.object(asyncio_helper, "_process_request", process_request)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.sender = TelegramSender(logging.getLogger(__name__), global_rate=1000,
+            chat_rate=1000, chat_burst=1000)
+        self.runtime = AsyncRuntime("1:test", logging.getLogger(__name__), self.sender)
+        self.bot = RoutedTeleBot("1:test", threaded=False)
+        self.bot.add_custom_filter(BotCallbackCustomFilter())
+        self.runtime.add_function(Echo(), self.bot)
+        self.runtime.start()
+
+    def tearDown(self):
+        self.runtime.stop(5)
+
+    def test_updates_do_not_wait(self):
+        """The sync bot returns before the handlers finish, sends wait for the sender,
+        updates of one chat are handled in order"""
+        messages = [_message(i, f"/echo {i}") for i in range(20)]
+        for i, message in enumerate(messages):
+            message.chat.id = i % 4
+        self.bot.process_new_messages(messages)
+        self.bot.process_new_callback_query([_callback(1, "echo:3"), _callback(2, "other:3")])
+        self.assertLess(len(self.sent), 20)
+        self.runtime.stop(5)
+        self.assertIs(asyncio_helper._process_request, self.process_request) # pylint: disable=protected-access
+        for chat_id in range(4):
+            self.assertEqual([text for chat, text in self.sent if chat == chat_id],
+                [f"/echo {i}" for i in range(chat_id, 20, 4)])
+        self.assertEqual(sorted(text for chat, text in self.sent if chat == 7), ["0", "1", "2"])
+        lanes = self.sender.stats()["lanes"]
+        self.assertEqual((lanes["interactive"]["sent"], lanes["bulk"]["sent"]), (20, 3))
+        stats = self.runtime.stats()
+        self.assertEqual((stats["in_flight"], stats["chats"], stats["handled"], stats["errors"]),
+            (0, 0, 21, 0))
+
+    def test_retry_after(self):
+        """A 429 error of an async send pauses the chat and the send is retried"""
+        self.retry_after = 0.1
+        started_at = time.monotonic()
+        message = self.runtime.run(self.runtime.bot.send_message(5, "retried"), 5)
+        self.assertEqual(message.text, "retried")
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.1)
+        self.assertEqual((self.sent, self.sender.stats()["retried_429"]), ([(5, "retried")], 1))
+
+    def test_prefetch_in_loop(self):
+        """Prefetch pools of async functions run their coroutines in the loop of the handlers"""
+        prefetcher = Prefetcher(workers=1)
+        counter = itertools.count()
+
+        async def fetch():
+            self.assertIs(asyncio.get_running_loop(), self.runtime.loop)
+            return next(counter)
+
+        funct = self.runtime.functions[0]
+        pool = prefetcher.pool("numbers", lambda: funct.run_in_loop(fetch()), size=3, low_water=0)
+        prefetcher.start()
+        self.assertTrue(wait_for(lambda: len(pool) == 3))
+        self.assertEqual(pool.take(3), [0, 1, 2])
+        prefetcher.close()
@@ -0,0 +1,78 @@
+"""The module contains tests for the concurrent update dispatcher"""
+
+import logging
+import queue
+import time
+import unittest
+from telebot import types
+from bot_dispatcher import UpdateDispatcher
+
+def make_update(update_id: int, chat_id: int, text: str = "/start") -> types.Update:
+    """Build a message update as it comes from Telegram"""
+    return types.Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "text": text,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "test"},
+        },
+    })
+
+class TestUpdateDispatcher(unittest.TestCase):
+    """Unittest update dispatcher"""
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+
+    def test_chat_order(self):
+        """Updates of one chat are processed in arrival order"""
+        processed = []
+        def handler(update: types.Update):
+            time.sleep(0.001 * (update.update_id % 3))
+            processed.append((update.message.chat.id, update.update_id))
+
+        dispatcher = UpdateDispatcher(handler, self.logger, workers=4, queue_size=100)
+        dispatcher.start()
+        for i in range(60):
+            dispatcher.submit(make_update(i, i % 3))
+        dispatcher.stop(timeout=5)
+
+        self.assertEqual(len(processed), 60)
+        for chat_id in range(3):
+            ids = [upd_id for chat, upd_id in processed if chat == chat_id]
+            self.assertEqual(ids, sorted(ids))
+
+    def test_slow_chat_does_not_block_others(self):
+        """A hung handler in one chat does not stop other chats"""
+        release = queue.Queue()
+        other_chat_done = queue.Queue()
+        def handler(update: types.Update):
+            if update.message.chat.id == 1:
+                release.get(timeout=5)
+            else:
+                other_chat_done.put(update.update_id)
+
+        dispatcher = UpdateDispatcher(handler, self.logger, workers=2, queue_size=10)
+        dispatcher.start()
+        dispatcher.submit(make_update(1, 1))
+        dispatcher.submit(make_update(2, 1))
+        dispatcher.submit(make_update(3, 2))
+        self.assertEqual(other_chat_done.get(timeout=2), 3)
+        release.put(True)
+        release.put(True)
+        dispatcher.stop(timeout=5)
+        self.assertEqual(dispatcher.stats()["handler_time"]["count"], 3)
+
+    def test_queue_full(self):
+        """Submit without blocking fails when the queue is full"""
+        dispatcher = UpdateDispatcher(lambda update: None, self.logger, workers=1, queue_size=2)
+        self.assertTrue(dispatcher.submit(make_update(1, 1), block=False))
+        self.assertTrue(dispatcher.submit(make_update(2, 2), block=False))
+        self.assertFalse(dispatcher.submit(make_update(3, 3), block=False))
+        self.assertEqual(dispatcher.pending, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+"""The module contains tests for the bounded concurrent fan-out"""
+
+import threading
+import time
+import unittest
+from bot_fan_out import FanOut
+
+class TestFanOut(unittest.TestCase):
+    """Unittest FanOut"""
+
+    def setUp(self):
+        self.fan_out = FanOut(max_workers=8)
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def tearDown(self):
+        self.fan_out.close()
+
+    def sleep(self, seconds):
+        """Sleep, tracking the number of concurrent calls"""
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(seconds)
+        with self.lock:
+            self.running -= 1
+        if seconds < 0.05:
+            raise ValueError(seconds)
+        return seconds
+
+    def test_limit_and_order(self):
+        """Calls run concurrently up to the limit, results keep the order of the items"""
+        started_at = time.monotonic()
+        result = self.fan_out.map(self.sleep, [0.2, 0.1, 0.15, 0.1], limit=4)
+        self.assertLess(time.monotonic() - started_at, 0.35)
+        self.assertEqual(result.values, [0.2, 0.1, 0.15, 0.1])
+        self.assertEqual(self.max_running, 4)
+
+        self.max_running = 0
+        self.fan_out.map(self.sleep, [0.1] * 6, limit=2)
+        self.assertEqual(self.max_running, 2)
+
+    def test_partial_results(self):
+        """Failed and slow calls are left out of the values"""
+        started_at = time.monotonic()
+        result = self.fan_out.map(self.sleep, [0.1, 0.01, 1.0, 0.1], timeout=0.3)
+        self.assertLess(time.monotonic() - started_at, 0.6)
+        self.assertEqual(result.values, [0.1, 0.1])
+        self.assertEqual([str(error) for error in result.errors], ["0.01"])
+        self.assertEqual(result.timed_out, 1)
+        self.assertEqual(self.fan_out.stats(), {"calls": 4, "failed": 1, "timed_out": 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
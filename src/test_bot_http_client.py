@@ -0,0 +1,178 @@
+"""The module contains tests for the shared HTTP client"""
+
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from bot_http_client import HttpClient, UpstreamUnavailable
+from bot_metrics import LatencyStats
+from bot_response_cache import CachePolicy, ResponseCache
+from test_bot_prefetch import wait_for
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Local upstream: /fail (or any path while failing) answers 500,
+    /slow answers after a delay, other paths answer 200 with JSON"""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self): # pylint: disable=invalid-name
+        """Count the hit and the client port and answer"""
+        self.server.hits.append((self.path, self.client_address[1]))
+        if self.path.startswith("/slow"):
+            time.sleep(0.3)
+        body = b'{"ok": true}'
+        self.send_response(500 if self.path == "/fail" or self.server.failing else 200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        pass
+
+def start_stub_server() -> ThreadingHTTPServer:
+    """Serve StubHandler on a free local port in a daemon thread"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.hits = []
+    server.failing = False
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+class TestHttpClient(unittest.TestCase):
+    """Unittest HttpClient against a local stub server"""
+
+    def setUp(self):
+        self.server = start_stub_server()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.client = HttpClient(host_timeouts={"127.0.0.1": (1.0, 2.0)},
+            breaker_failures=2, breaker_reset=60)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_keep_alive_and_stats(self):
+        """Requests reuse one connection and are counted per host"""
+        for _ in range(3):
+            self.assertEqual(self.client.get(f"{self.url}/ok").json(), {"ok": True})
+        self.assertEqual(self.client.get(f"{self.url}/fail").status_code, 500)
+        self.client.get(f"{self.url}/ok")
+        self.assertEqual(len({port for _, port in self.server.hits}), 1)
+        stats = self.client.stats()["127.0.0.1"]
+        self.assertEqual(stats["requests"], 5)
+        self.assertEqual(stats["errors"], 1)
+        self.assertEqual(stats["latency"]["count"], 5)
+        self.assertEqual(stats["breaker"]["state"], "closed")
+        self.assertEqual(self.client.timeout_for("127.0.0.1"), (1.0, 2.0))
+
+    def test_response_cache(self):
+        """Fresh responses are served from the cache, stale ones are refreshed in background"""
+        self.client.cache.add_policies({
+            f"{self.url}/cached": CachePolicy(ttl=0.2, stale_ttl=60),
+        })
+        for _ in range(3):
+            self.client.get(f"{self.url}/cached", params={"q": "a"})
+        self.client.get(f"{self.url}/cached", params={"q": "b"})
+        self.client.get(f"{self.url}/other")
+        self.assertEqual(len(self.server.hits), 3)
+
+        time.sleep(0.25)
+        self.assertEqual(self.client.get(f"{self.url}/cached?q=a").json(), {"ok": True})
+        deadline = time.monotonic() + 5
+        while len(self.server.hits) < 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual([path for path, _ in self.server.hits].count("/cached?q=a"), 2)
+
+        stats = self.client.cache.stats()["prefixes"][f"{self.url}/cached"]
+        self.assertEqual((stats["hits"], stats["stale_hits"], stats["misses"]), (2, 1, 2))
+
+    def test_refresh_error(self):
+        """A refresh that fails with any error does not stop later refreshes of the entry"""
+        cache = ResponseCache()
+        self.addCleanup(cache.close)
+        cache.add_policies({f"{self.url}/": CachePolicy(ttl=0, stale_ttl=60)})
+        calls = []
+
+        def fetch():
+            calls.append(len(calls))
+            if len(calls) > 1:
+                raise ValueError("bad JSON")
+            return SimpleNamespace(status_code=200, content=b"{}")
+
+        url = f"{self.url}/cached"
+        cache.get(url, fetch)
+        for refreshes in (1, 2):
+            self.assertEqual(cache.get(url, fetch).content, b"{}")
+            self.assertTrue(wait_for(lambda count=refreshes:
+                cache.stats()["prefixes"][f"{self.url}/"]["refresh_errors"] == count))
+        self.assertEqual(len(calls), 3)
+
+    def test_cache_eviction(self):
+        """The least recently used response is evicted when the memory bound is exceeded"""
+        self.client.cache.max_bytes = 30
+        self.client.cache.add_policies({self.url: CachePolicy(ttl=60)})
+        for path in ("/a", "/b", "/a", "/c", "/a", "/b"):
+            self.client.get(f"{self.url}{path}")
+        self.assertEqual([path for path, _ in self.server.hits], ["/a", "/b", "/c", "/b"])
+        self.assertEqual(self.client.cache.stats()["evictions"], 2)
+
+    def test_single_flight(self):
+        """Identical concurrent requests make one upstream call"""
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            self.client.get(f"{self.url}/slow", params={"page": 1}).json())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [{"ok": True}] * 8)
+        self.assertEqual(len(self.server.hits), 1)
+        self.assertEqual(self.client.stats()["127.0.0.1"]["coalesced"], 7)
+
+        self.client.get(f"{self.url}/slow", params={"page": 1})
+        self.assertEqual(len(self.server.hits), 2)
+
+        threads = [threading.Thread(target=self.client.get, args=(f"{self.url}/slow",),
+            kwargs={"coalesce": False}) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.server.hits), 5)
+
+    def test_circuit_breaker_fallback(self):
+        """An open breaker fails fast, cached responses are returned instead"""
+        self.client.cache.add_policies({f"{self.url}/cached": CachePolicy(ttl=0.01)})
+        self.client.get(f"{self.url}/cached")
+        self.server.failing = True
+        time.sleep(0.02)
+        self.assertEqual(self.client.get(f"{self.url}/cached").status_code, 200)
+        self.assertEqual(self.client.get(f"{self.url}/other").status_code, 500)
+        hits = len(self.server.hits)
+        with self.assertRaises(UpstreamUnavailable):
+            self.client.get(f"{self.url}/other")
+        self.assertEqual(self.client.get(f"{self.url}/cached").json(), {"ok": True})
+        self.assertEqual(len(self.server.hits), hits)
+        stats = self.client.stats()["127.0.0.1"]
+        self.assertEqual(stats["breaker"]["state"], "open")
+        self.assertEqual(stats["fallbacks"], 2)
+
+    def test_adaptive_timeout(self):
+        """The read timeout follows the p99 latency within the configured limits"""
+        self.assertEqual(self.client.adaptive_timeout("127.0.0.1"), (1.0, 2.0))
+        for _ in range(HttpClient.ADAPTIVE_MIN_SAMPLES):
+            self.client.get(f"{self.url}/ok")
+        self.assertEqual(self.client.adaptive_timeout("127.0.0.1"),
+            (1.0, HttpClient.ADAPTIVE_MIN_TIMEOUT))
+
+        latency = LatencyStats()
+        for seconds in [0.02] * 98 + [0.3, 4.0]:
+            latency.observe(seconds)
+        self.assertEqual(latency.quantile(0.5), 0.025)
+        self.assertEqual(latency.quantile(0.99), 0.5)
+        self.assertEqual(latency.quantile(1.0), 4.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""The module contains tests for sending photos as albums and the file_id cache"""
+
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from telebot.apihelper import ApiTelegramException
+from bot_media import FileIdCache, send_photo, send_photos
+
+def _rejected(method):
+    return ApiTelegramException(method, None,
+        {"error_code": 400, "description": "Bad Request: wrong file"})
+
+class FakeBot:
+    """Records sent albums and photos, rejects the inputs listed in bad.
+    A sent photo gets the file_id "id-<input>" """
+
+    def __init__(self, bad=()):
+        self.bad = set(bad)
+        self.calls = []
+
+    def send_media_group(self, chat_id, media):
+        """Send an album"""
+        photos = [item.media for item in media]
+        self.calls.append(("album", chat_id, photos))
+        if self.bad & set(photos):
+            raise _rejected("sendMediaGroup")
+        return [self.__message(photo) for photo in photos]
+
+    def send_photo(self, chat_id, photo, **kwargs):
+        """Send a photo"""
+        self.calls.append(("photo", chat_id, photo))
+        if photo in self.bad:
+            raise _rejected("sendPhoto")
+        return self.__message(photo, **kwargs)
+
+    @staticmethod
+    def __message(photo, **kwargs):
+        photo = photo.decode() if isinstance(photo, bytes) else photo
+        file_id = photo if photo.startswith("id-") else f"id-{photo}"
+        return SimpleNamespace(photo=[SimpleNamespace(file_id=file_id)], **kwargs)
+
+class TestBotMedia(unittest.TestCase):
+    """Unittest send_photos and FileIdCache"""
+
+    def test_albums(self):
+        """Photos are split into albums of 10, a single photo is sent as a photo"""
+        bot = FakeBot()
+        photos = [f"p{i}" for i in range(21)]
+        self.assertEqual(len(send_photos(bot, 1, photos, cache=FileIdCache())), 21)
+        self.assertEqual(bot.calls, [("album", 1, photos[:10]), ("album", 1, photos[10:20]),
+            ("photo", 1, "p20")])
+
+    def test_fallback(self):
+        """A rejected album is sent photo by photo without the bad one"""
+        bot = FakeBot(bad={"p1"})
+        sent = send_photos(bot, 1, ["p0", "p1", "p2"], cache=FileIdCache())
+        self.assertEqual([message.photo[-1].file_id for message in sent], ["id-p0", "id-p2"])
+        self.assertEqual([kind for kind, _, _ in bot.calls], ["album", "photo", "photo", "photo"])
+
+    def test_file_id_cache(self):
+        """Photos sent before are sent by file_id, a rejected file_id is replaced"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "file_ids.json")
+            cache = FileIdCache(path, max_size=2, flush_interval=60)
+            bot = FakeBot()
+            urls = ["https://a/1.jpg", "https://a/2.jpg"]
+            send_photos(bot, 1, urls, cache=cache)
+            message = send_photo(bot, 1, urls[0], cache, caption="one")
+            self.assertEqual(message.caption, "one")
+            send_photos(bot, 1, urls, cache=cache)
+            self.assertEqual(bot.calls[1:], [("photo", 1, "id-https://a/1.jpg"),
+                ("album", 1, ["id-https://a/1.jpg", "id-https://a/2.jpg"])])
+
+            send_photo(bot, 1, b"content", cache)
+            send_photo(bot, 1, "local-file-id", cache)
+            self.assertFalse(os.path.exists(path))
+            cache.close()
+            cache = FileIdCache(path, max_size=2)
+            self.assertEqual(len(cache), 2)
+            self.assertIsNone(cache.get("https://a/1.jpg"))
+            self.assertEqual(cache.get(FileIdCache.key(b"content")), "id-content")
+
+            bot = FakeBot(bad={"id-https://a/2.jpg"})
+            send_photo(bot, 1, urls[1], cache)
+            self.assertEqual(bot.calls, [("photo", 1, "id-https://a/2.jpg"),
+                ("photo", 1, "https://a/2.jpg")])
+            self.assertEqual(cache.stats()["size"], 2)
+            cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+"""The module contains tests for the prefetch pools"""
+
+import itertools
+import time
+import unittest
+from bot_prefetch import Prefetcher
+
+def wait_for(condition, timeout=5.0):
+    """Wait until condition() is true"""
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+class TestPrefetcher(unittest.TestCase):
+    """Unittest Prefetcher and PrefetchPool"""
+
+    def setUp(self):
+        self.prefetcher = Prefetcher(workers=2)
+        self.counter = itertools.count()
+
+    def tearDown(self):
+        self.prefetcher.close()
+
+    def fetch(self):
+        """Return 0, 1, 1, 2, 3, 3, ... and fail on every fifth call"""
+        number = next(self.counter)
+        if number % 5 == 4:
+            raise ValueError("upstream error")
+        return number - number // 3
+
+    def test_refill(self):
+        """Pools are filled after start with unique items and refilled below the low-water mark"""
+        pool = self.prefetcher.pool("numbers", self.fetch, size=4, low_water=1)
+        self.assertEqual(pool.take(2), [])
+        self.assertEqual(len(pool), 0)
+
+        self.prefetcher.start()
+        self.assertTrue(wait_for(lambda: len(pool) == 4))
+        items = pool.take(3)
+        self.assertEqual(len(set(items)), 3)
+        self.assertTrue(wait_for(lambda: len(pool) == 4))
+        items += pool.take(4)
+        self.assertEqual(len(set(items)), 7)
+
+        stats = self.prefetcher.stats()["numbers"]
+        self.assertEqual((stats["served"], stats["missed"]), (7, 2))
+        self.assertGreater(stats["duplicates"], 0)
+        self.assertGreater(stats["errors"], 0)
+
+    def test_disabled(self):
+        """A disabled prefetcher never calls fetch"""
+        prefetcher = Prefetcher(enabled=False)
+        pool = prefetcher.pool("numbers", self.fetch)
+        prefetcher.start()
+        self.assertEqual(pool.take(), [])
+        self.assertEqual(next(self.counter), 0)
+        prefetcher.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+"""The module contains tests for routing messages by command and callback queries by prefix"""
+
+import unittest
+import telebot
+from telebot import types
+from telebot.callback_data import CallbackData
+from telebot.handler_backends import ContinueHandling
+from bot_callback_filter import BotCallbackCustomFilter
+from bot_router import RoutedTeleBot, UpdateRouter
+
+def _message(message_id, text):
+    entities = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}] \
+        if text.startswith("/") else []
+    return types.Message.de_json({"message_id": message_id, "date": 0, "text": text,
+        "entities": entities, "chat": {"id": 7, "type": "private"},
+        "from": {"id": 7, "is_bot": False, "first_name": "Test"}})
+
+def _callback(query_id, data):
+    user = {"id": 7, "is_bot": False, "first_name": "Test"}
+    return types.CallbackQuery.de_json({"id": str(query_id), "from": user,
+        "chat_instance": "1", "data": data, "message": {"message_id": 1, "date": 0,
+        "chat": {"id": 7, "type": "private"}, "text": "keyboard"}})
+
+class TestRouter(unittest.TestCase):
+    """Unittest RoutedTeleBot against telebot dispatching"""
+
+    TEXTS = ["/a", "/b x", "/a@test_bot", "/c", "hello", "!x", "/a !"]
+
+    @staticmethod
+    def dispatch(bot: telebot.TeleBot):
+        """Register handlers of every kind and return the handler names called per message"""
+        calls = []
+
+        def handler(name, result=None):
+            def function(message):
+                calls.append((message.text, name))
+                return result
+            return function
+
+        bot.message_handler(func=lambda m: m.text.startswith("!"))(handler("bang"))
+        bot.message_handler(commands=["a"], func=lambda m: m.text.endswith("!"))(
+            handler("a!", ContinueHandling()))
+        bot.message_handler(commands=["a", "b"])(handler("ab"))
+        bot.message_handler(commands=["b"])(handler("b"))
+        bot.message_handler(func=lambda m: True)(handler("any"))
+        bot.process_new_messages([_message(i, text)
+            for i, text in enumerate(TestRouter.TEXTS)])
+        bot.message_handler(commands=["c"])(handler("c"))
+        bot.message_handler(commands=["d"])(handler("d"))
+        bot.process_new_messages([_message(10, "/c"), _message(11, "/d")])
+        return calls
+
+    def test_same_handlers_as_telebot(self):
+        """Routed messages reach the same handlers in the same order"""
+        expected = self.dispatch(telebot.TeleBot("1:test", threaded=False))
+        bot = RoutedTeleBot("1:test", threaded=False)
+        self.assertEqual(self.dispatch(bot), expected)
+        self.assertEqual(expected[:3], [("/a", "ab"), ("/b x", "ab"), ("/a@test_bot", "ab")])
+        self.assertEqual(expected[-4:],
+            [("/a !", "a!"), ("/a !", "ab"), ("/c", "any"), ("/d", "any")])
+
+        self.assertEqual(bot.command_router.keys(), ["a", "b", "c", "d"])
+        stats = bot.command_router.stats()
+        self.assertEqual({key: value["count"] for key, value in stats.items()},
+            {"a": 3, "b": 1, "c": 1, "d": 1, "<other>": 1, "<text>": 2})
+
+    @staticmethod
+    def dispatch_callbacks(bot: telebot.TeleBot):
+        """Register CallbackData handlers and return the handler names called per query"""
+        bot.add_custom_filter(BotCallbackCustomFilter())
+        calls = []
+        crypto = CallbackData("action", "coin", prefix="crypto")
+        fruit = CallbackData("fruit", prefix="fruit", sep="|")
+
+        def handler(name):
+            return lambda call: calls.append((call.data, name))
+
+        bot.callback_query_handler(func=None, config=crypto.filter(action="buy"))(
+            handler("crypto buy"))
+        bot.callback_query_handler(func=None, config=crypto.filter())(handler("crypto"))
+        bot.callback_query_handler(func=lambda call: call.data.startswith("fruit|x"))(
+            handler("fruit x"))
+        bot.callback_query_handler(func=None, config=fruit.filter())(handler("fruit"))
+        bot.callback_query_handler(func=lambda call: True)(handler("any"))
+        bot.process_new_callback_query([_callback(i, data) for i, data in enumerate([
+            "crypto:buy:btc", "crypto:sell:eth", "crypto:bad", "fruit|x", "fruit|apple",
+            "fruit|a:b", "cryptocurrency", "other:1", ""])])
+        return calls
+
+    def test_callbacks(self):
+        """Callback queries reach the same handlers as without the router"""
+        expected = self.dispatch_callbacks(telebot.TeleBot("1:test", threaded=False))
+        bot = RoutedTeleBot("1:test", threaded=False)
+        self.assertEqual(self.dispatch_callbacks(bot), expected)
+        self.assertEqual(expected, [("crypto:buy:btc", "crypto buy"), ("crypto:sell:eth", "crypto"),
+            ("crypto:bad", "any"), ("fruit|x", "fruit x"), ("fruit|apple", "fruit"),
+            ("fruit|a:b", "fruit"), ("cryptocurrency", "any"), ("other:1", "any"), ("", "any")])
+        self.assertEqual(bot.callback_router.keys(), ["crypto:", "fruit|"])
+        stats = bot.callback_router.stats()
+        self.assertEqual({key: value["count"] for key, value in stats.items()},
+            {"crypto:": 3, "fruit|": 3, "<other>": 1, "<none>": 2})
+        self.assertRaises(TypeError, UpdateRouter)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+"""The module contains tests for the outgoing message rate limiter"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from bot_sender import TelegramSender, SendQueueFull, BULK, INTERACTIVE, bulk_sends
+
+class TelegramStub(BaseHTTPRequestHandler):
+    """Local Bot API: records calls, answers 429 to the first sendPhoto"""
+
+    def do_POST(self): # pylint: disable=invalid-name
+        """Record the method and answer"""
+        method = self.path.split("?")[0].rsplit("/", 1)[-1]
+        self.server.calls.append((method, time.monotonic()))
+        if method == "sendPhoto" and not self.server.limited:
+            self.server.limited = True
+            body = {"ok": False, "error_code": 429, "parameters": {"retry_after": 0.1}}
+            status = 429
+        else:
+            body = {"ok": True, "result": True}
+            status = 200
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        pass
+
+class TestTelegramSender(unittest.TestCase):
+    """Unittest TelegramSender with a local Bot API stub"""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), TelegramStub)
+        self.server.calls = []
+        self.server.limited = False
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/botTOKEN/"
+        self.sender = TelegramSender(logging.getLogger(__name__), global_rate=100,
+            chat_rate=10, chat_burst=1)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def send(self, method: str, chat_id: int):
+        """Send a request through the sender"""
+        return self.sender.send_request("post", self.url + method, params={"chat_id": chat_id})
+
+    def test_chat_rate(self):
+        """Messages to one chat are spaced by the chat rate, other chats are not delayed"""
+        started_at = time.monotonic()
+        for _ in range(3):
+            self.send("sendMessage", 1)
+        self.send("sendMessage", 2)
+        self.send("getMe", 1)
+        times = [at - started_at for _, at in self.server.calls]
+        self.assertGreaterEqual(times[2], 0.18)
+        self.assertLess(times[3] - times[2], 0.09)
+        self.assertEqual(self.sender.stats()["lanes"]["interactive"]["sent"], 4)
+
+    def test_retry_after(self):
+        """A 429 response is retried after retry_after seconds"""
+        response = self.send("sendPhoto", 1)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([method for method, _ in self.server.calls], ["sendPhoto", "sendPhoto"])
+        self.assertGreaterEqual(self.server.calls[1][1] - self.server.calls[0][1], 0.1)
+        self.assertEqual(self.sender.stats()["retried_429"], 1)
+
+    def test_interactive_before_bulk(self):
+        """When the global limit is reached interactive messages go first"""
+        sender = TelegramSender(logging.getLogger(__name__), global_rate=5, queue_size=2)
+        for chat_id in range(5):
+            sender.acquire(str(chat_id))
+            sender.release(str(chat_id))
+        granted = []
+
+        def bulk():
+            with bulk_sends():
+                sender.acquire("bulk")
+            granted.append(BULK)
+
+        threads = [threading.Thread(target=bulk)]
+        threads[0].start()
+        time.sleep(0.02)
+        threads.append(threading.Thread(target=lambda: (sender.acquire("interactive"),
+            granted.append(INTERACTIVE))))
+        threads[1].start()
+        time.sleep(0.02)
+        with self.assertRaises(SendQueueFull):
+            sender.acquire("rejected")
+        for thread in threads:
+            thread.join()
+        self.assertEqual(granted, [INTERACTIVE, BULK])
+        self.assertEqual(sender.stats()["rejected"], 1)
+
+    def test_acquire_async(self):
+        """Coroutines wait for the chat rate without threads, cancelled waits leave the queue"""
+        sender = TelegramSender(logging.getLogger(__name__), global_rate=1000, chat_rate=5,
+            chat_burst=1)
+        granted = []
+
+        async def send(chat_id: str):
+            await sender.acquire_async(chat_id)
+            granted.append((chat_id, time.monotonic()))
+            sender.release(chat_id)
+
+        async def main():
+            threads = threading.active_count()
+            busy = [asyncio.create_task(send("busy")) for _ in range(3)]
+            await asyncio.sleep(0.01)
+            self.assertEqual(threading.active_count(), threads)
+            await send("other")
+            cancelled = asyncio.create_task(send("busy"))
+            await asyncio.sleep(0.01)
+            cancelled.cancel()
+            await asyncio.gather(*busy)
+
+        started_at = time.monotonic()
+        asyncio.run(main())
+        self.assertEqual([chat_id for chat_id, _ in granted], ["busy", "other", "busy", "busy"])
+        self.assertLess(granted[1][1] - started_at, 0.1)
+        self.assertGreaterEqual(granted[3][1] - started_at, 0.35)
+        self.assertEqual((sender.pending, sender.stats()["lanes"]["interactive"]["sent"]), (0, 4))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+"""The module contains tests for the sharded mode supervisor"""
+
+import functools
+import logging
+import os
+import time
+import unittest
+from unittest import mock
+from bot_shards import ShardSupervisor
+from test_bot_dispatcher import make_update
+
+def record_updates(results, index, updates):
+    """Shard worker that reports the handled updates and exits on /crash"""
+    for update in iter(updates.get, None):
+        results.put((index, update.message.chat.id, update.update_id, os.getpid()))
+        if update.message.text == "/crash":
+            results.close()
+            results.join_thread()
+            os._exit(1) # pylint: disable=protected-access
+
+def exit_at_once(index, updates): # pylint: disable=unused-argument
+    """Shard worker that crashes on start"""
+    os._exit(1) # pylint: disable=protected-access
+
+class TestShardSupervisor(unittest.TestCase):
+    """Unittest ShardSupervisor with worker processes"""
+
+    def test_chat_affinity_and_restart(self):
+        """Updates of a chat go to one shard in order, a crashed worker is restarted"""
+        results = ShardSupervisor.context().Queue()
+        supervisor = ShardSupervisor(functools.partial(record_updates, results),
+            logging.getLogger(__name__), shards=3, queue_size=100, check_interval=0.05,
+            min_backoff=0.05)
+        supervisor.start()
+        try:
+            for i in range(30):
+                self.assertTrue(supervisor.submit(make_update(i, i % 5)))
+            handled = [results.get(timeout=30) for _ in range(30)]
+            crashed = supervisor.shard_of(make_update(30, 2))
+            supervisor.submit(make_update(30, 2, "/crash"))
+            supervisor.submit(make_update(31, 2))
+            handled += [results.get(timeout=30) for _ in range(2)]
+        finally:
+            supervisor.stop(timeout=10)
+
+        for chat_id in range(5):
+            rows = [row for row in handled if row[1] == chat_id]
+            self.assertEqual(len({row[0] for row in rows}), 1)
+            self.assertEqual([row[2] for row in rows], sorted(row[2] for row in rows))
+        self.assertEqual(len({row[0] for row in handled}), 3)
+        self.assertNotEqual(handled[-1][3], handled[-2][3])
+
+        stats = supervisor.stats()
+        self.assertEqual(sum(worker["submitted"] for worker in stats["workers"]), 32)
+        self.assertEqual([worker["restarts"] for worker in stats["workers"]],
+            [int(index == crashed) for index in range(3)])
+        self.assertFalse(any(worker["alive"] for worker in stats["workers"]))
+
+    def test_full_queue(self):
+        """Without workers the shard queue fills up and updates are rejected"""
+        supervisor = ShardSupervisor(print, logging.getLogger(__name__), shards=1, queue_size=2,
+            submit_timeout=0.1)
+        accepted = [supervisor.submit(make_update(i, 7), block=False) for i in range(3)]
+        self.assertEqual(accepted, [True, True, False])
+        started_at = time.monotonic()
+        self.assertFalse(supervisor.submit(make_update(3, 7)))
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.1)
+        self.assertEqual(supervisor.stats()["workers"][0]["rejected"], 2)
+        self.assertEqual(supervisor.pending, 2)
+
+    def test_restart_backoff(self):
+        """A worker that keeps crashing is restarted with a growing delay"""
+        supervisor = ShardSupervisor(exit_at_once, logging.getLogger(__name__), shards=1,
+            check_interval=0.02, min_backoff=0.1, max_backoff=5.0)
+        supervisor.start()
+        time.sleep(2)
+        supervisor.stop(timeout=1)
+        worker = supervisor.stats()["workers"][0]
+        self.assertGreater(worker["backoff"], 0.1)
+        self.assertTrue(1 <= worker["restarts"] < 5, worker["restarts"])
+
+    def test_local_paths(self):
+        """Workers get their own files, unset paths stay unset"""
+        with mock.patch.dict(os.environ, {"DB_SPOOL_PATH": "/data/spool.bin",
+        "FILE_ID_CACHE_PATH": ""}):
+            ShardSupervisor.use_local_paths(2, ["DB_SPOOL_PATH", "FILE_ID_CACHE_PATH"])
+            self.assertEqual(os.environ["DB_SPOOL_PATH"], "/data/spool.bin.shard2")
+            self.assertEqual(os.environ["FILE_ID_CACHE_PATH"], "")
+
+    def test_divide_rates(self):
+        """Workers get an equal part of the rate, unset rates a part of the default"""
+        with mock.patch.dict(os.environ, {"SEND_GLOBAL_RATE": "30", "OTHER_RATE": ""}):
+            ShardSupervisor.divide_rates(4, {"SEND_GLOBAL_RATE": 10.0, "OTHER_RATE": 2.0})
+            self.assertEqual(float(os.environ["SEND_GLOBAL_RATE"]), 7.5)
+            self.assertEqual(float(os.environ["OTHER_RATE"]), 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+"""The module contains tests for the storage of next step handlers"""
+
+import json
+import os
+import pickle
+import tempfile
+import time
+import unittest
+import telebot
+from sqlalchemy import Engine, create_engine, event, insert
+from telebot import Handler, types
+from bot_step_store import StepHandlerStore, step_handlers_table
+
+def _message(message_id, text, chat_id=7):
+    return types.Message.de_json({"message_id": message_id, "date": 0, "text": text,
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": "Test"}})
+
+class Dialog: # pylint: disable=too-few-public-methods
+    """Owner of a next step handler"""
+
+    def __init__(self):
+        self.answers = []
+
+    def __process_answer(self, message, prefix):
+        self.answers.append(prefix + message.text)
+
+    def ask(self, bot: telebot.TeleBot, message, prefix=""):
+        """Wait for the next message of the chat"""
+        bot.register_next_step_handler(message, self.__process_answer, prefix)
+
+class TestStepHandlerStore(unittest.TestCase):
+    """Unittest StepHandlerStore"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.database = "sqlite:///" + os.path.join(self.temp_dir.name, "steps.db")
+        self.stores = []
+
+    def tearDown(self):
+        for store in self.stores:
+            store.close()
+        self.temp_dir.cleanup()
+
+    def store(self, **kwargs) -> StepHandlerStore:
+        """Create a store closed after the test"""
+        store = StepHandlerStore(**kwargs)
+        self.stores.append(store)
+        return store
+
+    def test_ttl_and_size(self):
+        """Abandoned dialogs expire and the oldest chats are evicted over the limit"""
+        store = self.store(ttl=0.05, max_size=2)
+        for chat_id in (1, 2, 3):
+            store.register_handler(chat_id, Handler(print))
+        self.assertEqual(store.get_handlers(1), None)
+        self.assertEqual(len(store.get_handlers(2)), 1)
+        time.sleep(0.1)
+        store.sweep()
+        self.assertEqual(store.stats()["size"], 0)
+        self.assertEqual(store.get_handlers(3), None)
+        stats = store.stats()
+        self.assertEqual((stats["registered"], stats["evicted"], stats["expired"]), (3, 1, 1))
+
+    def test_dialog(self):
+        """The bot passes the next message of the chat to the handler once"""
+        store = self.store()
+        bot = telebot.TeleBot("1:test", threaded=False, next_step_backend=store)
+        dialog = Dialog()
+        dialog.ask(bot, _message(1, "/ask"))
+        bot.process_new_messages([_message(2, "yes"), _message(3, "again")])
+        self.assertEqual(dialog.answers, ["yes"])
+
+    def test_database(self):
+        """Handlers of methods are shared through the database, closures stay in memory"""
+        dialog = Dialog()
+        owners = {(Dialog.__module__, "Dialog"): dialog}
+        first = self.store(connection_string=self.database)
+        bot = telebot.TeleBot("1:test", threaded=False, next_step_backend=first)
+        dialog.ask(bot, _message(1, "/ask"), "> ")
+        bot.register_next_step_handler(_message(2, "/ask", chat_id=8),
+            lambda message: dialog.answers.append("closure"))
+        self.assertEqual(first.stats()["size"], 1)
+
+        second = self.store(connection_string=self.database,
+            resolver=lambda module, qualname: owners.get((module, qualname)))
+        bot = telebot.TeleBot("1:test", threaded=False, next_step_backend=second)
+        bot.process_new_messages([_message(3, "restored")])
+        self.assertEqual(dialog.answers, ["> restored"])
+        self.assertEqual(first.get_handlers(7), None)
+        self.assertEqual(second.get_handlers(8), None)
+        self.assertEqual(len(first.get_handlers(8)), 1)
+        stats = second.stats()
+        self.assertEqual((stats["restored"], stats["saved_size"]), (1, 0))
+
+    def test_database_only_for_saved_chats(self):
+        """Messages of chats without saved handlers do not query the database"""
+        dialog = Dialog()
+        first = self.store(connection_string=self.database)
+        dialog.ask(telebot.TeleBot("1:test", threaded=False, next_step_backend=first),
+            _message(1, "/ask"))
+        second = self.store(connection_string=self.database,
+            resolver=lambda module, qualname: dialog)
+        statements = []
+
+        def record(*args):
+            if "step_handlers" in args[2]:
+                statements.append(args[2])
+        event.listen(Engine, "before_cursor_execute", record)
+        self.addCleanup(event.remove, Engine, "before_cursor_execute", record)
+        for chat_id in range(100, 110):
+            self.assertIsNone(second.get_handlers(chat_id))
+        self.assertEqual(statements, [])
+        self.assertEqual(len(second.get_handlers(7)), 1)
+        self.assertEqual(len(statements), 1)
+        self.assertIsNone(second.get_handlers(7))
+        self.assertEqual(len(statements), 1)
+
+    def test_json_records(self):
+        """Saved handlers need JSON arguments, only methods of the owner class are restored"""
+        dialog = Dialog()
+        store = self.store(connection_string=self.database)
+        bot = telebot.TeleBot("1:test", threaded=False, next_step_backend=store)
+        with self.assertRaises(TypeError):
+            dialog.ask(bot, _message(1, "/ask"), object())
+        bot.register_next_step_handler(_message(2, "/ask"), lambda message, arg: None, object())
+        self.assertEqual(store.stats()["size"], 1)
+
+        records = [
+            pickle.dumps([(Dialog.__module__, "Dialog", "_Dialog__process_answer", (), {})]),
+            json.dumps([{"module": "os", "qualname": "system", "attribute": "__call__",
+                "args": ["true"], "kwargs": {}}]).encode(),
+            json.dumps([{"module": Dialog.__module__, "qualname": "Dialog",
+                "attribute": "__init__", "args": [], "kwargs": {}}]).encode(),
+            json.dumps([{"module": Dialog.__module__, "qualname": "Dialog",
+                "attribute": "answers", "args": [], "kwargs": {}}]).encode(),
+        ]
+        engine = create_engine(self.database)
+        with engine.begin() as connection:
+            connection.execute(insert(step_handlers_table), [{"chat_id": 100 + i,
+                "expires_at": time.time() + 60, "handlers": data}
+                for i, data in enumerate(records)])
+        engine.dispose()
+        restored = self.store(connection_string=self.database, resolver=lambda *_: dialog)
+        for i in range(len(records)):
+            self.assertIsNone(restored.get_handlers(100 + i))
+        self.assertEqual((restored.stats()["restored"], restored.stats()["lost"]), (0, 4))
+
+
+if __name__ == '__main__':
+    unittest.main()
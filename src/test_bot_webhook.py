@@ -0,0 +1,72 @@
+"""The module contains tests for the webhook server"""
+
+import json
+import logging
+import queue
+import unittest
+import urllib.error
+import urllib.request
+from bot_dispatcher import UpdateDispatcher
+from bot_webhook import WebhookServer
+
+RECORDED_UPDATE = {
+    "update_id": 100,
+    "message": {
+        "message_id": 1,
+        "date": 1700000000,
+        "text": "/start",
+        "chat": {"id": 42, "type": "private", "username": "test"},
+        "from": {"id": 42, "is_bot": False, "first_name": "test", "username": "test"},
+        "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+    },
+}
+
+class TestWebhookServer(unittest.TestCase):
+    """Unittest webhook server"""
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.received = queue.Queue()
+        self.dispatcher = UpdateDispatcher(self.__handler, self.logger, workers=1, queue_size=1)
+        self.server = WebhookServer(self.dispatcher, self.logger, ("127.0.0.1", 0), "/hook")
+        self.server.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+
+    def __handler(self, update):
+        self.received.put(update)
+
+    def __post(self, body: bytes, path: str = "/hook") -> int:
+        host, port = self.server.server_address
+        request = urllib.request.Request(f"http://{host}:{port}{path}", data=body,
+            headers={"Content-Type": "application/json"}, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                return response.status
+        except urllib.error.HTTPError as err:
+            return err.code
+
+    def test_update_dispatched(self):
+        """A posted update reaches the handler"""
+        self.dispatcher.start()
+        status = self.__post(json.dumps(RECORDED_UPDATE).encode())
+        self.assertEqual(status, 200)
+        update = self.received.get(timeout=5)
+        self.assertEqual(update.message.text, "/start")
+        self.dispatcher.stop(timeout=5)
+
+    def test_queue_full(self):
+        """Server responds 429 when the dispatcher queue is full"""
+        body = json.dumps(RECORDED_UPDATE).encode()
+        self.assertEqual(self.__post(body), 200)
+        self.assertEqual(self.__post(body), 429)
+
+    def test_bad_request(self):
+        """Malformed body and unknown path are rejected"""
+        self.assertEqual(self.__post(b"{not json"), 400)
+        self.assertEqual(self.__post(b"{}", path="/other"), 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,295 @@
+"""The module contains tests for the message log database layer"""
+
+import csv
+import gzip
+import logging
+import struct
+import tempfile
+import time
+import unittest
+from unittest import mock
+from datetime import datetime, timedelta
+from pathlib import Path
+from sqlalchemy.exc import OperationalError
+from bot_circuit_breaker import CircuitBreaker
+from db.storage_worker import StorageWorker
+from db.message_record import MessageRecord
+from db.message_writer import MessageLogWriter
+from db.message_partitions import MessagePartitions
+from db.message_spool import MessageSpool
+from db.message_export import MessageExporter
+
+def make_record(user_id: int, chat_id: int, text: str) -> MessageRecord:
+    """Build a message log record"""
+    user = {
+        "id": user_id, "username": f"user{user_id}", "first_name": "first",
+        "last_name": "last", "full_name": "first last", "language_code": "ru",
+        "is_bot": False,
+    }
+    chat = {"id": chat_id, "bio": None, "description": f"private - user{user_id}"}
+    return MessageRecord(user=user, chat=chat, text=text, call_data=None)
+
+class TestMessageLog(unittest.TestCase):
+    """Unittest message log persistence on SQLite"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.storage_worker = StorageWorker(f"sqlite:///{Path(self.tmp_dir.name) / 'log.db'}")
+        self.logger = logging.getLogger(__name__)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_save_records(self):
+        """A batch with repeated users and chats is saved in one call"""
+        records = [make_record(i % 3, 100 + i % 2, str(i)) for i in range(10)]
+        self.storage_worker.save_records(records)
+        self.storage_worker.save_records(records[:2])
+        self.assertEqual(len(self.storage_worker.get_messages()), 12)
+        self.assertEqual(self.storage_worker.get_user(2).username, "user2")
+        self.assertIsNotNone(self.storage_worker.get_chat(101))
+        self.assertGreater(self.storage_worker.pool_stats()["checkout_wait"]["count"], 0)
+
+    def test_message_pages(self):
+        """Keyset pages cover the user's messages once and in order"""
+        records = [make_record(i % 2, 1, str(i)) for i in range(25)]
+        for i, record in enumerate(records):
+            record.date_time = datetime(2024, 1, 1) + timedelta(minutes=i // 2)
+        self.storage_worker.save_records(records)
+        texts = [msg.text for msg in self.storage_worker.iter_messages(user_id=1, page_size=4)]
+        self.assertEqual(texts, [str(i) for i in range(1, 25, 2)])
+
+        first = self.storage_worker.get_messages_page(chat_id=1, limit=10)
+        after = (first[-1].date_time, first[-1].id)
+        second = self.storage_worker.get_messages_page(chat_id=1, after=after, limit=10)
+        self.assertEqual(len(first) + len(second), 20)
+        self.assertFalse({m.id for m in first} & {m.id for m in second})
+
+        since = datetime(2024, 1, 1, 0, 10)
+        recent = self.storage_worker.get_messages_page(since=since)
+        self.assertEqual([msg.text for msg in recent], [str(i) for i in range(20, 25)])
+
+    def test_retention_and_compaction(self):
+        """Old messages are removed and repeated button presses are compacted"""
+        records = []
+        for i in range(6):
+            record = make_record(1, 1, "button")
+            record.call_data = "user1 --> crypto:info:1"
+            record.date_time = datetime(2024, 1, 10, 12, 0, i)
+            records.append(record)
+        records.append(make_record(1, 1, "old"))
+        records[-1].date_time = datetime(2023, 1, 1)
+        self.storage_worker.save_records(records)
+
+        partitions = MessagePartitions(self.storage_worker.engine, self.logger)
+        self.assertEqual(partitions.apply_retention(6, now=datetime(2024, 2, 1)), 1)
+        deleted = partitions.compact_callbacks(datetime(2024, 2, 1), timedelta(seconds=2),
+            batch_size=2)
+        self.assertEqual(deleted, 4)
+        self.assertEqual(len(self.storage_worker.get_messages()), 2)
+
+    def test_partitions_move_default_rows(self):
+        """A missing month is filled from the DEFAULT partition before it is attached"""
+        existing = {"messages_default", "messages_2024_01"}
+        statements = []
+
+        def execute(statement, params=None):
+            statements.append(str(statement))
+            result = mock.Mock(rowcount=3)
+            result.scalar.return_value = params["name"] in existing if params else None
+            return result
+
+        engine = mock.MagicMock()
+        connection = engine.begin.return_value.__enter__.return_value
+        connection.execute.side_effect = execute
+        partitions = MessagePartitions(engine, self.logger)
+        with mock.patch.object(MessagePartitions, "is_partitioned", return_value=True):
+            partitions.ensure_partitions(1, now=datetime(2024, 1, 15))
+        ddl = [sql for sql in statements if "to_regclass" not in sql]
+        self.assertEqual(len(ddl), 4)
+        self.assertTrue(ddl[0].startswith("LOCK TABLE messages_default"))
+        self.assertTrue(ddl[1].startswith("CREATE TABLE messages_2024_02 (LIKE messages"))
+        self.assertIn("DELETE FROM messages_default WHERE date_time >= '2024-02-01' "
+            "AND date_time < '2024-03-01'", ddl[2])
+        self.assertIn("INSERT INTO messages_2024_02", ddl[2])
+        self.assertEqual(ddl[3], "ALTER TABLE messages ATTACH PARTITION messages_2024_02 "
+            "FOR VALUES FROM ('2024-02-01') TO ('2024-03-01')")
+        self.assertEqual(engine.begin.call_count, 1)
+
+    def test_identity_cache(self):
+        """Known identities hit the cache, changed profiles are written back"""
+        self.storage_worker.save_records([make_record(1, 1, "a")])
+        self.storage_worker.save_records([make_record(1, 1, "b")])
+        self.assertEqual(self.storage_worker.user_cache.hits, 1)
+        self.assertEqual(self.storage_worker.user_cache.misses, 1)
+
+        renamed = make_record(1, 1, "c")
+        renamed.user["username"] = "renamed"
+        self.storage_worker.save_records([renamed])
+        self.assertEqual(self.storage_worker.get_user(1).username, "renamed")
+
+    def test_upsert_record(self):
+        """Concurrent-safe upsert stores the user, chat and message together"""
+        self.storage_worker.upsert_record(make_record(5, 50, "first"))
+        self.storage_worker.user_cache.invalidate(5)
+        self.storage_worker.upsert_record(make_record(5, 50, "second"))
+        self.assertEqual(len(self.storage_worker.get_messages()), 2)
+        self.assertEqual(self.storage_worker.get_chat(50).description, "private - user5")
+
+    def test_writer_flush_on_close(self):
+        """Queued records are flushed when the writer is closed"""
+        writer = MessageLogWriter(self.storage_worker, self.logger,
+            batch_size=7, flush_interval=60)
+        for i in range(20):
+            writer.write(make_record(1, 1, str(i)))
+        writer.close(timeout=10)
+        self.assertEqual(writer.saved, 20)
+        self.assertEqual(len(self.storage_worker.get_messages()), 20)
+
+    def test_writer_spool_while_db_down(self):
+        """Batches are spooled while the database is down and replayed after it is back"""
+        save_records = self.storage_worker.save_records
+        database_down = [True]
+
+        def flaky_save(records):
+            if database_down[0]:
+                raise OperationalError("INSERT", {}, Exception("connection refused"))
+            save_records(records)
+
+        spool = MessageSpool(str(Path(self.tmp_dir.name) / "spool.bin"))
+        with mock.patch.object(self.storage_worker, "save_records", side_effect=flaky_save):
+            writer = MessageLogWriter(self.storage_worker, self.logger,
+                batch_size=5, flush_interval=0.05, spool=spool,
+                breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.05))
+            for i in range(12):
+                writer.write(make_record(1, 1, str(i)))
+            self.wait_for(lambda: writer.spooled == 12)
+            self.assertNotEqual(writer.breaker.state, CircuitBreaker.CLOSED)
+            database_down[0] = False
+            self.wait_for(lambda: writer.replayed == 12)
+            writer.write(make_record(1, 1, "live"))
+            writer.close(timeout=10)
+        texts = {msg.text for msg in self.storage_worker.get_messages()}
+        self.assertEqual(texts, {str(i) for i in range(12)} | {"live"})
+        self.assertEqual(writer.dropped, 0)
+        self.assertFalse(spool.has_records())
+
+    def test_spool_resume(self):
+        """Replay continues after the last committed batch and skips a torn record"""
+        path = Path(self.tmp_dir.name) / "spool.bin"
+        MessageSpool(str(path)).append([make_record(1, 1, str(i)) for i in range(5)])
+        with open(path, "ab") as file:
+            file.write(b"\x00\x00\x01\x00{")
+        spool = MessageSpool(str(path))
+        self.assertEqual([r.text for r in spool.read_batch(3)], ["0", "1", "2"])
+        spool.commit()
+        restarted = MessageSpool(str(path))
+        self.assertEqual([r.text for r in restarted.read_batch(3)], ["3", "4"])
+        restarted.commit()
+        self.assertEqual(restarted.read_batch(3), [])
+        self.assertFalse(restarted.has_records())
+
+    def test_spool_torn_tail(self):
+        """Records appended after a crash are not read as a part of the torn record"""
+        path = Path(self.tmp_dir.name) / "spool.bin"
+        MessageSpool(str(path)).append([make_record(1, 1, "0")])
+        with open(path, "ab") as file:
+            file.write(b"\x00\x00\x00\x40{\"user\": {\"id")
+        MessageSpool(str(path)).append([make_record(1, 1, "1"), make_record(1, 1, "2")])
+        spool = MessageSpool(str(path))
+        self.assertEqual([r.text for r in spool.read_batch(10)], ["0", "1", "2"])
+
+    def test_writer_damaged_spool(self):
+        """A spool file that can not be parsed is moved aside and the writer keeps saving"""
+        path = Path(self.tmp_dir.name) / "spool.bin"
+        with open(path, "wb") as file:
+            file.write(b"\x00\x00\x00\x03\x01\x02\x03")
+        writer = MessageLogWriter(self.storage_worker, self.logger,
+            batch_size=5, flush_interval=0.05, spool=MessageSpool(str(path)))
+        writer.write(make_record(1, 1, "first"))
+        self.wait_for(lambda: writer.saved == 1)
+        writer.write(make_record(1, 1, "second"))
+        writer.close(timeout=10)
+        self.assertEqual({msg.text for msg in self.storage_worker.get_messages()},
+            {"first", "second"})
+        self.assertEqual(len(list(Path(self.tmp_dir.name).glob("spool.bin.bad-*"))), 1)
+        self.assertFalse(MessageSpool(str(path)).has_records())
+
+    def test_writer_malformed_spool_record(self):
+        """A spooled record of an unknown format is moved aside, the others are replayed"""
+        path = Path(self.tmp_dir.name) / "spool.bin"
+        spool = MessageSpool(str(path))
+        spool.append([make_record(1, 1, "before")])
+        with open(path, "ab") as file:
+            for data in (b'{"user": {"id": 1}}', b'[1, 2]', b'{"date_time": "yesterday"}'):
+                file.write(struct.pack(">I", len(data)) + data)
+        spool.append([make_record(1, 1, "after")])
+        writer = MessageLogWriter(self.storage_worker, self.logger,
+            batch_size=5, flush_interval=0.05, spool=MessageSpool(str(path)))
+        writer.write(make_record(1, 1, "live"))
+        self.wait_for(lambda: writer.replayed == 2)
+        writer.close(timeout=10)
+        self.assertEqual({msg.text for msg in self.storage_worker.get_messages()},
+            {"before", "after", "live"})
+        self.assertEqual(writer.spool.rejected, 3)
+        self.assertEqual(len((Path(self.tmp_dir.name) / "spool.bin.rejected").read_bytes()),
+            3 * 4 + 19 + 6 + 26)
+        self.assertFalse(MessageSpool(str(path)).has_records())
+
+    def test_export_csv(self):
+        """Export is chunked, filtered by time and continues from the last exported id.
+        A time window does not move the saved id"""
+        records = [make_record(i % 2, 1, str(i)) for i in range(7)]
+        for i, record in enumerate(records):
+            record.date_time = datetime(2024, 1, 1 + i)
+        self.storage_worker.save_records(records)
+        target_dir = Path(self.tmp_dir.name) / "export"
+        exporter = MessageExporter(self.storage_worker.engine, self.logger, str(target_dir),
+            "csv", chunk_size=2)
+        result = exporter.export(since=datetime(2024, 1, 3))
+        self.assertEqual(result, {"users": 2, "chats": 1, "messages": 5})
+        with gzip.open(next(target_dir.glob("messages_*.csv.gz")), "rt", encoding="utf-8") as file:
+            rows = list(csv.DictReader(file))
+        self.assertEqual([row["text"] for row in rows], ["2", "3", "4", "5", "6"])
+        self.assertEqual(exporter.load_state(), {})
+
+        self.storage_worker.save_records([make_record(3, 1, "new")])
+        self.assertEqual(exporter.export()["messages"], 8)
+        self.assertEqual(exporter.load_state(), {"messages": 8})
+        self.assertEqual(exporter.export(until=datetime(2024, 1, 2))["messages"], 1)
+        self.assertEqual(exporter.load_state(), {"messages": 8})
+        self.storage_worker.save_records([make_record(4, 1, "newer")])
+        result = exporter.export()
+        self.assertEqual(result, {"users": 4, "chats": 1, "messages": 1})
+        self.assertEqual(exporter.load_state(), {"messages": 9})
+        self.assertEqual(len(list(target_dir.glob("messages_*.csv.gz"))), 4)
+        self.assertEqual(list(target_dir.glob("*.tmp")), [])
+        self.assertTrue(all(path.name.endswith("_full.csv.gz")
+            for path in target_dir.glob("users_*")))
+
+    def test_export_new_group_chat(self):
+        """Chats and users with lower Telegram ids added after an export are exported next time"""
+        self.storage_worker.save_records([make_record(5, 5, "private")])
+        target_dir = Path(self.tmp_dir.name) / "export"
+        exporter = MessageExporter(self.storage_worker.engine, self.logger, str(target_dir),
+            "csv", chunk_size=2)
+        self.assertEqual(exporter.export(), {"users": 1, "chats": 1, "messages": 1})
+        self.storage_worker.save_records([make_record(2, -1001234567890, "group")])
+        self.assertEqual(exporter.export(), {"users": 2, "chats": 2, "messages": 1})
+        latest = max(target_dir.glob("chats_*.csv.gz"))
+        with gzip.open(latest, "rt", encoding="utf-8") as file:
+            self.assertEqual([row["id"] for row in csv.DictReader(file)],
+                ["-1001234567890", "5"])
+
+    @staticmethod
+    def wait_for(condition, timeout: float = 10):
+        """Poll the condition until it is true"""
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                raise AssertionError("Condition was not met in time")
+            time.sleep(0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+"""The module contains tests for lazy loading of atomic functions from a manifest"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import unittest
+from typing import List
+from unittest import mock
+from telebot import types
+from bot_async_func_abc import AsyncAtomicBotFunctionABC
+from bot_func_abc import AtomicBotFunctionABC
+from bot_callback_filter import BotCallbackCustomFilter
+from bot_router import RoutedTeleBot
+from functions.defoult_bot_function import DefoultBotFunction
+from load_atomic import LazyAtomicFunction, load_atomic_functions, load_report, write_manifest
+from load_atomic import disable_duplicate_commands
+
+def _update(update_id, text=None, callback_data=None):
+    chat = {"id": 7, "type": "private"}
+    user = {"id": 7, "is_bot": False, "first_name": "Test"}
+    message = {"message_id": update_id, "date": 0, "chat": chat, "from": user}
+    if callback_data is None:
+        entities = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return types.Update.de_json({"update_id": update_id,
+            "message": {**message, "text": text, "entities": entities}})
+    return types.Update.de_json({"update_id": update_id, "callback_query": {
+        "id": str(update_id), "from": user, "chat_instance": "1", "data": callback_data,
+        "message": {**message, "text": "keyboard"}}})
+
+class TestLoadAtomic(unittest.TestCase):
+    """Unittest manifest based loading"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.manifest = os.path.join(self.temp_dir.name, "manifest.json")
+        write_manifest(self.manifest)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_manifest(self):
+        """The proxies describe the same functions, async functions are loaded at once,
+        a stale manifest is ignored"""
+        eager = load_atomic_functions()
+        lazy = load_atomic_functions(manifest=self.manifest)
+        self.assertTrue(all(isinstance(funct, (LazyAtomicFunction, AsyncAtomicBotFunctionABC))
+            for funct in lazy))
+        self.assertIn("AtomicNasaApodFunction", [type(funct).__name__ for funct in lazy])
+        self.assertEqual([(f.commands, f.about, f.state) for f in lazy],
+            [(f.commands, f.about, f.state) for f in eager])
+        self.assertIn("example_bot_function", [row["module"] for row in load_report()])
+
+        with open(self.manifest, encoding="utf-8") as file:
+            data = json.load(file)
+        data["sources"]["example_bot_function.py"] = "changed"
+        with open(self.manifest, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        self.assertFalse(any(isinstance(funct, LazyAtomicFunction)
+            for funct in load_atomic_functions(manifest=self.manifest)))
+
+    def test_lazy_handlers(self):
+        """The first command loads the function and is handled by it, handlers keep their order"""
+        bot = RoutedTeleBot("1:test", threaded=False)
+        bot.add_custom_filter(BotCallbackCustomFilter())
+        sent = []
+        bot.send_message = lambda *args, **kwargs: sent.append(kwargs.get("text", args[-1:]))
+        bot.answer_callback_query = lambda call_id, text: sent.append(text)
+        functions = load_atomic_functions(manifest=self.manifest)
+        example = next(f for f in functions if "example" in f.commands)
+        for funct in functions:
+            funct.set_handlers(bot)
+        DefoultBotFunction(["start"], functions).set_handlers(bot)
+        bot.reply_to = lambda message, text: sent.append(text)
+
+        self.assertFalse(example.loaded)
+        bot.process_new_updates([_update(1, "/example")])
+        self.assertTrue(example.loaded)
+        self.assertEqual(type(example.function).__name__, "AtomicExampleBotFunction")
+        bot.process_new_updates([_update(2, "/ebf"),
+            _update(3, callback_data="example:cb_yes")])
+        self.assertEqual(len(sent), 3)
+        self.assertIn("AtomicExampleBotFunction", sent[0])
+        self.assertIn("AtomicExampleBotFunction", sent[1])
+        self.assertEqual(sent[2], "Ответ ДА!")
+
+    def test_parallel_loading(self):
+        """Functions loaded at the same time take only their own handlers"""
+        class Slow(AtomicBotFunctionABC):
+            """Registers its handler after a pause, while the other one is loading"""
+            commands: List[str] = []
+            authors: List[str] = ["test"]
+            about: str = "Slow"
+            description: str = "Slow"
+            state: bool = True
+
+            def set_handlers(self, bot):
+                time.sleep(0.1)
+                name = self.commands[0]
+                bot.message_handler(commands=self.commands)(
+                    lambda message: f"real_{name}")
+
+        def load_module(_func_dir, _atomic_dir, module_name, _class_name=None):
+            funct = Slow()
+            funct.commands = [module_name]
+            return [("Slow", funct)]
+
+        bot = RoutedTeleBot("1:test", threaded=False)
+        proxies = [LazyAtomicFunction({"module": name, "class": "Slow", "commands": [name],
+            "authors": ["test"], "about": "", "description": "", "state": True})
+            for name in ("aaa", "bbb")]
+        for proxy in proxies:
+            proxy.set_handlers(bot)
+        with mock.patch("load_atomic._load_module", side_effect=load_module):
+            threads = [threading.Thread(target=proxy.ensure_loaded, args=(bot,))
+                for proxy in proxies]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual([handler["function"].__name__ if handler["function"].__name__
+            == "load_on_message" else handler["function"](None)
+            for handler in bot.message_handlers],
+            ["load_on_message", "real_aaa", "load_on_message", "real_bbb"])
+        self.assertEqual([proxy.load(bot, "message_handlers", _update(i, f"/{name}").message)
+            for i, (proxy, name) in enumerate(zip(proxies, ("aaa", "bbb")))],
+            ["real_aaa", "real_bbb"])
+
+    def test_duplicate_commands(self):
+        """A function using a command of the start function or of an earlier one is turned off"""
+        functions = load_atomic_functions(manifest=self.manifest)
+        first, second, third = functions[:3]
+        second.commands = second.commands + [first.commands[-1]]
+        third.commands = ["start"]
+        with self.assertLogs("test", logging.ERROR):
+            duplicates = disable_duplicate_commands(functions, ["start"], logging.getLogger("test"))
+        self.assertEqual(duplicates, {first.commands[-1]: str(first), "start": "start commands"})
+        self.assertEqual([f.state for f in functions[:3]], [first.state, False, False])
+
+
+if __name__ == '__main__':
+    unittest.main()